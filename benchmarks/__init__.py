@@ -0,0 +1,40 @@
+"""
+Замеры производительности. Запускаются из корня
+проекта как модули, например::
+
+    python -m benchmarks.indexes --help
+
+Замеры, которым нужны данные, создают синтетический
+дневник в настроенной БД внутри транзакции, которая
+в конце откатывается.
+"""
+import os
+import statistics
+from typing import (
+    Callable,
+    List,
+)
+
+import django
+
+
+def setup_django() -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+    django.setup()
+
+
+def measure(func: Callable[[], object], repeat: int) -> str:
+    from core.helpers import (
+        track_time,
+    )
+
+    elapsed_times: List[float] = []
+    for _ in range(repeat):
+        with track_time() as tracker:
+            func()
+        elapsed_times.append(tracker.elapsed_time * 1000)
+
+    return 'min {:.3f}ms, median {:.3f}ms'.format(
+        min(elapsed_times),
+        statistics.median(elapsed_times),
+    )
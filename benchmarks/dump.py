@@ -0,0 +1,143 @@
+"""
+Выгрузка базы: прежний способ (`dumpdata` в
+`gzip.open(..., 'wt')` с уровнем сжатия 9) против
+потоковой выгрузки `gzip_dumpdata`::
+
+    python -m benchmarks.dump --records 100000
+
+Печатает время, размер файла и пик Python-памяти по
+`tracemalloc` (отдельным прогоном, так как он замедляет
+код). В конце -- инкрементальная выгрузка после изменения
+`--changes` записей.
+"""
+import argparse
+import gzip
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import (
+    Callable,
+    Tuple,
+)
+
+from benchmarks import (
+    setup_django,
+)
+
+
+def measure_dump(dump: Callable[[], None]) -> Tuple[float, int]:
+    started = time.perf_counter()
+    dump()
+    elapsed_time = time.perf_counter() - started
+
+    tracemalloc.start()
+    dump()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed_time, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--changes', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.management import (
+        call_command,
+    )
+    from django.core.management.commands.dumpdata import (
+        Command as DumpDataCommand,
+    )
+    from django.db import (
+        transaction,
+    )
+
+    from benchmarks.synthetic import (
+        create_synthetic_diary,
+    )
+    from core.changelog import (
+        clear_changes,
+    )
+    from core.dumps import (
+        COMPRESSIONS,
+    )
+    from sugar.models import (
+        Record,
+    )
+
+    with transaction.atomic(), tempfile.TemporaryDirectory() as directory:
+        print(f'Creating {args.records} records...')
+        create_synthetic_diary(args.users, args.records)
+
+        def dump_with_dumpdata() -> None:
+            path = os.path.join(directory, 'dumpdata.json.gz')
+            with gzip.open(path, 'wt') as output_stream:
+                call_command(
+                    DumpDataCommand(stdout=output_stream),
+                    format='json',
+                )
+
+        variants = [
+            ('dumpdata, gzip 9', 'dumpdata.json.gz', dump_with_dumpdata),
+        ]
+        for compression in sorted(COMPRESSIONS):
+            filename = f'dump-{compression}.jsonl'
+
+            def dump_with_exporter(
+                    compression: str = compression,
+                    filename: str = filename,
+            ) -> None:
+                call_command(
+                    'gzip_dumpdata',
+                    filename=os.path.join(directory, filename),
+                    compression=compression,
+                    verbosity=0,
+                )
+
+            variants.append((
+                f'gzip_dumpdata, {compression}',
+                filename,
+                dump_with_exporter,
+            ))
+
+        for title, filename, dump in variants:
+            elapsed_time, peak = measure_dump(dump)
+            size = os.path.getsize(os.path.join(directory, filename))
+            print(
+                f'{title:<22}: {elapsed_time:.2f}s, '
+                f'{size / 2 ** 20:.2f}MiB, '
+                f'peak {peak / 2 ** 20:.1f}MiB',
+            )
+
+        # изменения после полной выгрузки
+        clear_changes()
+        for record in Record.objects.order_by('?')[:args.changes]:
+            record.save()
+        started = time.perf_counter()
+        call_command(
+            'gzip_dumpdata',
+            filename=os.path.join(directory, 'delta.jsonl.gz'),
+            incremental=True,
+            verbosity=0,
+        )
+        elapsed_time = time.perf_counter() - started
+        size = os.path.getsize(os.path.join(directory, 'delta.jsonl.gz'))
+        print(
+            f'{"incremental, gzip":<22}: {elapsed_time:.2f}s, '
+            f'{size / 2 ** 10:.2f}KiB ({args.changes} changed records)',
+        )
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Скачивание выгрузки (`core.views.download_json_dump`):
+прежний способ (файл выгрузки целиком читается в
+`HttpResponse`) против потоковой отдачи::
+
+    python -m benchmarks.dump_view --records 100000
+
+Печатает время до первого байта ответа, полное время и
+пик Python-памяти по `tracemalloc` (отдельным прогоном).
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import (
+    Callable,
+    Iterable,
+    Tuple,
+)
+
+from benchmarks import (
+    setup_django,
+)
+
+
+def consume(
+        get_chunks: Callable[[], Iterable[bytes]],
+) -> Tuple[float, float, int]:
+    started = time.perf_counter()
+    first_byte_time = None
+    size = 0
+    for chunk in get_chunks():
+        if first_byte_time is None:
+            first_byte_time = time.perf_counter() - started
+        size += len(chunk)
+    return first_byte_time or 0., time.perf_counter() - started, size
+
+
+def measure(
+        get_chunks: Callable[[], Iterable[bytes]],
+) -> Tuple[float, float, int, int]:
+    first_byte_time, elapsed_time, size = consume(get_chunks)
+
+    tracemalloc.start()
+    consume(get_chunks)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return first_byte_time, elapsed_time, size, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import (
+        settings,
+    )
+    from django.contrib.auth.models import (
+        User,
+    )
+    from django.core.management import (
+        call_command,
+    )
+    from django.db import (
+        transaction,
+    )
+    from django.http import (
+        HttpResponse,
+    )
+    from django.test import (
+        RequestFactory,
+    )
+
+    from benchmarks.synthetic import (
+        create_synthetic_diary,
+    )
+    from core.views import (
+        download_json_dump,
+    )
+
+    with transaction.atomic(), tempfile.TemporaryDirectory() as directory:
+        settings.MEDIA_ROOT = directory
+        print(f'Creating {args.records} records...')
+        create_synthetic_diary(args.users, args.records)
+        superuser = User.objects.create(
+            username='benchmark-admin',
+            is_superuser=True,
+        )
+
+        def get_buffered_chunks() -> Iterable[bytes]:
+            path = os.path.join(directory, 'dump.jsonl.gz')
+            call_command('gzip_dumpdata', filename=path, verbosity=0)
+            with open(path, 'rb') as dump_file:
+                response = HttpResponse(
+                    content=dump_file.read(),
+                    content_type='application/gzip',
+                )
+            yield response.content
+
+        def get_view_chunks(**params: str) -> Iterable[bytes]:
+            request = RequestFactory().get('/core/dump', params)
+            request.user = superuser
+            return download_json_dump(request)
+
+        variants = [
+            ('file, HttpResponse', get_buffered_chunks),
+            ('streaming', get_view_chunks),
+        ]
+        for title, get_chunks in variants:
+            first_byte_time, elapsed_time, size, peak = measure(get_chunks)
+            print(
+                f'{title:<20}: first byte {first_byte_time:.2f}s, '
+                f'total {elapsed_time:.2f}s, '
+                f'{size / 2 ** 20:.2f}MiB, '
+                f'peak {peak / 2 ** 20:.1f}MiB',
+            )
+
+        settings.JSON_DUMP_CACHE_TIMEOUT = 60
+        consume(get_view_chunks)
+        first_byte_time, elapsed_time, _, peak = measure(get_view_chunks)
+        print(
+            f'{"cached file":<20}: first byte {first_byte_time:.2f}s, '
+            f'total {elapsed_time:.2f}s, '
+            f'peak {peak / 2 ** 20:.1f}MiB',
+        )
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
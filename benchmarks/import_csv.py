@@ -0,0 +1,143 @@
+"""
+Повторный импорт выгрузки глюкометра командой
+import-sugar-csv, когда почти все строки уже есть в
+дневнике::
+
+    python -m benchmarks.import_csv --rows 500000 --new-share 0.01
+
+Сначала импортируется весь файл, затем -- файл, в котором
+доля `--new-share` строк новая (половина -- новые моменты,
+половина -- изменённый уровень сахара), в режимах
+--on-conflict skip и update. Команда записывает данные в
+своей транзакции, поэтому замер создаёт тестовую БД.
+"""
+import argparse
+import io
+import os
+import random
+import tempfile
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import (
+    List,
+    Tuple,
+)
+
+from benchmarks import (
+    setup_django,
+)
+
+FIRST_MOMENT = datetime(2015, 1, 1, 8, 0)
+ROWS_INTERVAL = timedelta(minutes=20)
+# Строки -- только днём, чтобы переходы на летнее время
+# не давали совпадающих моментов.
+ROWS_PER_DAY = 42
+
+
+def get_moment(idx: int) -> datetime:
+    days, row_of_day = divmod(idx, ROWS_PER_DAY)
+    return FIRST_MOMENT + timedelta(days=days) + row_of_day * ROWS_INTERVAL
+
+
+def write_csv(path: str, rows: List[Tuple[datetime, str]]) -> None:
+    with open(path, 'wt', encoding='utf-8') as csv_file:
+        for when, sugar_level in rows:
+            csv_file.write(
+                f'{when:%Y-%m-%d};{when.hour}:{when.minute};{sugar_level}\n',
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--new-share', type=float, default=0.01)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.contrib.auth import (
+        get_user_model,
+    )
+    from django.core.management import (
+        call_command,
+    )
+    from django.db import (
+        connection,
+    )
+
+    from sugar.models import (
+        TestStripPack,
+    )
+
+    generator = random.Random(0)
+    rows: List[Tuple[datetime, str]] = [
+        (
+            get_moment(idx),
+            '{:.1f}'.format(generator.randint(30, 150) / 10),
+        )
+        for idx in range(args.rows)
+    ]
+    changed_rows = list(rows)
+    changed_count = int(args.rows * args.new_share)
+    for idx in generator.sample(range(args.rows), changed_count // 2):
+        when, sugar_level = changed_rows[idx]
+        changed_rows[idx] = (when, '{:.1f}'.format(float(sugar_level) + 0.1))
+    changed_rows.extend(
+        (get_moment(idx), '5.5')
+        for idx in range(
+            args.rows,
+            args.rows + changed_count - changed_count // 2,
+        )
+    )
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0,
+        autoclobber=True,
+    )
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            initial_path = os.path.join(directory, 'initial.csv')
+            changed_path = os.path.join(directory, 'changed.csv')
+            write_csv(initial_path, rows)
+            write_csv(changed_path, changed_rows)
+
+            for on_conflict in ('skip', 'update'):
+                user = get_user_model().objects.create(
+                    username=f'benchmark-{on_conflict}',
+                )
+                TestStripPack.objects.create(
+                    whose=user,
+                    volume=50,
+                    opening=FIRST_MOMENT.date(),
+                )
+
+                for title, path, options in (
+                        ('initial import', initial_path, {}),
+                        (f'reimport, {on_conflict}', changed_path, dict(
+                            on_conflict=on_conflict,
+                        )),
+                ):
+                    stdout = io.StringIO()
+                    call_command(
+                        'import-sugar-csv',
+                        username=user.username,
+                        csv_file_path=path,
+                        chunk_size=args.chunk_size,
+                        stdout=stdout,
+                        **options,
+                    )
+                    print(f'{title:<17}: {stdout.getvalue().strip()}')
+
+        print(f'\nDatabase vendor: {connection.vendor}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
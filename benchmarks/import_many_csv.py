@@ -0,0 +1,101 @@
+"""
+Импорт каталога выгрузок (по файлу на пользователя)
+командой import-sugar-csv: разбор файлов в основном
+процессе (`--jobs 1`) против пула процессов::
+
+    python -m benchmarks.import_many_csv --files 24 --rows 20000 --jobs 1 4
+
+Для каждого значения `--jobs` заводятся свои пользователи,
+поэтому все прогоны импортируют одинаковый объём новых
+записей. Команда записывает данные в своих транзакциях,
+поэтому замер создаёт тестовую БД.
+"""
+import argparse
+import io
+import os
+import random
+import tempfile
+
+from benchmarks import (
+    setup_django,
+)
+from benchmarks.import_csv import (
+    FIRST_MOMENT,
+    get_moment,
+    write_csv,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--files', type=int, default=24)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.contrib.auth import (
+        get_user_model,
+    )
+    from django.core.management import (
+        call_command,
+    )
+    from django.db import (
+        connection,
+    )
+
+    from sugar.models import (
+        TestStripPack,
+    )
+
+    generator = random.Random(0)
+    old_name = connection.creation.create_test_db(
+        verbosity=0,
+        autoclobber=True,
+    )
+    try:
+        for jobs in args.jobs:
+            with tempfile.TemporaryDirectory() as directory:
+                for file_idx in range(args.files):
+                    user = get_user_model().objects.create(
+                        username=f'benchmark-{jobs}-{file_idx}',
+                    )
+                    TestStripPack.objects.create(
+                        whose=user,
+                        volume=50,
+                        opening=FIRST_MOMENT.date(),
+                    )
+                    write_csv(
+                        os.path.join(directory, f'{user.username}.csv'),
+                        [
+                            (
+                                get_moment(idx),
+                                '{:.1f}'.format(
+                                    generator.randint(30, 150) / 10,
+                                ),
+                            )
+                            for idx in range(args.rows)
+                        ],
+                    )
+
+                stdout = io.StringIO()
+                call_command(
+                    'import-sugar-csv',
+                    csv_file_path=directory,
+                    jobs=jobs,
+                    stdout=stdout,
+                )
+                total = stdout.getvalue().strip().splitlines()[-1]
+                print(f'--jobs {jobs:<2}: {total}')
+
+        print(f'\nDatabase vendor: {connection.vendor}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
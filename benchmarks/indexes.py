@@ -0,0 +1,151 @@
+"""
+Планы и время выполнения запросов, для которых
+предназначены составные индексы записей, прикреплений
+и расходников (миграция sugar 0010).
+
+Чтобы сравнить с прежней схемой, запустите замер
+дважды::
+
+    python manage.py migrate sugar 0009
+    python -m benchmarks.indexes
+    python manage.py migrate sugar
+    python -m benchmarks.indexes
+"""
+import argparse
+from datetime import (
+    timedelta,
+)
+
+from benchmarks import (
+    measure,
+    setup_django,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--records', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import (
+        connection,
+        transaction,
+    )
+
+    from benchmarks.synthetic import (
+        create_synthetic_diary,
+        get_diary_middle,
+    )
+    from sugar.helpers import (
+        get_neighbour_meterings,
+    )
+    from sugar.models import (
+        InsulinInjection,
+        InsulinSyringe,
+        Meal,
+        Record,
+        SugarMetering,
+        TestStripPack,
+    )
+
+    with transaction.atomic():
+        print(f'Creating {args.records} records of {args.users} users...')
+        users = create_synthetic_diary(args.users, args.records)
+        user = users[len(users) // 2]
+        middle = get_diary_middle(args.records, args.users)
+        page_range = (middle, middle + timedelta(days=30))
+        page_filter = dict(
+            record__who=user,
+            record__when__range=page_range,
+        )
+
+        cases = (
+            (
+                'Records page',
+                lambda: Record.objects.filter(
+                    who=user,
+                ).order_by(
+                    '-when',
+                ).values_list(
+                    'pk',
+                    'when',
+                )[:10],
+            ),
+            (
+                'Records of a month',
+                lambda: Record.objects.filter(
+                    who=user,
+                    when__range=page_range,
+                ).values_list(
+                    'pk',
+                    'when',
+                ),
+            ),
+            (
+                'Sugar meterings of a month',
+                lambda: SugarMetering.objects.filter(
+                    **page_filter,
+                ).values_list(
+                    'record',
+                    'sugar_level',
+                ),
+            ),
+            (
+                'Meals of a month',
+                lambda: Meal.objects.filter(
+                    **page_filter,
+                ).values_list(
+                    'record',
+                    'food_quantity',
+                ),
+            ),
+            (
+                'Injections of a month',
+                lambda: InsulinInjection.objects.filter(
+                    **page_filter,
+                ).values_list(
+                    'record',
+                    'insulin_syringe',
+                    'insulin_quantity',
+                ),
+            ),
+            (
+                'Actual test strip packs',
+                lambda: TestStripPack.get_actual_items(
+                    on_date=middle.date(),
+                    whose=user,
+                ),
+            ),
+            (
+                'Actual syringes',
+                lambda: InsulinSyringe.get_actual_items(
+                    on_date=middle.date(),
+                    whose=user,
+                ),
+            ),
+        )
+
+        for title, get_queryset in cases:
+            print(f'\n=== {title} ===')
+            print(get_queryset().explain())
+            print(measure(lambda: list(get_queryset()), args.repeat))
+
+        print('\n=== Neighbour meterings ===')
+        print(measure(
+            lambda: get_neighbour_meterings(user.pk, *page_range),
+            args.repeat,
+        ))
+
+        print(f'\nDatabase vendor: {connection.vendor}')
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Скорость разбора выгрузки глюкометра командой
+import-sugar-csv (`Command.iter_rows`) без записи в БД::
+
+    python -m benchmarks.parse_csv --rows 1000000
+
+Файл синтетический: 42 строки в сутки, каждые 20 минут.
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from benchmarks import (
+    setup_django,
+)
+from benchmarks.import_csv import (
+    get_moment,
+    write_csv,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.management import (
+        load_command_class,
+    )
+
+    from core.helpers import (
+        track_time,
+    )
+
+    command = load_command_class('sugar', 'import-sugar-csv')
+    generator = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        csv_file_path = os.path.join(directory, 'rows.csv')
+        write_csv(csv_file_path, [
+            (
+                get_moment(idx),
+                '{:.1f}'.format(generator.randint(30, 150) / 10),
+            )
+            for idx in range(args.rows)
+        ])
+
+        elapsed_times = []
+        for _ in range(args.repeat):
+            with track_time() as tracker:
+                for _ in command.iter_rows(csv_file_path):
+                    pass
+            elapsed_times.append(tracker.elapsed_time)
+
+    elapsed_time = min(elapsed_times)
+    print(
+        f'{args.rows} rows are parsed in {elapsed_time:.2f}s '
+        f'({args.rows / elapsed_time:.0f} rows/s)',
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Восстановление полной выгрузки: `restore` (`loaddata`,
+объект за объектом) против `restore --fast` (порции
+через `bulk_create`)::
+
+    python -m benchmarks.restore --records 20000
+
+Работает с тестовой БД (`test_<имя БД>`), которая
+создаётся и удаляется замером.
+"""
+import argparse
+import io
+import os
+import tempfile
+
+from benchmarks import (
+    setup_django,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.management import (
+        call_command,
+    )
+    from django.db import (
+        connection,
+    )
+
+    from benchmarks.synthetic import (
+        create_synthetic_diary,
+    )
+    from core.dumps import (
+        get_dumped_models,
+    )
+    from core.helpers import (
+        track_time,
+    )
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0,
+        autoclobber=True,
+    )
+    try:
+        print(f'Creating {args.records} records...')
+        create_synthetic_diary(args.users, args.records)
+
+        def get_counts():
+            return {
+                model._meta.label: model._base_manager.count()
+                for model in get_dumped_models()
+            }
+
+        with tempfile.TemporaryDirectory() as directory:
+            dump_path = os.path.join(directory, 'dump.jsonl.gz')
+            call_command('gzip_dumpdata', filename=dump_path, verbosity=0)
+            expected_counts = get_counts()
+            objects_count = sum(expected_counts.values())
+
+            for title, options in (
+                    ('loaddata', {}),
+                    ('--fast', {'fast': True, 'batch_size': args.batch_size}),
+            ):
+                with track_time() as tracker:
+                    call_command(
+                        'restore',
+                        dump_path,
+                        stdout=io.StringIO(),
+                        **options,
+                    )
+                assert get_counts() == expected_counts
+                elapsed_time = tracker.elapsed_time
+                print(
+                    f'{title:<10}: {elapsed_time:.2f}s, '
+                    f'{objects_count / elapsed_time:.0f} objects/s',
+                )
+
+        print(f'\nDatabase vendor: {connection.vendor}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
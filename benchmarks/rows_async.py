@@ -0,0 +1,200 @@
+"""
+Нагрузочный замер rows.json под ASGI: синхронный
+`rows_view` против `rows_async_view`, который запрашивает
+прикрепления страницы одновременно::
+
+    python -m benchmarks.rows_async --concurrency 8
+
+Потоки пула работают со своими соединениями и должны
+видеть данные, поэтому замер создаёт тестовую БД
+(как при запуске тестов), а не откатываемую транзакцию.
+Запросы отправляются прямо ASGI-приложению `main.asgi`,
+без сервера.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+from urllib.parse import (
+    urlencode,
+)
+
+from benchmarks import (
+    setup_django,
+)
+
+
+CSRF_TOKEN = 'benchmark' * 3 + 'bench'  # 32 символа
+
+
+async def post(
+        application: Any,
+        path: str,
+        data: Dict[str, Any],
+        session_key: str,
+) -> int:
+    """
+    Отправляет POST-запрос ASGI-приложению напрямую, без
+    сервера; возвращает код ответа.
+    """
+    body = urlencode(data).encode()
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [
+            (b'host', b'testserver'),
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'content-length', str(len(body)).encode()),
+            (
+                b'cookie',
+                f'sessionid={session_key}; csrftoken={CSRF_TOKEN}'.encode(),
+            ),
+            (b'x-csrftoken', CSRF_TOKEN.encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    statuses: List[int] = []
+
+    async def receive() -> Dict[str, Any]:
+        return {
+            'type': 'http.request',
+            'body': body,
+            'more_body': False,
+        }
+
+    async def send(message: Dict[str, Any]) -> None:
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    await application(scope, receive, send)
+    return statuses[0]
+
+
+async def load(
+        application: Any,
+        path: str,
+        data: Dict[str, Any],
+        session_key: str,
+        requests_count: int,
+        concurrency: int,
+) -> List[float]:
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_request() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            status = await post(application, path, data, session_key)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert status == 200, status
+
+    await asyncio.gather(*(
+        send_request()
+        for _ in range(requests_count)
+    ))
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--groupping', default='none')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import (
+        settings,
+    )
+    from django.db import (
+        connection,
+    )
+    from django.test import (
+        Client,
+    )
+    from django.test.utils import (
+        setup_test_environment,
+    )
+
+    from benchmarks.synthetic import (
+        create_synthetic_diary,
+    )
+    from main.asgi import (
+        application,
+    )
+
+    setup_test_environment()
+    # замеряем построение ответа, а не чтение из кэша
+    settings.ROWS_CACHE_TIMEOUT = 0
+    old_name = connection.creation.create_test_db(
+        verbosity=0,
+        autoclobber=True,
+    )
+    try:
+        print(f'Creating {args.records} records...')
+        user, = create_synthetic_diary(1, args.records)
+        client = Client()
+        client.force_login(user)
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        data = dict(
+            groupping=args.groupping,
+            page_number=1,
+            page_size=args.page_size,
+        )
+
+        for title, path in (
+                ('sync view', '/sugar/rows.json'),
+                ('async view', '/sugar/rows-async.json'),
+        ):
+            # прогрев: индекс страниц, соединения потоков
+            asyncio.run(load(
+                application,
+                path,
+                data,
+                session_key,
+                args.concurrency,
+                args.concurrency,
+            ))
+            started = time.perf_counter()
+            latencies = asyncio.run(load(
+                application,
+                path,
+                data,
+                session_key,
+                args.requests,
+                args.concurrency,
+            ))
+            elapsed = time.perf_counter() - started
+            latencies.sort()
+            print(
+                f'{title:<10}: {args.requests / elapsed:.1f} req/s, '
+                f'median {statistics.median(latencies):.1f}ms, '
+                f'p95 {latencies[int(len(latencies) * 0.95)]:.1f}ms',
+            )
+
+        print(f'\nDatabase vendor: {connection.vendor}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
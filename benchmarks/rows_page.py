@@ -0,0 +1,151 @@
+"""
+Время до первого байта и пиковая память ответа
+rows.json при разных размерах страницы: обычный ответ
+(`json.dumps` целиком) против потокового
+(`StreamingHttpResponse`)::
+
+    python -m benchmarks.rows_page --page-sizes 10 1000 10000
+
+Пиковая память -- максимум выделенной Python-памяти
+по `tracemalloc` за время запроса и чтения ответа;
+RSS процесса растёт монотонно и печатается в конце.
+"""
+import argparse
+import resource
+import time
+import tracemalloc
+from typing import (
+    Any,
+    Callable,
+    Tuple,
+)
+
+from benchmarks import (
+    setup_django,
+)
+
+
+def read_response(get_response: Callable[[], Any]) -> Tuple[float, float]:
+    """
+    Возвращает (время до первого байта, полное время)
+    в миллисекундах.
+    """
+    started = time.perf_counter()
+    response = get_response()
+    assert response.status_code == 200
+    if response.streaming:
+        content_iterator = iter(response.streaming_content)
+        next(content_iterator)
+        first_byte = time.perf_counter()
+        for _ in content_iterator:
+            pass
+    else:
+        assert response.content
+        first_byte = time.perf_counter()
+    finished = time.perf_counter()
+
+    return (
+        (first_byte - started) * 1000,
+        (finished - started) * 1000,
+    )
+
+
+def measure_response(
+        get_response: Callable[[], Any],
+) -> Tuple[float, float, int]:
+    """
+    Возвращает (время до первого байта в мс, полное
+    время в мс, пик памяти в байтах). `tracemalloc`
+    заметно замедляет код, поэтому память замеряется
+    отдельным запросом.
+    """
+    ttfb, total = read_response(get_response)
+
+    tracemalloc.start()
+    read_response(get_response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return ttfb, total, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument(
+        '--page-sizes',
+        type=int,
+        nargs='+',
+        default=[10, 1000, 10000],
+    )
+    parser.add_argument('--groupping', default='none')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import (
+        settings,
+    )
+    from django.db import (
+        transaction,
+    )
+    from django.test import (
+        Client,
+    )
+    from django.test.utils import (
+        setup_test_environment,
+    )
+
+    from benchmarks.synthetic import (
+        create_synthetic_diary,
+    )
+    from sugar import (
+        views,
+    )
+
+    setup_test_environment()
+    # замеряем построение ответа, а не чтение из кэша
+    settings.ROWS_CACHE_TIMEOUT = 0
+    with transaction.atomic():
+        print(f'Creating {args.records} records...')
+        user, = create_synthetic_diary(1, args.records)
+        client = Client()
+        client.force_login(user)
+
+        def get_response(page_size: int) -> Any:
+            return client.post('/sugar/rows.json', data=dict(
+                groupping=args.groupping,
+                page_number=1,
+                page_size=page_size,
+            ))
+
+        # первый запрос строит индекс страниц
+        get_response(args.page_sizes[0])
+
+        streaming_page_size = views.STREAMING_PAGE_SIZE
+        for page_size in args.page_sizes:
+            for title, threshold in (
+                    ('buffered', page_size + 1),
+                    ('streaming', page_size),
+            ):
+                views.STREAMING_PAGE_SIZE = threshold
+                ttfb, total, peak = measure_response(
+                    lambda: get_response(page_size),
+                )
+                print(
+                    f'{page_size:>6} rows, {title:<9}: '
+                    f'TTFB {ttfb:.1f}ms, total {total:.1f}ms, '
+                    f'peak {peak / 2 ** 20:.2f}MiB',
+                )
+        views.STREAMING_PAGE_SIZE = streaming_page_size
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f'\nProcess max RSS: {max_rss / 1024:.1f}MiB')
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
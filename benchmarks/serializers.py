@@ -0,0 +1,117 @@
+"""
+Размер и время сериализации страницы rows.json разными
+сериализаторами (`sugar.serializers`) в обычном и
+колоночном форматах::
+
+    python -m benchmarks.serializers --rows 10 10000
+
+Страница синтетическая (строки как при группировке по
+годам: средний сахар, min/max, число измерений, еда и
+три вида инсулина), БД не нужна.
+"""
+import argparse
+import random
+from decimal import (
+    Decimal,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+from benchmarks import (
+    measure,
+    setup_django,
+)
+
+
+def create_page(rows_count: int, seed: int = 0) -> Dict[str, Any]:
+    generator = random.Random(seed)
+    insulin_indices = ['insulin_1', 'insulin_2', 'insulin_3']
+    columns: List[Dict[str, str]] = [
+        dict(data_index=data_index, header=header)
+        for data_index, header in (
+            ('time_label', 'Дата/время'),
+            ('sugar_level', 'Средний сахар'),
+            ('max_sugar', 'Max'),
+            ('min_sugar', 'Min'),
+            ('meterings_count', 'Измерений'),
+            ('meal', 'Съедено (ХЕ)'),
+            *zip(insulin_indices, ('Aspart', 'Glargine', 'Lispro')),
+        )
+    ]
+    rows: List[Dict[str, Any]] = [
+        {
+            'time_label': str(2000 + idx),
+            'sugar_level': '{:.2f}'.format(generator.uniform(4, 12)),
+            'max_sugar': '{:.1f}'.format(generator.uniform(12, 20)),
+            'min_sugar': '{:.1f}'.format(generator.uniform(2, 4)),
+            'meterings_count': generator.randint(1000, 3000),
+            'meal': Decimal(generator.randint(10000, 30000)) / 10,
+            **{
+                data_index: generator.randint(1000, 9000)
+                for data_index in insulin_indices
+            },
+        }
+        for idx in range(rows_count)
+    ]
+    return dict(
+        rows=rows,
+        columns=columns,
+        total_rows_count=rows_count,
+        total_pages_count=1,
+        page_number=1,
+        first_shown=1,
+        last_shown=rows_count,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from sugar.serializers import (
+        SERIALIZERS,
+        get_serializer,
+        orjson,
+        to_columnar,
+    )
+
+    names = [
+        name
+        for name in SERIALIZERS
+        if name != 'orjson' or orjson is not None
+    ]
+    for rows_count in args.rows:
+        page = create_page(rows_count)
+        columnar_page = dict(
+            page,
+            values=to_columnar(page['rows'], page['columns']),
+        )
+        del columnar_page['rows']
+
+        print(f'\n=== {rows_count} rows ===')
+        for name in names:
+            serializer = get_serializer(name)
+            for title, data in (
+                    ('rows', page),
+                    ('columnar', columnar_page),
+            ):
+                size = len(serializer.dumps(data))
+                timing = measure(
+                    lambda: serializer.dumps(data),
+                    args.repeat,
+                )
+                print(f'{name:<7} {title:<9}: {size:>9} bytes, {timing}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Выгрузка и восстановление одним файлом против выгрузки
+по моделям (`gzip_dumpdata --split`) в нескольких
+процессах::
+
+    python -m benchmarks.split_dump --records 50000 --jobs 1 4
+
+Работает с тестовой БД (`test_<имя БД>`), которая
+создаётся и удаляется замером. На SQLite восстановление
+по моделям идёт в одном процессе (см. `restore`).
+"""
+import argparse
+import io
+import os
+import tempfile
+
+from benchmarks import (
+    setup_django,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.management import (
+        call_command,
+    )
+    from django.db import (
+        connection,
+    )
+
+    from benchmarks.synthetic import (
+        create_synthetic_diary,
+    )
+    from core.helpers import (
+        track_time,
+    )
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0,
+        autoclobber=True,
+    )
+    try:
+        print(f'Creating {args.records} records...')
+        create_synthetic_diary(args.users, args.records)
+
+        with tempfile.TemporaryDirectory() as directory:
+            single_path = os.path.join(directory, 'dump.jsonl.gz')
+            variants = [('single file', single_path, {})]
+            for jobs in args.jobs:
+                variants.append((
+                    f'split, {jobs} jobs',
+                    os.path.join(directory, f'split-{jobs}'),
+                    {'split': True, 'jobs': jobs},
+                ))
+
+            for title, path, options in variants:
+                with track_time() as dump_tracker:
+                    call_command(
+                        'gzip_dumpdata',
+                        filename=path,
+                        verbosity=0,
+                        **options,
+                    )
+                with track_time() as restore_tracker:
+                    call_command(
+                        'restore',
+                        path,
+                        fast=True,
+                        jobs=options.get('jobs', 1),
+                        force=True,
+                        stdout=io.StringIO(),
+                    )
+                print(
+                    f'{title:<14}: dump {dump_tracker.elapsed_time:.2f}s, '
+                    f'restore {restore_tracker.elapsed_time:.2f}s',
+                )
+
+        print(f'\nCPUs: {os.cpu_count()}, database vendor: {connection.vendor}')  # noqa
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
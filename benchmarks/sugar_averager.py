@@ -0,0 +1,91 @@
+"""
+Чередование `add_metering` и запросов у
+`TrapezoidalSugarAverager` (живой график: добавили
+измерение -- запросили среднее): прежний способ
+(сортировка и пересчёт всех отрезков после каждого
+добавления) против встраивания измерения на место::
+
+    python -m benchmarks.sugar_averager --meterings 100000
+"""
+import argparse
+import random
+from datetime import (
+    datetime,
+    timedelta,
+)
+from decimal import (
+    Decimal,
+)
+
+from benchmarks import (
+    measure,
+    setup_django,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--meterings', type=int, default=100000)
+    parser.add_argument('--adds', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+
+    import pytz
+
+    from sugar.helpers import (
+        SugarMeteringTuple,
+        TrapezoidalSugarAverager,
+    )
+
+    class ResortingAverager(TrapezoidalSugarAverager):
+        def add_metering(self, metering: SugarMeteringTuple) -> None:
+            self._meterings.append(metering)
+            self._prepared = False
+
+    generator = random.Random(0)
+    start = datetime(2021, 1, 1, tzinfo=pytz.utc)
+    moments = [
+        start + timedelta(minutes=minute)
+        for minute in generator.sample(
+            range(10 * (args.meterings + args.adds)),
+            args.meterings + args.adds,
+        )
+    ]
+    meterings = [
+        SugarMeteringTuple(when, Decimal(generator.randint(30, 150)) / 10)
+        for when in moments
+    ]
+    initial_meterings = sorted(meterings[:args.meterings])
+    last_when = initial_meterings[-1].when
+    added_variants = {
+        'appended': [
+            SugarMeteringTuple(last_when + timedelta(minutes=idx + 1), value)
+            for idx, (_, value) in enumerate(meterings[args.meterings:])
+        ],
+        'inserted': meterings[args.meterings:],
+    }
+
+    for averager_class in (ResortingAverager, TrapezoidalSugarAverager):
+        for title, added_meterings in added_variants.items():
+            def add_and_query() -> None:
+                averager = averager_class()
+                for metering in initial_meterings:
+                    averager.add_metering(metering)
+                averager.get_value(initial_meterings[0].when)
+                for metering in added_meterings:
+                    averager.add_metering(metering)
+                    averager.get_value(metering.when)
+
+            print(
+                f'{averager_class.__name__}, {args.adds} {title}: '
+                f'{measure(add_and_query, args.repeat)}',
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import random
+from datetime import (
+    date,
+    datetime,
+    timedelta,
+)
+from decimal import (
+    Decimal,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+from django.conf import (
+    settings,
+)
+from django.contrib.auth import (
+    get_user_model,
+)
+from pytz import (
+    timezone,
+)
+
+from sugar.models import (
+    InsulinInjection,
+    InsulinKind,
+    InsulinSyringe,
+    Meal,
+    Record,
+    SugarMetering,
+    TestStripPack,
+)
+
+CHUNK_SIZE = 5000
+FIRST_MOMENT = datetime(2015, 1, 1, 8, 0)
+RECORDS_INTERVAL = timedelta(hours=3)
+MEDICATIONS_PER_USER = 50
+
+
+def create_synthetic_diary(
+        users_count: int,
+        records_count: int,
+        seed: int = 0,
+) -> List[Any]:
+    """
+    Создаёт `users_count` пользователей с общим числом
+    записей `records_count`: у 80% записей есть измерение
+    сахара, у 30% -- приём пищи, у 20% -- инъекция.
+    `bulk_create` не отправляет сигналы, поэтому индекс
+    страниц и сводки не строятся.
+    """
+    generator = random.Random(seed)
+    using_timezone = timezone(settings.TIME_ZONE)
+    first_moment = using_timezone.localize(FIRST_MOMENT)
+    insulin_kind, _ = InsulinKind.objects.get_or_create(
+        name='Benchmark',
+    )
+
+    users = []
+    records_per_user = records_count // users_count
+    for user_idx in range(users_count):
+        user = get_user_model().objects.create(
+            username=f'benchmark-{seed}-{user_idx}',
+        )
+        users.append(user)
+
+        medication_params: Dict[str, Any] = dict(
+            whose=user,
+            volume=50,
+        )
+        opening = first_moment.date()
+        packs: List[TestStripPack] = []
+        syringes: List[InsulinSyringe] = []
+        for _ in range(MEDICATIONS_PER_USER):
+            expiry_actual = opening + timedelta(days=60)
+            packs.append(TestStripPack(
+                opening=opening,
+                expiry_actual=expiry_actual,
+                **medication_params,
+            ))
+            syringes.append(InsulinSyringe(
+                opening=opening,
+                expiry_actual=expiry_actual,
+                insulin_mark=insulin_kind,
+                **medication_params,
+            ))
+            opening = expiry_actual
+        packs[-1].expiry_actual = syringes[-1].expiry_actual = None
+        TestStripPack.objects.bulk_create(packs)
+        InsulinSyringe.objects.bulk_create(syringes)
+        pack = TestStripPack.objects.filter(
+            whose=user,
+            expiry_actual__isnull=True,
+        ).get()
+        syringe = InsulinSyringe.objects.filter(
+            whose=user,
+            expiry_actual__isnull=True,
+        ).get()
+
+        for chunk_start in range(0, records_per_user, CHUNK_SIZE):
+            chunk_stop = min(records_per_user, chunk_start + CHUNK_SIZE)
+            moments = [
+                first_moment + idx * RECORDS_INTERVAL
+                for idx in range(chunk_start, chunk_stop)
+            ]
+            Record.objects.bulk_create(
+                Record(
+                    who=user,
+                    when=moment,
+                )
+                for moment in moments
+            )
+            # `bulk_create` возвращает первичные ключи не во
+            # всех БД, поэтому достаём их по (who, when)
+            records_ids = Record.objects.filter(
+                who=user,
+                when__range=(moments[0], moments[-1]),
+            ).order_by(
+                'when',
+            ).values_list(
+                'pk',
+                flat=True,
+            )
+
+            meterings: List[SugarMetering] = []
+            meals: List[Meal] = []
+            injections: List[InsulinInjection] = []
+            for record_id in records_ids:
+                if generator.random() < 0.8:
+                    meterings.append(SugarMetering(
+                        record_id=record_id,
+                        pack=pack,
+                        sugar_level=Decimal(generator.randint(30, 150)) / 10,
+                    ))
+                if generator.random() < 0.3:
+                    meals.append(Meal(
+                        record_id=record_id,
+                        food_quantity=Decimal(generator.randint(5, 60)) / 10,
+                    ))
+                if generator.random() < 0.2:
+                    injections.append(InsulinInjection(
+                        record_id=record_id,
+                        insulin_syringe=syringe,
+                        insulin_quantity=generator.randint(1, 12),
+                    ))
+
+            SugarMetering.objects.bulk_create(meterings)
+            Meal.objects.bulk_create(meals)
+            InsulinInjection.objects.bulk_create(injections)
+
+    return users
+
+
+def get_diary_middle(records_count: int, users_count: int) -> datetime:
+    using_timezone = timezone(settings.TIME_ZONE)
+    return using_timezone.localize(FIRST_MOMENT) + (
+        records_count // users_count // 2
+    ) * RECORDS_INTERVAL
+
+
+def get_diary_middle_date(records_count: int, users_count: int) -> date:
+    return get_diary_middle(records_count, users_count).date()
@@ -0,0 +1,206 @@
+"""
+Журнал изменений для инкрементальных выгрузок.
+
+Сигналы (`core.signals`) записывают в журнал каждое
+сохранение и удаление объекта; массовые операции
+(`bulk_create`, `bulk_update`, `QuerySet.update`) сигналов
+не отправляют, поэтому код, который ими пользуется,
+вызывает `log_changes` сам.
+
+У производных моделей (индексы, сводки), которые можно
+пересчитать по остальным данным, атрибут `track_changes =
+False`: они не попадают в журнал и в инкрементальные
+выгрузки, а после применения выгрузок пересчитываются
+получателями сигнала `deltas_applied`.
+
+Инкрементальные выгрузки образуют цепочку: каждая
+отсчитывается от предыдущей -- полной выгрузки всех
+моделей или инкрементальной, -- отметка которой
+(`DumpMark`) хранится в БД. Только такие выгрузки удаляют
+из журнала записи выгруженных моделей.
+"""
+import uuid
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Type,
+)
+
+from django.apps import (
+    apps,
+)
+from django.core.cache import (
+    cache,
+)
+from django.db import (
+    models,
+)
+from django.db.models import (
+    Max,
+)
+from django.db.transaction import (
+    atomic,
+    on_commit,
+)
+
+from core.models import (
+    ChangeLogEntry,
+    DumpMark,
+)
+
+# Модели сторонних приложений, изменения которых не
+# нужны: сессии меняются при каждом запросе.
+UNTRACKED_MODEL_LABELS: Set[str] = {
+    'sessions.session',
+}
+
+CHANGES_VERSION_KEY = 'core:changes_version'
+
+DUMP_MARK_PK = 1
+
+
+def get_model_label(model: Type[models.Model]) -> str:
+    # изменения прокси-моделей -- изменения их таблиц
+    return model._meta.concrete_model._meta.label_lower
+
+
+def is_tracked(model: Type[models.Model]) -> bool:
+    concrete_model = model._meta.concrete_model
+    return (
+        # исторические модели миграций не отслеживаются
+        concrete_model._meta.apps is apps
+        and getattr(concrete_model, 'track_changes', True)
+        and get_model_label(model) not in UNTRACKED_MODEL_LABELS
+    )
+
+
+def log_changes(model: Type[models.Model], pks: Iterable[Any]) -> None:
+    if not is_tracked(model):
+        return
+
+    model_label = get_model_label(model)
+    ChangeLogEntry.objects.bulk_create(
+        ChangeLogEntry(
+            model_label=model_label,
+            object_pk=str(pk),
+        )
+        for pk in pks
+    )
+    bump_changes_version()
+
+
+def get_changes_version() -> str:
+    """
+    Версия данных: меняется при каждом изменении, по ней
+    проверяется, что сохранённая выгрузка не устарела.
+    """
+    version = cache.get(CHANGES_VERSION_KEY)
+    if version is None:
+        # версия могла быть вытеснена из кэша
+        version = uuid.uuid4().hex
+        if not cache.add(CHANGES_VERSION_KEY, version, timeout=None):
+            version = cache.get(CHANGES_VERSION_KEY, version)
+    return version
+
+
+def _set_new_changes_version() -> None:
+    cache.set(CHANGES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def bump_changes_version() -> None:
+    _set_new_changes_version()
+    # выгрузка, начатая до фиксации транзакции, изменений
+    # не увидит, поэтому после фиксации меняем версию ещё раз
+    on_commit(_set_new_changes_version)
+
+
+def get_last_entry_id() -> Optional[int]:
+    return ChangeLogEntry.objects.aggregate(
+        last_entry_id=Max('id'),
+    )['last_entry_id']
+
+
+def get_changes(last_entry_id: Optional[int]) -> Dict[str, Set[str]]:
+    """
+    Метка модели -> первичные ключи (строками) объектов,
+    изменённых в записях журнала до `last_entry_id`
+    включительно.
+    """
+    changes: Dict[str, Set[str]] = {}
+    if last_entry_id is None:
+        return changes
+
+    entries = ChangeLogEntry.objects.filter(
+        id__lte=last_entry_id,
+    ).values_list(
+        'model_label',
+        'object_pk',
+    )
+    for model_label, object_pk in entries.iterator():
+        changes.setdefault(model_label, set()).add(object_pk)
+
+    return changes
+
+
+def clear_changes(
+        last_entry_id: Optional[int] = None,
+        model_labels: Optional[List[str]] = None,
+) -> None:
+    """
+    Удаляет записи журнала, уже попавшие в выгрузку
+    (до `last_entry_id` включительно, только моделей
+    `model_labels`), или все записи.
+    """
+    entries = ChangeLogEntry.objects.all()
+    if last_entry_id is not None:
+        entries = entries.filter(id__lte=last_entry_id)
+    if model_labels is not None:
+        entries = entries.filter(model_label__in=model_labels)
+    entries.delete()
+
+
+def get_dump_mark() -> Optional[DumpMark]:
+    return DumpMark.objects.filter(pk=DUMP_MARK_PK).first()
+
+
+def new_dump_mark(incremental: bool) -> DumpMark:
+    """
+    Отметка новой выгрузки (не сохраняется); у
+    инкрементальной -- идентификатор выгрузки, от которой
+    она отсчитывается.
+    """
+    base_mark = get_dump_mark() if incremental else None
+    return DumpMark(
+        pk=DUMP_MARK_PK,
+        dump_id=uuid.uuid4(),
+        base_id=base_mark.dump_id if base_mark is not None else None,
+    )
+
+
+def anchor_dump(
+        mark: DumpMark,
+        dumped_models: Iterable[Type[models.Model]],
+        last_entry_id: Optional[int],
+        incremental: bool,
+) -> None:
+    """
+    Делает законченную выгрузку точкой отсчёта следующей
+    инкрементальной: сохраняет её отметку и удаляет из
+    журнала записи выгруженных моделей (до
+    `last_entry_id` включительно).
+    """
+    with atomic():
+        mark.save()
+        if last_entry_id is not None:
+            clear_changes(
+                last_entry_id,
+                [get_model_label(model) for model in dumped_models],
+            )
+    if incremental:
+        # сохранённая полная выгрузка больше не начало
+        # цепочки, к ней не применить следующую
+        bump_changes_version()
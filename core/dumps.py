@@ -0,0 +1,890 @@
+"""
+Потоковая выгрузка данных в формате JSON Lines (`jsonl`
+в сериализаторах Django), который читает `loaddata`.
+
+В отличие от `dumpdata`, модели читаются порциями
+(запросами `values_list(...)` по pk после последней
+порции) без создания экземпляров моделей, а связи
+многие-ко-многим -- одним запросом на порцию, поэтому
+память не зависит от размера таблиц.
+Строки выгрузки совпадают с тем, что выдаёт сериализатор
+`jsonl` для тех же объектов.
+
+Полная выгрузка загружается либо `loaddata` (по объекту),
+либо функцией `bulk_load_dump` (`restore --fast`): порциями
+через `bulk_create` в пустые таблицы.
+
+Инкрементальная выгрузка содержит только объекты из
+журнала изменений (`core.changelog`): сначала строки
+удалённых объектов (`{"model": ..., "pk": ..., "deleted":
+true}`), затем текущее состояние остальных. Применяется
+она функцией `apply_delta` (команда `restore`), а не
+`loaddata`.
+
+Первая строка любой выгрузки -- отметка выгрузки
+(`core.models.DumpMark`, см. `core.changelog`): она
+загружается вместе с данными, а `apply_delta` по ней
+проверяет, что инкрементальная выгрузка сделана после
+загруженной.
+"""
+import gzip
+import json
+from types import (
+    SimpleNamespace,
+)
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
+
+from django.apps import (
+    apps,
+)
+from django.core import (
+    serializers,
+)
+from django.core.management.color import (
+    no_style,
+)
+from django.core.serializers.json import (
+    DjangoJSONEncoder,
+)
+from django.core.serializers.python import (
+    Deserializer as PythonDeserializer,
+)
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    connections,
+    models,
+    router,
+)
+from django.db.transaction import (
+    atomic,
+)
+from django.utils.encoding import (
+    is_protected_type,
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+from core.changelog import (
+    DUMP_MARK_PK,
+)
+from core.models import (
+    ChangeLogEntry,
+    DumpMark,
+    Job,
+)
+
+DUMP_FORMAT = 'jsonl'
+DELETED_KEY = 'deleted'
+CHUNK_SIZE = 2000
+
+
+# FIXME: don't use NamedTuples?
+class Compression(NamedTuple):
+    # расширение файла без точки, как в `loaddata`
+    extension: Optional[str]
+    content_type: str
+    default_level: Optional[int]
+    # открывают путь или файловый объект
+    open_for_writing: Callable[[Any, Optional[int]], IO[bytes]]
+    open_for_reading: Callable[[Any], IO[bytes]]
+
+
+def _open_file(target: Any, mode: str) -> IO[bytes]:
+    if hasattr(target, 'write') or hasattr(target, 'read'):
+        return target
+    return open(target, mode)
+
+
+COMPRESSIONS: Dict[str, Compression] = {
+    'none': Compression(
+        extension=None,
+        content_type='application/jsonl',
+        default_level=None,
+        open_for_writing=lambda target, level: _open_file(target, 'wb'),
+        open_for_reading=lambda target: _open_file(target, 'rb'),
+    ),
+    'gzip': Compression(
+        extension='gz',
+        content_type='application/gzip',
+        # уровень 9 (по умолчанию у `gzip.open`) заметно
+        # медленнее, а сжимает почти так же
+        default_level=6,
+        open_for_writing=lambda path, level: gzip.open(
+            path,
+            'wb',
+            compresslevel=level,
+        ),
+        open_for_reading=lambda path: gzip.open(path, 'rb'),
+    ),
+}
+
+if zstandard is not None:
+    COMPRESSIONS['zstd'] = Compression(
+        extension='zst',
+        content_type='application/zstd',
+        default_level=3,
+        open_for_writing=lambda path, level: zstandard.open(
+            path,
+            'wb',
+            cctx=zstandard.ZstdCompressor(level=level),
+        ),
+        open_for_reading=lambda path: zstandard.open(path, 'rb'),
+    )
+
+if lz4 is not None:
+    COMPRESSIONS['lz4'] = Compression(
+        extension='lz4',
+        content_type='application/octet-stream',
+        default_level=0,
+        open_for_writing=lambda path, level: lz4.frame.open(
+            path,
+            'wb',
+            compression_level=level,
+        ),
+        open_for_reading=lambda path: lz4.frame.open(path, 'rb'),
+    )
+
+
+def get_dump_extension(compression: str) -> str:
+    extension = COMPRESSIONS[compression].extension
+    if extension is None:
+        return DUMP_FORMAT
+    return f'{DUMP_FORMAT}.{extension}'
+
+
+def parse_dump_compression(path: str) -> str:
+    """
+    Способ сжатия выгрузки по расширению файла.
+    """
+    for compression, compression_info in COMPRESSIONS.items():
+        if compression_info.extension is not None and path.endswith(
+                f'.{compression_info.extension}',
+        ):
+            return compression
+    return 'none'
+
+
+def open_dump(
+        path: Any,
+        compression: str,
+        level: Optional[int] = None,
+        mode: str = 'wb',
+) -> IO[bytes]:
+    compression_info = COMPRESSIONS[compression]
+    if mode == 'rb':
+        return compression_info.open_for_reading(path)
+
+    if level is None:
+        level = compression_info.default_level
+    return compression_info.open_for_writing(path, level)
+
+
+def get_dumped_models(
+        excludes: Sequence[str] = (),
+        using: str = DEFAULT_DB_ALIAS,
+) -> List[Type[models.Model]]:
+    """
+    Модели, которые выгружает `dumpdata`, в том же
+    порядке. `excludes` -- метки приложений (`app_label`)
+    и моделей (`app_label.ModelName`), как у `dumpdata -e`.
+    """
+    excluded_labels = set()
+    for label in excludes:
+        # выбрасывает LookupError для неизвестной метки
+        if '.' in label:
+            apps.get_model(label)
+        else:
+            apps.get_app_config(label)
+        excluded_labels.add(label.lower())
+
+    dumped_models: List[Type[models.Model]] = []
+    for app_config in apps.get_app_configs():
+        if app_config.label in excluded_labels:
+            continue
+        for model in app_config.get_models():
+            if (
+                    # служебные таблицы не выгружаются
+                    model in (ChangeLogEntry, DumpMark, Job)
+                    or model._meta.proxy
+                    or model._meta.label_lower in excluded_labels
+                    or not router.allow_migrate_model(using, model)
+            ):
+                continue
+            dumped_models.append(model)
+
+    return dumped_models
+
+
+def sort_by_dependencies(
+        unsorted_models: Iterable[Type[models.Model]],
+) -> List[Type[models.Model]]:
+    """
+    Модели так, чтобы модель шла после моделей, на
+    которые ссылаются её внешние ключи (при циклических
+    ссылках -- в исходном порядке).
+    """
+    pending = list(unsorted_models)
+    dependencies = {
+        model: {
+            field.remote_field.model._meta.concrete_model
+            for field in model._meta.concrete_model._meta.fields
+            if field.remote_field is not None
+        } - {model._meta.concrete_model}
+        for model in pending
+    }
+    sorted_models: List[Type[models.Model]] = []
+    while pending:
+        pending_concrete = {
+            model._meta.concrete_model
+            for model in pending
+        }
+        ready = [
+            model
+            for model in pending
+            if not dependencies[model] & pending_concrete
+        ] or pending
+        sorted_models.extend(ready)
+        pending = [
+            model
+            for model in pending
+            if model not in ready
+        ]
+
+    return sorted_models
+
+
+def _get_field_value(field: models.Field, value: Any) -> Any:
+    # так же, как `PythonSerializer._value_from_field`
+    if value is None or type(value) is str or is_protected_type(value):
+        return value
+    return field.value_to_string(SimpleNamespace(**{field.attname: value}))
+
+
+def iter_model_lines(
+        model: Type[models.Model],
+        chunk_size: int = CHUNK_SIZE,
+        queryset: Optional[models.QuerySet] = None,
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Строки выгрузки объектов модели (по возрастанию pk,
+    как у `dumpdata`) порциями: (число объектов в порции,
+    строки порции).
+    """
+    concrete_model = model._meta.concrete_model
+    pk_field = concrete_model._meta.pk
+    fields = [
+        field
+        for field in concrete_model._meta.local_fields
+        if field.serialize
+    ]
+    m2m_fields = [
+        field
+        for field in concrete_model._meta.local_many_to_many
+        if field.serialize and field.remote_field.through._meta.auto_created
+    ]
+    model_label = model._meta.label_lower
+
+    if queryset is None:
+        queryset = model._default_manager.all()
+    rows = queryset.order_by(
+        pk_field.attname,
+    ).values_list(
+        pk_field.attname,
+        *(field.attname for field in fields),
+    )
+
+    # Порции читаются отдельными запросами по pk после
+    # последнего прочитанного, а не `iterator()`: без
+    # курсора на стороне сервера (MySQL) клиент получает
+    # весь результат запроса сразу.
+    chunk = list(rows[:chunk_size])
+    while chunk:
+
+        m2m_values = {
+            field.name: _get_m2m_values(field, [row[0] for row in chunk])
+            for field in m2m_fields
+        }
+        lines: List[bytes] = []
+        for pk, *values in chunk:
+            dumped_fields = {
+                field.name: _get_field_value(field, value)
+                for field, value in zip(fields, values)
+            }
+            for field_name, values_by_pk in m2m_values.items():
+                dumped_fields[field_name] = values_by_pk.get(pk, [])
+            lines.append(json.dumps(
+                {
+                    'model': model_label,
+                    'pk': _get_field_value(pk_field, pk),
+                    'fields': dumped_fields,
+                },
+                cls=DjangoJSONEncoder,
+                ensure_ascii=False,
+                separators=(',', ':'),
+            ).encode() + b'\n')
+
+        yield len(chunk), b''.join(lines)
+
+        if len(chunk) < chunk_size:
+            break
+        chunk = list(rows.filter(pk__gt=chunk[-1][0])[:chunk_size])
+
+
+def _get_m2m_values(
+        field: models.ManyToManyField,
+        pks: List[Any],
+) -> Dict[Any, List[Any]]:
+    """
+    pk объекта -> pk связанных объектов: один запрос к
+    промежуточной таблице на порцию.
+    """
+    through = field.remote_field.through
+    source_attname = field.m2m_column_name()
+    target_attname = field.m2m_reverse_name()
+    values_by_pk: Dict[Any, List[Any]] = {}
+    links = through._default_manager.filter(**{
+        f'{source_attname}__in': pks,
+    }).order_by(
+        'pk',
+    ).values_list(
+        source_attname,
+        target_attname,
+    )
+    target_pk_field = field.remote_field.model._meta.pk
+    for source_pk, target_pk in links:
+        values_by_pk.setdefault(source_pk, []).append(
+            _get_field_value(target_pk_field, target_pk),
+        )
+    return values_by_pk
+
+
+def get_dump_mark_line(mark: DumpMark) -> bytes:
+    data, = serializers.serialize('python', [mark])
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode() + b'\n'
+
+
+def read_dump_mark(stream: Iterable[bytes]) -> Optional[Dict[str, Any]]:
+    """
+    Поля отметки из первой строки выгрузки или None,
+    если выгрузка сделана без неё.
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        data = json.loads(line)
+        if (
+                not isinstance(data, dict)
+                or data.get('model') != DumpMark._meta.label_lower
+        ):
+            return None
+        return data['fields']
+    return None
+
+
+def write_dump(
+        stream: IO[bytes],
+        dumped_models: Iterable[Type[models.Model]],
+        chunk_size: int = CHUNK_SIZE,
+        on_progress: Optional[Callable[[Type[models.Model], int, bool], None]] = None,  # noqa
+        mark: Optional[DumpMark] = None,
+) -> int:
+    """
+    Пишет выгрузку моделей (после отметки `mark`, если
+    она есть) в поток и возвращает число выгруженных
+    объектов. `on_progress(model, dumped, finished)`
+    вызывается после каждой порции и в конце выгрузки
+    модели.
+    """
+    if mark is not None:
+        stream.write(get_dump_mark_line(mark))
+    dumped_count = 0
+    for model in dumped_models:
+        model_dumped_count = 0
+        for chunk_count, chunk_lines in iter_model_lines(model, chunk_size):
+            stream.write(chunk_lines)
+            model_dumped_count += chunk_count
+            if on_progress is not None:
+                on_progress(model, model_dumped_count, False)
+        if on_progress is not None:
+            on_progress(model, model_dumped_count, True)
+        dumped_count += model_dumped_count
+
+    return dumped_count
+
+
+def _to_pks(model: Type[models.Model], raw_pks: Iterable[str]) -> List[Any]:
+    pk_field = model._meta.pk
+    return sorted(pk_field.to_python(raw_pk) for raw_pk in raw_pks)
+
+
+def write_delta_dump(
+        stream: IO[bytes],
+        changes: Dict[str, Set[str]],
+        mark: DumpMark,
+        dumped_models: Iterable[Type[models.Model]],
+        chunk_size: int = CHUNK_SIZE,
+        on_progress: Optional[Callable[[Type[models.Model], int, bool], None]] = None,  # noqa
+) -> int:
+    """
+    Пишет инкрементальную выгрузку объектов из `changes`
+    (см. `core.changelog.get_changes`) после отметки
+    `mark` и возвращает число выгруженных объектов,
+    включая удалённые.
+    """
+    stream.write(get_dump_mark_line(mark))
+    changed_models = sort_by_dependencies(
+        model
+        for model in dumped_models
+        if model._meta.label_lower in changes
+    )
+
+    existing_pks: Dict[Type[models.Model], List[Any]] = {}
+    deleted_lines: List[bytes] = []
+    # зависимые модели удаляются раньше тех, на которые
+    # они ссылаются
+    for model in reversed(changed_models):
+        pks = _to_pks(model, changes[model._meta.label_lower])
+        model_existing_pks: List[Any] = []
+        for chunk_start in range(0, len(pks), chunk_size):
+            model_existing_pks.extend(model._default_manager.filter(
+                pk__in=pks[chunk_start:chunk_start + chunk_size],
+            ).order_by(
+                'pk',
+            ).values_list(
+                'pk',
+                flat=True,
+            ))
+        existing_pks[model] = model_existing_pks
+
+        pk_field = model._meta.pk
+        deleted_lines.extend(
+            json.dumps(
+                {
+                    'model': model._meta.label_lower,
+                    'pk': _get_field_value(pk_field, pk),
+                    DELETED_KEY: True,
+                },
+                cls=DjangoJSONEncoder,
+                ensure_ascii=False,
+                separators=(',', ':'),
+            ).encode() + b'\n'
+            for pk in sorted(set(pks) - set(model_existing_pks))
+        )
+    stream.write(b''.join(deleted_lines))
+    dumped_count = len(deleted_lines)
+
+    for model in changed_models:
+        pks = existing_pks[model]
+        model_dumped_count = 0
+        for chunk_start in range(0, len(pks), chunk_size):
+            queryset = model._default_manager.filter(
+                pk__in=pks[chunk_start:chunk_start + chunk_size],
+            )
+            for chunk_count, chunk_lines in iter_model_lines(
+                    model,
+                    chunk_size,
+                    queryset,
+            ):
+                stream.write(chunk_lines)
+                model_dumped_count += chunk_count
+                if on_progress is not None:
+                    on_progress(model, model_dumped_count, False)
+        if on_progress is not None:
+            on_progress(model, model_dumped_count, True)
+        dumped_count += model_dumped_count
+
+    return dumped_count
+
+
+class _BytesCollector:
+    """
+    Файловый объект, в который пишет сжимающий поток:
+    накопленные байты забираются `pop` и отдаются клиенту
+    по мере выгрузки.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        # сжимающие потоки закрывают файл, но собранные
+        # байты ещё нужны
+        pass
+
+    def __enter__(self) -> '_BytesCollector':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_dump(
+        dumped_models: Iterable[Type[models.Model]],
+        compression: str,
+        level: Optional[int] = None,
+        chunk_size: int = CHUNK_SIZE,
+        mark: Optional[DumpMark] = None,
+) -> Iterator[bytes]:
+    """
+    Сжатая выгрузка моделей по частям: части отдаются
+    по мере чтения таблиц, так что ни выгрузка, ни архив
+    в памяти целиком не собираются.
+    """
+    collector = _BytesCollector()
+    with open_dump(collector, compression, level) as stream:
+        if mark is not None:
+            stream.write(get_dump_mark_line(mark))
+        for model in dumped_models:
+            for _, chunk_lines in iter_model_lines(model, chunk_size):
+                stream.write(chunk_lines)
+                compressed_chunk = collector.pop()
+                if compressed_chunk:
+                    yield compressed_chunk
+    # конец архива записывается при закрытии потока
+    yield collector.pop()
+
+
+def iter_delta_dump(
+        changes: Dict[str, Set[str]],
+        mark: DumpMark,
+        dumped_models: Iterable[Type[models.Model]],
+        compression: str,
+        level: Optional[int] = None,
+        chunk_size: int = CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Сжатая инкрементальная выгрузка. Она невелика, поэтому
+    собирается целиком, но в памяти, а не в файле.
+    """
+    collector = _BytesCollector()
+    with open_dump(collector, compression, level) as stream:
+        write_delta_dump(stream, changes, mark, dumped_models, chunk_size)
+    yield collector.pop()
+
+
+def _delete_objects(
+        deleted_pks: Dict[Type[models.Model], List[Any]],
+        using: str,
+) -> None:
+    for model in reversed(sort_by_dependencies(deleted_pks)):
+        pks = set(deleted_pks[model])
+        manager = model._base_manager.db_manager(using)
+        self_fields = [
+            field
+            for field in model._meta.concrete_model._meta.fields
+            if field.remote_field is not None
+            and field.remote_field.model._meta.concrete_model is model._meta.concrete_model  # noqa
+        ]
+        while pks:
+            # в дереве сначала удаляются листья (ссылка на
+            # родителя может быть PROTECT)
+            referenced_pks = {
+                pk
+                for field in self_fields
+                for pk in manager.filter(**{
+                    f'{field.attname}__in': pks,
+                }).values_list(
+                    field.attname,
+                    flat=True,
+                )
+            }
+            leaf_pks = (pks - referenced_pks) or pks
+            manager.filter(pk__in=leaf_pks).delete()
+            pks -= leaf_pks
+
+
+def _check_delta_base(mark_fields: Dict[str, Any], using: str) -> None:
+    loaded_mark = DumpMark._base_manager.db_manager(using).filter(
+        pk=DUMP_MARK_PK,
+    ).first()
+    loaded_dump_id = (
+        str(loaded_mark.dump_id) if loaded_mark is not None else None
+    )
+    if mark_fields['base_id'] != loaded_dump_id:
+        raise ValueError(
+            f'The incremental dump follows dump {mark_fields["base_id"]}, '
+            f'but dump {loaded_dump_id} is loaded',
+        )
+
+
+def apply_delta(
+        stream: Iterable[bytes],
+        using: str = DEFAULT_DB_ALIAS,
+) -> Tuple[int, int]:
+    """
+    Применяет инкрементальную выгрузку и возвращает
+    (число удалённых, число сохранённых объектов). Как
+    и `loaddata`, сохраняет объекты с отключенной
+    проверкой ограничений и проверяет их в конце.
+
+    Выгрузка должна быть сделана после той, что
+    загружена в БД (по отметкам выгрузок), иначе
+    выбрасывается ValueError; её отметка сохраняется.
+    """
+    connection = connections[using]
+    deleted_pks: Dict[Type[models.Model], List[Any]] = {}
+    deleted_count = saved_count = 0
+    saved_models: Set[Type[models.Model]] = set()
+    mark_label = DumpMark._meta.label_lower
+    is_mark_checked = False
+
+    with atomic(using=using):
+        with connection.constraint_checks_disabled():
+            objects_with_deferred_fields = []
+            for line in stream:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+
+                if not is_mark_checked:
+                    if data.get('model') != mark_label:
+                        raise ValueError(
+                            'Not an incremental dump: no dump mark',
+                        )
+                    _check_delta_base(data['fields'], using)
+                    is_mark_checked = True
+                    # отметка сохраняется, но объектом не считается
+                    for deserialized_object in PythonDeserializer(
+                            [data],
+                            using=using,
+                    ):
+                        deserialized_object.save(using=using)
+                    continue
+
+                if data.get(DELETED_KEY):
+                    model = apps.get_model(data['model'])
+                    deleted_pks.setdefault(model, []).append(
+                        model._meta.pk.to_python(data['pk']),
+                    )
+                    deleted_count += 1
+                    continue
+
+                # удалённые объекты записаны в начале выгрузки
+                if deleted_pks:
+                    _delete_objects(deleted_pks, using)
+                    deleted_pks = {}
+
+                for deserialized_object in PythonDeserializer(
+                        [data],
+                        using=using,
+                        handle_forward_references=True,
+                ):
+                    deserialized_object.save(using=using)
+                    saved_models.add(type(deserialized_object.object))
+                    saved_count += 1
+                    if deserialized_object.deferred_fields:
+                        objects_with_deferred_fields.append(
+                            deserialized_object,
+                        )
+
+            if deleted_pks:
+                _delete_objects(deleted_pks, using)
+            for deserialized_object in objects_with_deferred_fields:
+                deserialized_object.save_deferred_fields(using=using)
+
+        connection.check_constraints(table_names=[
+            model._meta.db_table
+            for model in saved_models
+        ])
+
+    return deleted_count, saved_count
+
+
+def get_dumped_tables(
+        dumped_models: Iterable[Type[models.Model]],
+) -> List[str]:
+    # вместе с таблицами связей многие-ко-многим
+    tables: List[str] = []
+    for model in dumped_models:
+        tables.append(model._meta.db_table)
+        for field in model._meta.local_many_to_many:
+            through = field.remote_field.through
+            if through._meta.auto_created:
+                tables.append(through._meta.db_table)
+    return tables
+
+
+def clear_dumped_tables(
+        dumped_models: Iterable[Type[models.Model]],
+        using: str = DEFAULT_DB_ALIAS,
+) -> None:
+    """
+    Очищает таблицы выгружаемых моделей (как `flush`, но
+    не трогая служебные таблицы `core`). Используется
+    DELETE, а не TRUNCATE, как у `flush`: TRUNCATE в MySQL
+    сразу фиксирует транзакцию, а очистка должна
+    откатываться вместе с неудавшейся загрузкой.
+    """
+    connection = connections[using]
+    # таблицы очищаются в любом порядке, поэтому ссылки
+    # проверяются только в конце транзакции
+    with connection.constraint_checks_disabled(), atomic(using=using):
+        with connection.cursor() as cursor:
+            for table in get_dumped_tables(dumped_models):
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(table)}',
+                )
+
+
+def _bulk_save(
+        model: Type[models.Model],
+        batch: List[Dict[str, Any]],
+        using: str,
+) -> None:
+    deserialized_objects = list(PythonDeserializer(batch, using=using))
+    objects = [
+        deserialized_object.object
+        for deserialized_object in deserialized_objects
+    ]
+    manager = model._base_manager.db_manager(using)
+    if model._meta.parents:
+        # `bulk_create` не умеет наследование с таблицами
+        for obj in objects:
+            models.Model.save_base(obj, using=using, raw=True)
+    else:
+        manager.bulk_create(objects, batch_size=CHUNK_SIZE)
+
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        if not through._meta.auto_created:
+            continue
+        source_attname = through._meta.get_field(
+            field.m2m_field_name(),
+        ).attname
+        target_attname = through._meta.get_field(
+            field.m2m_reverse_field_name(),
+        ).attname
+        through._base_manager.db_manager(using).bulk_create(
+            [
+                through(**{
+                    source_attname: deserialized_object.object.pk,
+                    target_attname: related_pk,
+                })
+                for deserialized_object in deserialized_objects
+                for related_pk in deserialized_object.m2m_data.get(
+                    field.name,
+                    (),
+                )
+            ],
+            batch_size=CHUNK_SIZE,
+        )
+
+
+def bulk_load_dump(
+        stream: Iterable[bytes],
+        using: str = DEFAULT_DB_ALIAS,
+        batch_size: int = CHUNK_SIZE,
+        on_progress: Optional[Callable[[Type[models.Model], int, bool], None]] = None,  # noqa
+) -> int:
+    """
+    Загружает полную выгрузку в пустые таблицы и
+    возвращает число объектов. В отличие от `loaddata`,
+    объекты сохраняются не по одному, а порциями по
+    `batch_size` через `bulk_create` (без сигналов), так
+    что загрузка быстрее в десятки раз.
+
+    Ограничения внешних ключей проверяются один раз в
+    конце; последовательности первичных ключей
+    сдвигаются за загруженные значения. Деревья MPTT
+    загружаются как есть, пересчитывать их -- дело
+    вызывающего кода (`restore`).
+    """
+    connection = connections[using]
+    loaded_count = 0
+    model_count = 0
+    loaded_models: List[Type[models.Model]] = []
+    batch: List[Dict[str, Any]] = []
+    batch_model: Optional[Type[models.Model]] = None
+    models_by_label: Dict[str, Type[models.Model]] = {}
+
+    def flush_batch(finished: bool) -> None:
+        nonlocal batch, loaded_count, model_count
+        if batch_model is None:
+            return
+        if batch:
+            _bulk_save(batch_model, batch, using)
+            loaded_count += len(batch)
+            model_count += len(batch)
+            batch = []
+        if on_progress is not None:
+            on_progress(batch_model, model_count, finished)
+
+    with atomic(using=using):
+        with connection.constraint_checks_disabled():
+            for line in stream:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                model_label = data['model']
+                model = models_by_label.get(model_label)
+                if model is None:
+                    model = models_by_label[model_label] = apps.get_model(
+                        model_label,
+                    )
+                if model is not batch_model:
+                    # выгрузка идёт по моделям, поэтому смена
+                    # модели -- конец её объектов
+                    flush_batch(finished=True)
+                    batch_model = model
+                    model_count = 0
+                    if model not in loaded_models:
+                        loaded_models.append(model)
+                batch.append(data)
+                if len(batch) >= batch_size:
+                    flush_batch(finished=False)
+            flush_batch(finished=True)
+
+        connection.check_constraints(table_names=get_dumped_tables(
+            loaded_models,
+        ))
+
+        sequence_sql = connection.ops.sequence_reset_sql(
+            no_style(),
+            loaded_models,
+        )
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+
+    return loaded_count
@@ -0,0 +1,8 @@
+from django.db.models import TextChoices
+
+
+class JobStatusEnum(TextChoices):
+    PENDING = ('pending', 'Ожидает')
+    RUNNING = ('running', 'Выполняется')
+    DONE = ('done', 'Выполнена')
+    FAILED = ('failed', 'Завершилась с ошибкой')
@@ -163,7 +163,7 @@ def numpy_interp(
     dest_values = []
     for dest_arg in dest_args:
         while True:
-            if interval_idx >= len(scales)-1 or dest_arg <= source_args[interval_idx+1]:
+            if interval_idx >= len(scales)-1 or dest_arg <= source_pairs[interval_idx+1][0]:
                 break
             interval_idx += 1
         dest_values.append(scales[interval_idx]*dest_arg + offsets[interval_idx])
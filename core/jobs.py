@@ -0,0 +1,175 @@
+"""
+Фоновая очередь задач без внешнего брокера: задачи --
+строки таблицы `Job`, их выполняет команда `run_jobs`
+(один или несколько процессов-обработчиков).
+
+Задача -- вызов команды управления, поэтому в очередь
+ставится всё, что умеют команды: выгрузка
+(`gzip_dumpdata`), восстановление (`restore`), импорт
+(`import-sugar-csv`). Веб-запрос только ставит задачу и
+потом спрашивает её состояние.
+
+Если обработчик упал во время выполнения задачи, она
+остаётся выполняемой; такие задачи через JOB_TIMEOUT
+секунд после начала помечаются проваленными
+(`fail_stale_jobs`) и не мешают ставить новые.
+"""
+import io
+import traceback
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import (
+    Any,
+    Dict,
+    Optional,
+)
+
+from django.conf import (
+    settings,
+)
+from django.core.management import (
+    call_command,
+)
+from django.db.models import (
+    Q,
+    QuerySet,
+)
+from django.utils import (
+    timezone,
+)
+
+from core.enums import (
+    JobStatusEnum,
+)
+from core.models import (
+    Job,
+)
+
+# сколько ожидающих задач пробовать занять за раз, если
+# их одновременно разбирают другие обработчики
+CLAIM_CANDIDATES_COUNT = 10
+
+
+def enqueue_job(
+        command: str,
+        context: Optional[Dict[str, Any]] = None,
+        **options: Any,
+) -> Job:
+    """
+    Ставит в очередь `call_command(command, **options)`;
+    параметры должны сериализоваться в JSON.
+    """
+    return Job.objects.create(
+        command=command,
+        options=options,
+        context=context or {},
+    )
+
+
+def get_stale_started_at() -> datetime:
+    """
+    Задачи, начатые раньше этого момента и всё ещё
+    выполняемые, считаются брошенными.
+    """
+    return timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+
+
+def get_active_jobs() -> QuerySet:
+    """
+    Ожидающие и выполняемые (не брошенные) задачи.
+    """
+    return Job.objects.filter(
+        Q(status=JobStatusEnum.PENDING)
+        | Q(
+            status=JobStatusEnum.RUNNING,
+            started_at__gte=get_stale_started_at(),
+        ),
+    )
+
+
+def fail_stale_jobs() -> int:
+    """
+    Помечает брошенные задачи проваленными; возвращает их
+    количество. Если задача на самом деле ещё выполняется,
+    по завершении она получит свой настоящий статус.
+    """
+    return Job.objects.filter(
+        status=JobStatusEnum.RUNNING,
+        started_at__lt=get_stale_started_at(),
+    ).update(
+        status=JobStatusEnum.FAILED,
+        output=(
+            f'The job is not finished in {settings.JOB_TIMEOUT} seconds, '
+            f'its worker has probably crashed'
+        ),
+        finished_at=timezone.now(),
+    )
+
+
+def claim_next_job() -> Optional[Job]:
+    """
+    Занимает самую раннюю ожидающую задачу. Задача
+    занимается условным UPDATE, поэтому несколько
+    обработчиков не возьмут одну задачу дважды, а
+    блокировки строк (`select_for_update`), которых нет в
+    SQLite, не нужны.
+    """
+    pending_job_ids = Job.objects.filter(
+        status=JobStatusEnum.PENDING,
+    ).order_by(
+        'id',
+    ).values_list(
+        'id',
+        flat=True,
+    )[:CLAIM_CANDIDATES_COUNT]
+
+    for job_id in pending_job_ids:
+        claimed = Job.objects.filter(
+            id=job_id,
+            status=JobStatusEnum.PENDING,
+        ).update(
+            status=JobStatusEnum.RUNNING,
+            started_at=timezone.now(),
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+
+    return None
+
+
+def run_job(job: Job) -> Job:
+    output = io.StringIO()
+    try:
+        call_command(
+            job.command,
+            stdout=output,
+            stderr=output,
+            **job.options,
+        )
+    except Exception:
+        job.status = JobStatusEnum.FAILED
+        output.write(traceback.format_exc())
+    else:
+        job.status = JobStatusEnum.DONE
+
+    job.output = output.getvalue()
+    job.finished_at = timezone.now()
+    job.save(update_fields=('status', 'output', 'finished_at'))
+    return job
+
+
+def run_pending_jobs(max_jobs: Optional[int] = None) -> int:
+    """
+    Выполняет ожидающие задачи, пока они есть (не больше
+    `max_jobs`); возвращает количество выполненных.
+    """
+    done_count = 0
+    while max_jobs is None or done_count < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        done_count += 1
+    return done_count
@@ -1,23 +1,41 @@
-import gzip
-import os.path
+import os
 
 from datetime import datetime
 
+from django.apps import (
+    apps,
+)
 from django.conf import (
     settings,
 )
 from django.core.management import (
     BaseCommand,
-    call_command,
-)
-from django.core.management.commands.dumpdata import (
-    Command as DumpDataCommand,
+    CommandError,
 )
 
+from core.changelog import (
+    anchor_dump,
+    get_changes,
+    get_last_entry_id,
+    new_dump_mark,
+)
+from core.dumps import (
+    CHUNK_SIZE,
+    COMPRESSIONS,
+    get_dump_extension,
+    get_dumped_models,
+    open_dump,
+    write_delta_dump,
+    write_dump,
+)
 from core.helpers import (
     get_datetime_display,
+    track_time,
     with_server_timezone,
 )
+from core.split_dumps import (
+    write_split_dump,
+)
 
 from main.helpers import (
     get_data_model_version,
@@ -26,9 +44,14 @@ from main.helpers import (
 
 class Command(BaseCommand):
     help = (
-        'Создаёт сжатый файл данных в заданном '
-        'формате, с указанием версии модели '
-        'данных.'
+        'Создаёт сжатый файл данных в формате JSON Lines '
+        '(читается `loaddata` и командой `restore`), с '
+        'указанием версии модели данных. Таблицы читаются '
+        'порциями, так что память не зависит от объёма '
+        'данных. С --incremental выгружает только объекты, '
+        'изменённые после предыдущей выгрузки, с --split -- '
+        'каталог с файлом на модель и манифестом (модели '
+        'выгружаются в нескольких процессах).'
     )
 
     def add_arguments(self, parser):
@@ -39,20 +62,92 @@ class Command(BaseCommand):
             dest='filename',
             help='Имя файла, в который производить сохранение',
         )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help=(
+                'Выгрузить только изменения после предыдущей выгрузки '
+                '(полной без -e или инкрементальной); '
+                'восстанавливается командой `restore` вместе с '
+                'полной выгрузкой'
+            ),
+        )
+        parser.add_argument(
+            '--split',
+            action='store_true',
+            help=(
+                'Выгрузить в каталог: у каждой модели свой файл, '
+                'версия модели данных, число объектов и '
+                'контрольные суммы -- в manifest.json'
+            ),
+        )
+        parser.add_argument(
+            '-j',
+            '--jobs',
+            default=None,
+            type=int,
+            help=(
+                'Сколько процессов выгружают модели с --split '
+                '(по умолчанию -- число процессоров)'
+            ),
+        )
+        parser.add_argument(
+            '--compression',
+            default='gzip',
+            choices=sorted(COMPRESSIONS),
+            help=(
+                'Способ сжатия (zstd и lz4 -- если установлены '
+                'пакеты zstandard и lz4)'
+            ),
+        )
+        parser.add_argument(
+            '--compression-level',
+            default=None,
+            type=int,
+            dest='compression_level',
+            help='Уровень сжатия (по умолчанию -- свой для способа сжатия)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            default=CHUNK_SIZE,
+            type=int,
+            dest='chunk_size',
+            help='Сколько объектов читать из БД за раз',
+        )
+        parser.add_argument(
+            '-e',
+            '--exclude',
+            default=[],
+            action='append',
+            dest='excludes',
+            help=(
+                'Не выгружать приложение (app_label) или модель '
+                '(app_label.ModelName), можно указать несколько раз'
+            ),
+        )
 
     @classmethod
-    def generate_filename(cls):
+    def generate_filename(
+            cls,
+            compression='gzip',
+            incremental=False,
+            split=False,
+    ):
         data_model_version = get_data_model_version()
         today_display = get_datetime_display(
             with_server_timezone(datetime.now()),
             fmt='%Y-%m-%d_%H-%M-%S',
         )
-        filename = '{prefix}-{date}-v{version}.json.gz'.format(
+        filename = '{prefix}-{date}-v{version}{kind}'.format(
             prefix='pocketbook',
             date=today_display,
             version=data_model_version,
+            kind='-delta' if incremental else '',
         )
-        return filename
+        if split:
+            # каталог
+            return filename
+        return f'{filename}.{get_dump_extension(compression)}'
 
     @staticmethod
     def get_filepath(filename):
@@ -61,17 +156,123 @@ class Command(BaseCommand):
             filename,
         )
 
-    def handle(self, filename, *args, **options):
+    def write_split_dump(
+            self,
+            directory,
+            dumped_models,
+            compression,
+            compression_level,
+            chunk_size,
+            jobs,
+            verbosity,
+            mark,
+    ):
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        jobs = min(jobs, len(dumped_models))
+
+        def on_model_done(entry):
+            if verbosity >= 1:
+                model = apps.get_model(entry['model'])
+                self.stdout.write(
+                    f'{model._meta.label}: {entry["count"]} objects',
+                )
+
+        manifest = write_split_dump(
+            directory,
+            dumped_models,
+            compression,
+            compression_level,
+            chunk_size,
+            jobs,
+            on_model_done,
+            mark,
+        )
+        return sum(entry['count'] for entry in manifest['models'])
+
+    def handle(
+            self,
+            filename,
+            incremental,
+            split,
+            jobs,
+            compression,
+            compression_level,
+            chunk_size,
+            excludes,
+            *args,
+            verbosity,
+            **options,
+    ):
+        if split and incremental:
+            raise CommandError('--split dumps can not be incremental')
         if filename is None:
-            filename = self.generate_filename()
+            filename = self.generate_filename(compression, incremental, split)
+
+        dumped_models = get_dumped_models(excludes)
+
+        def on_progress(model, dumped_count, finished):
+            if finished and verbosity >= 1:
+                self.stdout.write(
+                    f'{model._meta.label}: {dumped_count} objects',
+                )
+            elif not finished and verbosity >= 2:
+                self.stdout.write(
+                    f'{model._meta.label}: {dumped_count} objects...',
+                )
+
+        # Изменения, сделанные во время выгрузки, остаются
+        # в журнале и попадут в следующую выгрузку.
+        last_entry_id = get_last_entry_id()
+        mark = new_dump_mark(incremental)
 
         output_filepath = self.get_filepath(filename)
-        output_stream = gzip.open(output_filepath, 'wt')
-        dumpdata = DumpDataCommand(
-            stdout=output_stream,
-        )
-        call_command(
-            command_name=dumpdata,
-            format='json',
-        )
-        output_stream.close()
+        if split:
+            with track_time() as tracker:
+                dumped_count = self.write_split_dump(
+                    output_filepath,
+                    dumped_models,
+                    compression,
+                    compression_level,
+                    chunk_size,
+                    jobs,
+                    verbosity,
+                    mark,
+                )
+        else:
+            with track_time() as tracker, open_dump(
+                    output_filepath,
+                    compression,
+                    compression_level,
+            ) as output_stream:
+                if incremental:
+                    dumped_count = write_delta_dump(
+                        output_stream,
+                        get_changes(last_entry_id),
+                        mark,
+                        dumped_models,
+                        chunk_size,
+                        on_progress,
+                    )
+                else:
+                    dumped_count = write_dump(
+                        output_stream,
+                        dumped_models,
+                        chunk_size,
+                        on_progress,
+                        mark,
+                    )
+
+        # Выгрузка без части моделей (-e) -- не точка
+        # отсчёта: изменения исключённых моделей иначе не
+        # попали бы ни в одну выгрузку.
+        if incremental or not excludes:
+            anchor_dump(mark, dumped_models, last_entry_id, incremental)
+
+        if verbosity >= 1:
+            elapsed_time = tracker.elapsed_time
+            self.stdout.write(
+                f'{dumped_count} objects are dumped to {output_filepath} '
+                f'in {elapsed_time:.1f}s '
+                f'({dumped_count / (elapsed_time or 1):.0f} objects/s)',
+            )
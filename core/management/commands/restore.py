@@ -1,8 +1,21 @@
+import os
+from contextlib import (
+    nullcontext,
+)
+from typing import (
+    List,
+    Optional,
+)
+
+from django.apps import (
+    apps,
+)
 from django.contrib.contenttypes.models import (
     ContentType,
 )
 from django.core.management import (
     BaseCommand,
+    CommandError,
     CommandParser,
     call_command,
 )
@@ -10,14 +23,102 @@ from django.core.management.commands.migrate import (
     Command as MigrateCommand,
 )
 from django.core.management.commands.loaddata import (
-    Command as LoadDataCommand,
+    Command as DjangoLoadDataCommand,
+)
+from django.db import (
+    connection,
+)
+from django.db.transaction import (
+    atomic,
+)
+
+from mptt.models import (
+    MPTTModel,
+)
+
+from core.changelog import (
+    DUMP_MARK_PK,
+    bump_changes_version,
+    clear_changes,
+)
+from core.dumps import (
+    CHUNK_SIZE,
+    COMPRESSIONS,
+    DUMP_FORMAT,
+    apply_delta,
+    bulk_load_dump,
+    clear_dumped_tables,
+    get_dumped_models,
+    open_dump,
+    parse_dump_compression,
+    read_dump_mark,
+)
+from core.helpers import (
+    track_time,
 )
+from core.models import (
+    DumpMark,
+)
+from core.signals import (
+    data_restored,
+    deltas_applied,
+)
+from core.split_dumps import (
+    check_split_dump,
+    is_split_dump,
+    load_split_dump,
+    read_manifest,
+)
+
+from main.helpers import (
+    get_data_model_version,
+)
+
+
+class LoadDataCommand(DjangoLoadDataCommand):
+    """
+    `loaddata`, который читает и выгрузки, сжатые zstd
+    и lz4 (если установлены соответствующие пакеты).
+    """
+
+    # `loaddata` заполняет словарь форматов сжатия при
+    # каждом запуске, поэтому дополняем его при записи.
+    @property
+    def compression_formats(self):
+        return self._compression_formats
+
+    @compression_formats.setter
+    def compression_formats(self, value):
+        self._compression_formats = {
+            **value,
+            **{
+                compression.extension: (
+                    lambda path, mode, compression=compression: (
+                        compression.open_for_reading(path)
+                    ),
+                    'rb',
+                )
+                for compression in COMPRESSIONS.values()
+                if compression.extension not in value
+            },
+        }
 
 
 class Command(BaseCommand):
     help: str = (
         'Равносильно последовательному выполнению '
-        'команд `migrate` и `loaddata`.'
+        'команд `migrate` и `loaddata`. Если после полной '
+        'выгрузки указаны инкрементальные '
+        '(`gzip_dumpdata --incremental`), они применяются '
+        'по порядку, если каждая сделана после предыдущей '
+        'выгрузки. С --fast данные загружаются не '
+        '`loaddata`, а порциями через `bulk_create`. Каталог '
+        'выгрузки по моделям (`gzip_dumpdata --split`) '
+        'загружается так же. Таблицы очищаются и '
+        'загружаются в одной транзакции, так что неудачная '
+        'загрузка их не меняет; исключение -- загрузка '
+        'выгрузки по моделям в нескольких процессах '
+        '(-j больше 1, только с --force).'
     )
 
     def __init__(self, *args, **kwargs) -> None:
@@ -29,11 +130,88 @@ class Command(BaseCommand):
         parser.add_argument(
             'path_to_data',
         )
+        parser.add_argument(
+            'paths_to_deltas',
+            nargs='*',
+        )
+        parser.add_argument(
+            '--fast',
+            action='store_true',
+            help=(
+                'Очистить таблицы и загрузить полную выгрузку '
+                '(только JSON Lines, см. `gzip_dumpdata`) порциями '
+                'через `bulk_create`, а не по объекту'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=CHUNK_SIZE,
+            type=int,
+            dest='batch_size',
+            help='Сколько объектов сохранять за раз (с --fast)',
+        )
+        parser.add_argument(
+            '-j',
+            '--jobs',
+            default=1,
+            type=int,
+            help=(
+                'Сколько процессов загружают модели выгрузки по '
+                'моделям (0 -- число процессоров)'
+            ),
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help=(
+                'Разрешить загрузку в нескольких процессах (-j): '
+                'каждая модель загружается в своей транзакции, '
+                'поэтому при ошибке таблицы останутся очищенными '
+                'или загруженными частично'
+            ),
+        )
 
-    def handle(self, path_to_data: str, **kw) -> None:
+    def handle(
+            self,
+            path_to_data: str,
+            paths_to_deltas: List[str],
+            fast: bool,
+            batch_size: int,
+            jobs: int,
+            force: bool,
+            verbosity: int,
+            **kw,
+    ) -> None:
         self._do_migrate()
-        self._clean_contenttypes()
-        self._do_load_data(path_to_data)
+        if paths_to_deltas:
+            # до загрузки, чтобы не менять таблицы зря
+            self._check_deltas(path_to_data, paths_to_deltas)
+        if os.path.isdir(path_to_data):
+            fast = True
+            self._do_split_load(
+                path_to_data,
+                batch_size,
+                jobs,
+                force,
+                verbosity,
+            )
+        elif fast:
+            self._do_bulk_load(path_to_data, batch_size, verbosity)
+        else:
+            self._clean_contenttypes()
+            self._do_load_data(path_to_data)
+        if paths_to_deltas:
+            self._apply_deltas(paths_to_deltas)
+        if fast or paths_to_deltas:
+            self._rebuild_trees()
+        if paths_to_deltas:
+            deltas_applied.send(sender=self.__class__)
+        # восстановленные данные -- новая точка отсчёта
+        # для инкрементальных выгрузок (загрузка не отправляет
+        # сигналов, поэтому сохранённая выгрузка устаревает здесь)
+        clear_changes()
+        bump_changes_version()
+        data_restored.send(sender=self.__class__)
 
     def _do_migrate(self) -> None:
         migrate_command = MigrateCommand(
@@ -49,6 +227,8 @@ class Command(BaseCommand):
         ContentType.objects.all().delete()
 
     def _do_load_data(self, path_to_data: str) -> None:
+        # в выгрузке своя отметка (или её нет)
+        DumpMark.objects.all().delete()
         load_data_command = LoadDataCommand(
             stdout=self.stdout,
             stderr=self.stderr,
@@ -58,3 +238,186 @@ class Command(BaseCommand):
             path_to_data,
             verbosity=3,
         )
+
+    def _do_bulk_load(
+            self,
+            path_to_data: str,
+            batch_size: int,
+            verbosity: int,
+    ) -> None:
+        compression = parse_dump_compression(path_to_data)
+        extension = COMPRESSIONS[compression].extension
+        dump_suffix = f'.{DUMP_FORMAT}' + (
+            f'.{extension}' if extension is not None else ''
+        )
+        if not path_to_data.endswith(dump_suffix):
+            raise CommandError(
+                f'--fast restores only {DUMP_FORMAT} dumps '
+                f'(*{dump_suffix}), got {path_to_data}',
+            )
+
+        def on_progress(model, loaded_count, finished):
+            if finished and verbosity >= 1:
+                self.stdout.write(
+                    f'{model._meta.label}: {loaded_count} objects\n',
+                )
+
+        with track_time() as tracker:
+            with open_dump(
+                    path_to_data,
+                    compression,
+                    mode='rb',
+            ) as input_stream, atomic():
+                # `migrate` заполняет типы содержимого и права
+                # -- они, как и остальное, берутся из выгрузки
+                clear_dumped_tables([*get_dumped_models(), DumpMark])
+                loaded_count = bulk_load_dump(
+                    input_stream,
+                    batch_size=batch_size,
+                    on_progress=on_progress,
+                )
+        self.stdout.write(
+            f'Installed {loaded_count} object(s) from {path_to_data} '
+            f'in {tracker.elapsed_time:.1f}s\n',
+        )
+
+    def _do_split_load(
+            self,
+            path_to_data: str,
+            batch_size: int,
+            jobs: int,
+            force: bool,
+            verbosity: int,
+    ) -> None:
+        if not is_split_dump(path_to_data):
+            raise CommandError(
+                f'{path_to_data} is not a split dump '
+                f'(`gzip_dumpdata --split`): no manifest',
+            )
+        manifest = read_manifest(path_to_data)
+        data_model_version = get_data_model_version()
+        if manifest['data_model_version'] != data_model_version:
+            self.stderr.write(
+                f'Dump data model version '
+                f'{manifest["data_model_version"]} differs from '
+                f'the current one {data_model_version}\n',
+            )
+        # до очистки таблиц
+        check_split_dump(path_to_data, manifest)
+
+        if not jobs:
+            jobs = os.cpu_count() or 1
+        if connection.vendor == 'sqlite':
+            # SQLite допускает одну пишущую транзакцию:
+            # остальные процессы ждали бы её и падали бы с
+            # "database is locked"
+            jobs = 1
+        if jobs > 1 and not force:
+            raise CommandError(
+                f'Loading in {jobs} processes is not atomic: if it fails, '
+                f'the tables are left empty or partially loaded. '
+                f'Use --force to load anyway or -j 1 to load in '
+                f'one transaction',
+            )
+
+        def on_model_done(label, loaded_count):
+            if verbosity >= 1:
+                model = apps.get_model(label)
+                self.stdout.write(
+                    f'{model._meta.label}: {loaded_count} objects\n',
+                )
+
+        with track_time() as tracker:
+            # процессы пула не видят незафиксированных данных,
+            # поэтому общая транзакция -- только для одного
+            with atomic() if jobs == 1 else nullcontext():
+                clear_dumped_tables([*get_dumped_models(), DumpMark])
+                loaded_count = load_split_dump(
+                    path_to_data,
+                    manifest,
+                    batch_size,
+                    jobs,
+                    on_model_done,
+                )
+                if manifest.get('dump_id') is not None:
+                    DumpMark.objects.create(
+                        pk=DUMP_MARK_PK,
+                        dump_id=manifest['dump_id'],
+                    )
+        self.stdout.write(
+            f'Installed {loaded_count} object(s) from {path_to_data} '
+            f'in {tracker.elapsed_time:.1f}s\n',
+        )
+
+    @staticmethod
+    def _read_dump_id(path_to_data: str) -> Optional[str]:
+        if os.path.isdir(path_to_data):
+            if not is_split_dump(path_to_data):
+                return None
+            return read_manifest(path_to_data).get('dump_id')
+        try:
+            with open_dump(
+                    path_to_data,
+                    parse_dump_compression(path_to_data),
+                    mode='rb',
+            ) as input_stream:
+                mark_fields = read_dump_mark(input_stream)
+        except ValueError:
+            # не JSON Lines -- выгрузка без отметки
+            return None
+        return mark_fields['dump_id'] if mark_fields is not None else None
+
+    def _check_deltas(
+            self,
+            path_to_data: str,
+            paths_to_deltas: List[str],
+    ) -> None:
+        """
+        Проверяет, что каждая инкрементальная выгрузка
+        сделана после предыдущей выгрузки (по отметкам).
+        """
+        dump_id = self._read_dump_id(path_to_data)
+        previous_path = path_to_data
+        for path_to_delta in paths_to_deltas:
+            with open_dump(
+                    path_to_delta,
+                    parse_dump_compression(path_to_delta),
+                    mode='rb',
+            ) as delta_stream:
+                mark_fields = read_dump_mark(delta_stream)
+            if mark_fields is None:
+                raise CommandError(
+                    f'{path_to_delta} is not an incremental dump: '
+                    f'no dump mark',
+                )
+            if mark_fields['base_id'] != dump_id:
+                raise CommandError(
+                    f'{path_to_delta} does not follow {previous_path}: '
+                    f'it is made after dump {mark_fields["base_id"]}, '
+                    f'not after {dump_id}',
+                )
+            dump_id = mark_fields['dump_id']
+            previous_path = path_to_delta
+
+    def _apply_deltas(self, paths_to_deltas: List[str]) -> None:
+        for path_to_delta in paths_to_deltas:
+            with open_dump(
+                    path_to_delta,
+                    parse_dump_compression(path_to_delta),
+                    mode='rb',
+            ) as delta_stream:
+                deleted_count, saved_count = apply_delta(delta_stream)
+            self.stdout.write(
+                f'Applied {path_to_delta}: {deleted_count} object(s) '
+                f'deleted, {saved_count} object(s) saved\n',
+            )
+
+    @staticmethod
+    def _rebuild_trees() -> None:
+        # Деревья MPTT сдвигают границы (`lft`, `rght`) других
+        # узлов без сигналов, а `bulk_create` сохраняет их как
+        # есть, поэтому после загрузки их пересчитываем
+        # целиком, один раз.
+        for model in apps.get_models():
+            if issubclass(model, MPTTModel) and not model._meta.proxy:
+                model._tree_manager.rebuild()
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management import (
+    BaseCommand,
+)
+from django.db import (
+    close_old_connections,
+)
+
+from core.jobs import (
+    fail_stale_jobs,
+    run_pending_jobs,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет задачи фоновой очереди (`core.jobs`): '
+        'выгрузки, восстановления и импорты, поставленные '
+        'веб-запросами. Обработчиков можно запустить '
+        'несколько, задача достаётся одному из них.'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить ожидающие задачи и завершиться',
+        )
+        parser.add_argument(
+            '--interval',
+            default=5.,
+            type=float,
+            help='Пауза (в секундах) между проверками пустой очереди',
+        )
+
+    def handle(self, once, interval, *args, verbosity, **options):
+        while True:
+            # задачи упавших обработчиков (в том числе
+            # предыдущего запуска этого)
+            failed_count = fail_stale_jobs()
+            if failed_count and verbosity >= 1:
+                self.stdout.write(
+                    f'{failed_count} stale job(s) are marked as failed',
+                )
+            done_count = run_pending_jobs()
+            if done_count and verbosity >= 1:
+                self.stdout.write(f'{done_count} job(s) are done')
+            if once:
+                break
+            if not done_count:
+                time.sleep(interval)
+            # обработчик работает долго: соединение с БД
+            # могло устареть или оборваться (CONN_MAX_AGE)
+            close_old_connections()
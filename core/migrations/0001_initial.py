@@ -0,0 +1,27 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_label', models.CharField(max_length=100, verbose_name='Модель')),
+                ('object_pk', models.CharField(max_length=64, verbose_name='Первичный ключ объекта')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, verbose_name='Момент изменения')),
+            ],
+            options={
+                'verbose_name': 'Запись журнала изменений',
+                'verbose_name_plural': 'Журнал изменений',
+            },
+        ),
+    ]
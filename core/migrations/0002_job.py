@@ -0,0 +1,32 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('command', models.CharField(max_length=100, verbose_name='Команда')),
+                ('options', models.JSONField(default=dict, verbose_name='Параметры команды')),
+                ('context', models.JSONField(default=dict, verbose_name='Контекст')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('running', 'Выполняется'), ('done', 'Выполнена'), ('failed', 'Завершилась с ошибкой')], default='pending', max_length=7, verbose_name='Состояние')),
+                ('output', models.TextField(blank=True, verbose_name='Вывод команды')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Момент постановки в очередь')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Момент начала')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Момент завершения')),
+            ],
+            options={
+                'verbose_name': 'Фоновая задача',
+                'verbose_name_plural': 'Фоновые задачи',
+                'index_together': {('status', 'id')},
+            },
+        ),
+    ]
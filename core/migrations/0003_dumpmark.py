@@ -0,0 +1,25 @@
+# Generated by Django 3.2.16 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DumpMark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dump_id', models.UUIDField(verbose_name='Идентификатор выгрузки')),
+                ('base_id', models.UUIDField(blank=True, null=True, verbose_name='Идентификатор предыдущей выгрузки')),
+            ],
+            options={
+                'verbose_name': 'Отметка выгрузки',
+                'verbose_name_plural': 'Отметки выгрузок',
+            },
+        ),
+    ]
@@ -0,0 +1,118 @@
+from django.db import (
+    models,
+)
+
+from core.enums import (
+    JobStatusEnum,
+)
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Запись журнала изменений: объект модели создан,
+    изменён или удалён. По журналу инкрементальная выгрузка
+    (`gzip_dumpdata --incremental`) находит объекты,
+    изменённые после предыдущей выгрузки; выгруженные
+    записи журнала удаляются.
+    """
+    track_changes = False
+
+    model_label = models.CharField(
+        verbose_name='Модель',
+        max_length=100,
+    )
+    object_pk = models.CharField(
+        verbose_name='Первичный ключ объекта',
+        max_length=64,
+    )
+    changed_at = models.DateTimeField(
+        verbose_name='Момент изменения',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'Запись журнала изменений'
+        verbose_name_plural = 'Журнал изменений'
+
+
+
+class DumpMark(models.Model):
+    """
+    Отметка выгрузки, от которой отсчитываются
+    инкрементальные, -- последней полной выгрузки всех
+    моделей или последней инкрементальной (одна запись).
+
+    Строка отметки пишется первой в каждую выгрузку, так
+    что после `restore` в БД -- отметка загруженной
+    выгрузки, а инкрементальная выгрузка применяется,
+    только если сделана после неё (`base_id`).
+    """
+    track_changes = False
+
+    dump_id = models.UUIDField(
+        verbose_name='Идентификатор выгрузки',
+    )
+    base_id = models.UUIDField(
+        verbose_name='Идентификатор предыдущей выгрузки',
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Отметка выгрузки'
+        verbose_name_plural = 'Отметки выгрузок'
+
+
+class Job(models.Model):
+    """
+    Задача фоновой очереди: вызов команды управления
+    (`call_command(command, **options)`), который выполняет
+    команда `run_jobs`, а не веб-запрос (см. `core.jobs`).
+    """
+    track_changes = False
+
+    command = models.CharField(
+        verbose_name='Команда',
+        max_length=100,
+    )
+    options = models.JSONField(
+        verbose_name='Параметры команды',
+        default=dict,
+    )
+    # данные поставившего задачу, команде не передаются
+    context = models.JSONField(
+        verbose_name='Контекст',
+        default=dict,
+    )
+    status = models.CharField(
+        verbose_name='Состояние',
+        max_length=7,
+        choices=JobStatusEnum.choices,
+        default=JobStatusEnum.PENDING,
+    )
+    output = models.TextField(
+        verbose_name='Вывод команды',
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Момент постановки в очередь',
+        auto_now_add=True,
+    )
+    started_at = models.DateTimeField(
+        verbose_name='Момент начала',
+        null=True,
+        blank=True,
+    )
+    finished_at = models.DateTimeField(
+        verbose_name='Момент завершения',
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+
+        index_together = (
+            ('status', 'id'),
+        )
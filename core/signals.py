@@ -0,0 +1,88 @@
+from django.apps import (
+    apps,
+)
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+)
+from django.dispatch import (
+    Signal,
+    receiver,
+)
+
+from core.changelog import (
+    is_tracked,
+    log_changes,
+)
+
+# Отправляется командой `restore` после применения
+# инкрементальных выгрузок: получатели пересчитывают
+# производные данные (см. `core.changelog`).
+deltas_applied = Signal()
+
+# Отправляется командой `restore` после загрузки данных
+# любым способом (объекты загружаются без сигналов):
+# получатели сбрасывают то, что закэшировано по прежним
+# данным.
+data_restored = Signal()
+
+
+@receiver(post_save)
+def log_change_on_save(sender, instance, raw=False, **kwargs):
+    # `raw` -- объект загружается из выгрузки
+    if raw:
+        return
+    log_changes(sender, [instance.pk])
+
+
+def log_change_on_delete(sender, instance, **kwargs):
+    log_changes(sender, [instance.pk])
+
+
+# Получатель `post_delete` отключает быстрое удаление
+# (`QuerySet.delete` без загрузки объектов), поэтому он
+# подключается только к отслеживаемым моделям.
+for tracked_model in apps.get_models():
+    if is_tracked(tracked_model):
+        post_delete.connect(log_change_on_delete, sender=tracked_model)
+
+
+@receiver(m2m_changed)
+def log_change_on_m2m_change(
+        sender,
+        instance,
+        action,
+        reverse,
+        model,
+        pk_set,
+        **kwargs,
+):
+    """
+    Список связанных объектов выгружается в поле объекта,
+    у которого объявлено поле многие-ко-многим, поэтому в
+    журнал пишется он (при `reverse` -- объекты `pk_set`).
+    """
+    if not is_tracked(sender):
+        return
+
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            log_changes(type(instance), [instance.pk])
+        return
+
+    if action in ('post_add', 'post_remove'):
+        log_changes(model, pk_set)
+    elif action == 'pre_clear':
+        # после очистки уже не узнать, какие были связи
+        field = next(
+            field
+            for field in model._meta.many_to_many
+            if field.remote_field.through is sender
+        )
+        log_changes(model, sender._default_manager.filter(**{
+            field.m2m_reverse_name(): instance.pk,
+        }).values_list(
+            field.m2m_column_name(),
+            flat=True,
+        ))
@@ -0,0 +1,357 @@
+"""
+Выгрузка по моделям: каталог, в котором у каждой модели
+свой сжатый файл JSON Lines (как у `gzip_dumpdata`), и
+манифест `manifest.json` с версией модели данных, числом
+объектов и контрольными суммами файлов::
+
+    {
+        "format_version": 1,
+        "data_model_version": "...",
+        "created_at": "...",
+        "compression": "gzip",
+        "dump_id": "...",
+        "models": [
+            {"model": "sugar.record", "file": "sugar.record.jsonl.gz",
+             "count": 100, "sha256": "..."},
+            ...
+        ]
+    }
+
+Модели выгружаются и загружаются независимо, поэтому
+их можно обрабатывать в нескольких процессах: при
+выгрузке -- в любом порядке, при загрузке -- модель после
+моделей, на которые она ссылается (ограничения внешних
+ключей проверяются в конце транзакции каждой модели).
+
+Каждый процесс читает свои таблицы в своей транзакции,
+так что выгрузка, как и `gzip_dumpdata`, не является
+согласованным снимком базы, если её в это время меняют.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from functools import (
+    partial,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+import django
+from django.apps import (
+    apps,
+)
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    connections,
+    models,
+)
+from django.utils import (
+    timezone,
+)
+
+from core.dumps import (
+    CHUNK_SIZE,
+    bulk_load_dump,
+    get_dump_extension,
+    open_dump,
+    write_dump,
+)
+from core.models import (
+    DumpMark,
+)
+from main.helpers import (
+    get_data_model_version,
+)
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_FORMAT_VERSION = 1
+
+
+def get_member_filename(model: Type[models.Model], compression: str) -> str:
+    return f'{model._meta.label_lower}.{get_dump_extension(compression)}'
+
+
+def get_file_sha256(path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as member_file:
+        for block in iter(lambda: member_file.read(2 ** 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_dependencies(
+        dumped_models: Iterable[Type[models.Model]],
+) -> Dict[str, Set[str]]:
+    """
+    Метка модели -> метки моделей из `dumped_models`, на
+    которые она ссылается (в том числе через таблицу
+    связи многие-ко-многим, которая загружается с ней).
+    """
+    labels = {
+        model._meta.concrete_model: model._meta.label_lower
+        for model in dumped_models
+    }
+    dependencies: Dict[str, Set[str]] = {}
+    for model, label in labels.items():
+        related_models = {
+            field.remote_field.model._meta.concrete_model
+            for field in [*model._meta.fields, *model._meta.many_to_many]
+            if field.remote_field is not None
+        }
+        dependencies[label] = {
+            labels[related_model]
+            for related_model in related_models
+            if related_model in labels and related_model is not model
+        }
+    return dependencies
+
+
+def run_per_model(
+        func: Callable[[str], Any],
+        labels: Iterable[str],
+        dependencies: Dict[str, Set[str]],
+        jobs: int,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Вызывает `func(метка модели)` для каждой модели после
+    моделей, от которых она зависит, в `jobs` процессах, и
+    отдаёт (метку, результат) по мере готовности. При
+    циклических зависимостях модели цикла идут по порядку.
+    """
+    pending = list(labels)
+    running: Dict[Future, str] = {}
+
+    def get_ready_labels() -> List[str]:
+        unfinished = {*pending, *running.values()}
+        return [
+            label
+            for label in pending
+            if not dependencies.get(label, set()) & unfinished
+        ]
+
+    if jobs <= 1:
+        while pending:
+            label, *_ = get_ready_labels() or pending
+            pending.remove(label)
+            yield label, func(label)
+        return
+
+    if any(
+            connection.in_atomic_block
+            for connection in connections.all()
+    ):
+        # процессы пула не видят незафиксированных данных
+        raise RuntimeError(
+            'Models can be processed in parallel only outside '
+            'of a transaction',
+        )
+    # Процессы пула создаются копированием текущего
+    # (fork) при первой постановке задачи и не должны
+    # унаследовать открытые соединения с БД.
+    connections.close_all()
+
+    with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=django.setup,
+    ) as executor:
+        while pending or running:
+            ready_labels = get_ready_labels()
+            if not ready_labels and not running:
+                ready_labels = pending[:1]
+            for label in ready_labels:
+                pending.remove(label)
+                running[executor.submit(func, label)] = label
+
+            done_futures, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                yield running.pop(future), future.result()
+
+
+def dump_model(
+        label: str,
+        directory: str,
+        compression: str,
+        level: Optional[int],
+        chunk_size: int,
+) -> Dict[str, Any]:
+    """
+    Выгружает модель в её файл и возвращает запись
+    манифеста; выполняется в процессах пула.
+    """
+    model = apps.get_model(label)
+    filename = get_member_filename(model, compression)
+    path = os.path.join(directory, filename)
+    with open_dump(path, compression, level) as output_stream:
+        count = write_dump(output_stream, [model], chunk_size)
+    return {
+        'model': label,
+        'file': filename,
+        'count': count,
+        'sha256': get_file_sha256(path),
+    }
+
+
+def write_split_dump(
+        directory: str,
+        dumped_models: List[Type[models.Model]],
+        compression: str,
+        level: Optional[int] = None,
+        chunk_size: int = CHUNK_SIZE,
+        jobs: int = 1,
+        on_model_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+        mark: Optional[DumpMark] = None,
+) -> Dict[str, Any]:
+    """
+    Выгружает модели в каталог (в `jobs` процессах) и
+    возвращает манифест; отметка выгрузки `mark` (см.
+    `core.changelog`) записывается в манифест.
+    """
+    os.makedirs(directory, exist_ok=True)
+    labels = [model._meta.label_lower for model in dumped_models]
+    entries: Dict[str, Dict[str, Any]] = {}
+    for label, entry in run_per_model(
+            partial(
+                dump_model,
+                directory=directory,
+                compression=compression,
+                level=level,
+                chunk_size=chunk_size,
+            ),
+            labels,
+            {},
+            jobs,
+    ):
+        entries[label] = entry
+        if on_model_done is not None:
+            on_model_done(entry)
+
+    manifest = {
+        'format_version': MANIFEST_FORMAT_VERSION,
+        'data_model_version': get_data_model_version(),
+        'created_at': timezone.now().isoformat(),
+        'compression': compression,
+        'dump_id': str(mark.dump_id) if mark is not None else None,
+        # в порядке `dumpdata`
+        'models': [entries[label] for label in labels],
+    }
+    # манифест пишется последним: каталог без него --
+    # незавершённая выгрузка
+    manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+
+def is_split_dump(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST_FILENAME))
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, MANIFEST_FILENAME)) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get('format_version') != MANIFEST_FORMAT_VERSION:
+        raise ValueError(
+            f'Unsupported manifest format: {manifest.get("format_version")}',
+        )
+    return manifest
+
+
+def check_split_dump(directory: str, manifest: Dict[str, Any]) -> None:
+    """
+    Проверяет, что модели манифеста существуют, а файлы
+    на месте и не изменены, -- до того, как очищать
+    таблицы для загрузки.
+    """
+    for entry in manifest['models']:
+        try:
+            apps.get_model(entry['model'])
+        except LookupError:
+            raise ValueError(f'Unknown model {entry["model"]}')
+        path = os.path.join(directory, entry['file'])
+        if not os.path.isfile(path):
+            raise ValueError(f'{entry["file"]}: no such file')
+        if get_file_sha256(path) != entry['sha256']:
+            raise ValueError(f'{entry["file"]}: checksum mismatch')
+
+
+def load_model(
+        label: str,
+        directory: str,
+        manifest: Dict[str, Any],
+        batch_size: int,
+        using: str = DEFAULT_DB_ALIAS,
+) -> int:
+    """
+    Загружает файл модели в пустую таблицу; выполняется в
+    процессах пула.
+    """
+    entry = next(
+        entry
+        for entry in manifest['models']
+        if entry['model'] == label
+    )
+    path = os.path.join(directory, entry['file'])
+
+    with open_dump(path, manifest['compression'], mode='rb') as input_stream:
+        count = bulk_load_dump(input_stream, using, batch_size)
+    if count != entry['count']:
+        raise ValueError(
+            f'{entry["file"]}: {count} objects are loaded, '
+            f'{entry["count"]} are expected',
+        )
+    return count
+
+
+def load_split_dump(
+        directory: str,
+        manifest: Dict[str, Any],
+        batch_size: int = CHUNK_SIZE,
+        jobs: int = 1,
+        on_model_done: Optional[Callable[[str, int], None]] = None,
+        using: str = DEFAULT_DB_ALIAS,
+) -> int:
+    """
+    Загружает проверенную (`check_split_dump`) выгрузку по
+    моделям в пустые таблицы (см.
+    `core.dumps.clear_dumped_tables`), модель после
+    моделей, на которые она ссылается, в `jobs` процессах.
+    Возвращает число загруженных объектов.
+
+    С одним процессом загрузка идёт в текущей транзакции и
+    откатывается вместе с ней; в нескольких процессах
+    каждая модель загружается в своей транзакции.
+    """
+    labels = [entry['model'] for entry in manifest['models']]
+    loaded_count = 0
+    for label, count in run_per_model(
+            partial(
+                load_model,
+                directory=directory,
+                manifest=manifest,
+                batch_size=batch_size,
+                using=using,
+            ),
+            labels,
+            get_dependencies(apps.get_model(label) for label in labels),
+            jobs,
+    ):
+        loaded_count += count
+        if on_model_done is not None:
+            on_model_done(label, count)
+    return loaded_count
@@ -1 +1,2 @@
 const STATUS_OK = 200;
+const DUMP_POLL_INTERVAL = 2000;
\ No newline at end of file
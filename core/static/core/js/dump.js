@@ -0,0 +1,43 @@
+function downloadDump(url) {
+    var button = document.getElementById('get_dump');
+    button.disabled = true;
+
+    var onFailure = function () {
+        button.disabled = false;
+        alert('Не удалось выгрузить БД');
+    }
+
+    var pollJob = function (jobUrl) {
+        fetch(jobUrl, {credentials: 'same-origin'})
+            .then(response => response.json())
+            .then(function (job) {
+                if (job['status'] == 'done') {
+                    button.disabled = false;
+                    location.href = job['download_url'];
+                } else if (job['status'] == 'failed') {
+                    onFailure();
+                } else {
+                    setTimeout(
+                        () => pollJob(job['url']),  // handler
+                        DUMP_POLL_INTERVAL,  // timeout
+                    );
+                }
+            })
+            .catch(onFailure);
+    }
+
+    fetch(url, {credentials: 'same-origin'})
+        .then(function (response) {
+            var contentType = response.headers.get('Content-Type');
+            if (response.status == 202) {
+                response.json().then(job => pollJob(job['url']));
+            } else if (response.ok && contentType != 'application/json') {
+                // сохранённая выгрузка отдаётся сразу
+                button.disabled = false;
+                location.href = url;
+            } else {
+                onFailure();
+            }
+        })
+        .catch(onFailure);
+}
@@ -5,8 +5,18 @@ from . import views
 
 urlpatterns = [
     url(
-        r'dump',
+        r'^dump$',
         views.download_json_dump,
         name='download_json_dump',
     ),
+    url(
+        r'^dump/(?P<job_id>\d+)$',
+        views.dump_job_view,
+        name='dump_job',
+    ),
+    url(
+        r'^dump/(?P<job_id>\d+)/file$',
+        views.download_dump_job_file,
+        name='download_dump_job_file',
+    ),
 ]
@@ -1,43 +1,269 @@
-import os.path
+import os
 
 from operator import (
     attrgetter,
 )
 
+from django.conf import (
+    settings,
+)
 from django.contrib.auth.decorators import (
     user_passes_test,
 )
-from django.core.management import (
-    call_command,
+from django.core.cache import (
+    cache,
 )
 from django.http import (
+    FileResponse,
     Http404,
-    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import (
+    get_object_or_404,
+)
+from django.urls import (
+    reverse,
 )
 
+from core.changelog import (
+    anchor_dump,
+    get_changes,
+    get_changes_version,
+    get_last_entry_id,
+    new_dump_mark,
+)
+from core.dumps import (
+    COMPRESSIONS,
+    get_dumped_models,
+    iter_delta_dump,
+    iter_dump,
+)
+from core.enums import (
+    JobStatusEnum,
+)
+from core.jobs import (
+    enqueue_job,
+    get_active_jobs,
+)
 from core.management.commands.gzip_dumpdata import (
     Command as GzipDumpDataCommand,
 )
+from core.models import (
+    Job,
+)
 
-
-@user_passes_test(
+superuser_required = user_passes_test(
     test_func=attrgetter('is_superuser'),
     login_url='/admin/login',  # fixme: хардкод
 )
-def download_json_dump(request):
-    cmd = GzipDumpDataCommand()
-    filename = GzipDumpDataCommand.generate_filename()
 
-    call_command(cmd, filename=filename)
+# последняя сохранённая полная выгрузка:
+# {'version': ..., 'filename': ...}
+DUMP_CACHE_KEY = 'core:json_dump'
+
+
+def get_cached_dump_filename(compression):
+    cached_dump = cache.get(DUMP_CACHE_KEY)
+    if (
+        cached_dump is None
+        or cached_dump['version'] != get_changes_version()
+        or cached_dump['compression'] != compression
+    ):
+        return None
+    filename = cached_dump['filename']
+    if not os.path.exists(GzipDumpDataCommand.get_filepath(filename)):
+        return None
+    return filename
+
+
+def iter_saved_chunks(chunks, filename):
+    """
+    Отдаёт части выгрузки, параллельно сохраняя их в файл;
+    файл появляется под своим именем, только если выгрузка
+    дошла до конца.
+    """
     filepath = GzipDumpDataCommand.get_filepath(filename)
+    part_filepath = f'{filepath}.part'
+    try:
+        with open(part_filepath, 'wb') as part_file:
+            for chunk in chunks:
+                part_file.write(chunk)
+                yield chunk
+    except BaseException:
+        # в том числе `GeneratorExit`, если клиент отключился
+        if os.path.exists(part_filepath):
+            os.remove(part_filepath)
+        raise
+    os.replace(part_filepath, filepath)
+
+
+def cache_dump(changes_version, compression, filename, cache_timeout):
+    cache.set(DUMP_CACHE_KEY, {
+        'version': changes_version,
+        'compression': compression,
+        'filename': filename,
+    }, timeout=cache_timeout)
+
+
+def iter_json_dump(compression, incremental, cache_timeout, filename):
+    # Изменения, сделанные во время выгрузки, остаются
+    # в журнале и попадут в следующую выгрузку.
+    changes_version = get_changes_version()
+    last_entry_id = get_last_entry_id()
+    mark = new_dump_mark(incremental)
+
+    dumped_models = get_dumped_models()
+    if incremental:
+        chunks = iter_delta_dump(
+            get_changes(last_entry_id),
+            mark,
+            dumped_models,
+            compression,
+        )
+    else:
+        chunks = iter_dump(dumped_models, compression, mark=mark)
+    if cache_timeout:
+        chunks = iter_saved_chunks(chunks, filename)
 
-    if os.path.exists(filepath):
-        with open(filepath, 'rb') as dump_file:
-            response = HttpResponse(
-                content=dump_file.read(),
-                content_type='application/gzip',
+    yield from chunks
+
+    # выгружены все модели -- выгрузка становится точкой
+    # отсчёта следующей инкрементальной
+    anchor_dump(mark, dumped_models, last_entry_id, incremental)
+    if cache_timeout:
+        cache_dump(changes_version, compression, filename, cache_timeout)
+
+
+def get_dump_job_state(job):
+    state = {
+        'id': job.id,
+        'status': job.status,
+        'url': reverse('core:dump_job', args=(job.id,)),
+    }
+    if job.status == JobStatusEnum.DONE:
+        state['download_url'] = reverse(
+            'core:download_dump_job_file',
+            args=(job.id,),
+        )
+    elif job.status == JobStatusEnum.FAILED:
+        state['error'] = job.output
+    return state
+
+
+def enqueue_dump_job(compression, incremental):
+    """
+    Ставит выгрузку в очередь (`core.jobs`); если такая же
+    ещё не выполнена (и не брошена), возвращает её.
+    """
+    active_jobs = get_active_jobs().filter(
+        command='gzip_dumpdata',
+    )
+    for job in active_jobs:
+        if (
+                job.options['compression'] == compression
+                and job.options['incremental'] == incremental
+        ):
+            return job
+
+    filename = GzipDumpDataCommand.generate_filename(
+        compression=compression,
+        incremental=incremental,
+    )
+    return enqueue_job(
+        'gzip_dumpdata',
+        context={
+            'filename': filename,
+            # изменения между постановкой в очередь и
+            # выгрузкой только сделают сохранённую выгрузку
+            # устаревшей раньше, чем нужно
+            'changes_version': get_changes_version(),
+        },
+        filename=filename,
+        compression=compression,
+        incremental=incremental,
+    )
+
+
+@superuser_required
+def download_json_dump(request):
+    """
+    Ставит выгрузку базы в фоновую очередь (её выполняет
+    `run_jobs`) и отвечает состоянием задачи (202), которое
+    потом запрашивается по `url`; когда задача выполнена,
+    файл скачивается по `download_url`.
+
+    ?incremental=1 -- только изменения после предыдущей
+    выгрузки; ?compression=<способ> -- см. `core.dumps`;
+    ?stream=1 -- не ставить в очередь, а сжимать на лету и
+    отдавать по частям в этом же запросе. С
+    JSON_DUMP_CACHE_TIMEOUT полная выгрузка отдаётся
+    повторно сразу, пока данные не изменятся.
+    """
+    incremental = request.GET.get('incremental') == '1'
+    compression = request.GET.get('compression', 'gzip')
+    if compression not in COMPRESSIONS:
+        return HttpResponseBadRequest(
+            f'Unknown compression: {compression}',
+        )
+    content_type = COMPRESSIONS[compression].content_type
+
+    cache_timeout = 0 if incremental else settings.JSON_DUMP_CACHE_TIMEOUT
+    if cache_timeout:
+        filename = get_cached_dump_filename(compression)
+        if filename is not None:
+            return FileResponse(
+                open(GzipDumpDataCommand.get_filepath(filename), 'rb'),
+                filename=filename,
+                content_type=content_type,
             )
-            response['Content-Disposition'] = (
-                f'inline; filename={filename}')
-            return response
-    raise Http404
+
+    if request.GET.get('stream') != '1':
+        job = enqueue_dump_job(compression, incremental)
+        return JsonResponse(get_dump_job_state(job), status=202)
+
+    filename = GzipDumpDataCommand.generate_filename(
+        compression=compression,
+        incremental=incremental,
+    )
+    response = StreamingHttpResponse(
+        iter_json_dump(compression, incremental, cache_timeout, filename),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'inline; filename={filename}'
+    return response
+
+
+@superuser_required
+def dump_job_view(request, job_id):
+    job = get_object_or_404(Job, id=job_id, command='gzip_dumpdata')
+    return JsonResponse(get_dump_job_state(job))
+
+
+@superuser_required
+def download_dump_job_file(request, job_id):
+    job = get_object_or_404(
+        Job,
+        id=job_id,
+        command='gzip_dumpdata',
+        status=JobStatusEnum.DONE,
+    )
+    filename = job.context['filename']
+    filepath = GzipDumpDataCommand.get_filepath(filename)
+    if not os.path.exists(filepath):
+        raise Http404
+
+    compression = job.options['compression']
+    if not job.options['incremental'] and settings.JSON_DUMP_CACHE_TIMEOUT:
+        cache_dump(
+            job.context['changes_version'],
+            compression,
+            filename,
+            settings.JSON_DUMP_CACHE_TIMEOUT,
+        )
+    return FileResponse(
+        open(filepath, 'rb'),
+        filename=filename,
+        content_type=COMPRESSIONS[compression].content_type,
+    )
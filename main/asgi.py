@@ -0,0 +1,20 @@
+"""
+ASGI config for pocketbook project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Asynchronous views (e.g. ``sugar.views.rows_async_view``) run in the
+event loop only when the project is served by an ASGI server::
+
+    uvicorn main.asgi:application
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+
+application = get_asgi_application()
@@ -170,6 +170,16 @@ DATABASES = config.get('databases')
 assert isinstance(DATABASES, dict)
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/ref/settings/#caches
+CACHES = config.get('caches', {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+})
+assert isinstance(CACHES, dict)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -235,6 +245,35 @@ DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 custom_section = config.get('custom', {})
 WAIT_DB_TIMEOUT = custom_section.get('WAIT_DB_TIMEOUT', 10)
 
+# Время жизни закэшированных ответов списка записей
+# дневника в секундах (0 -- не кэшировать). Версии
+# данных, по которым ответы сбрасываются, хранятся в кэше:
+# кэш в памяти процесса у каждого процесса свой, и
+# изменения из команд и других процессов до него не
+# доходят, поэтому по умолчанию ответы кэшируются только
+# с общим кэшем.
+ROWS_CACHE_TIMEOUT = custom_section.get(
+    'ROWS_CACHE_TIMEOUT',
+    0 if CACHES.get('default', {}).get('BACKEND') in (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache',
+    ) else 3600,
+)
+
+# Сериализатор JSON-ответов дневника: 'json' или 'orjson'
+# (по умолчанию -- orjson, если он установлен)
+JSON_SERIALIZER = custom_section.get('JSON_SERIALIZER')
+
+# Сколько секунд отдавать сохранённую полную выгрузку
+# базы (`core.views.download_json_dump`), пока данные не
+# меняются (0 -- всегда выгружать заново)
+JSON_DUMP_CACHE_TIMEOUT = custom_section.get('JSON_DUMP_CACHE_TIMEOUT', 0)
+
+# Через сколько секунд после начала выполняемая задача
+# фоновой очереди (`core.jobs`) считается брошенной
+# упавшим обработчиком и помечается проваленной
+JOB_TIMEOUT = custom_section.get('JOB_TIMEOUT', 6 * 60 * 60)
+
 try:
     LOGGING = config['logging']
 except KeyError:
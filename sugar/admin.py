@@ -4,6 +4,9 @@ from django.contrib import (
     admin,
 )
 from django.contrib.admin.views.main import ChangeList
+from django.db.models import (
+    Prefetch,
+)
 
 from core.admin import (
     ownable,
@@ -62,6 +65,7 @@ class InsulinInjectionInline(admin.TabularInline):
                 insylin_syringe_field_name,
             ).related_model.get_actual_items(
                 on_date=actual_moment,
+                whose=request.user,
             )
 
         return queryset
@@ -90,6 +94,7 @@ class SugarMeteringInline(admin.TabularInline):
                 pack_field_name,
             ).related_model.get_actual_items(
                 on_date=actual_moment,
+                whose=request.user,
             )
 
         return queryset
@@ -146,6 +151,25 @@ class RecordAdmin(admin.ModelAdmin):
         return get_datetime_display(localized_when)
     get_when_display.short_description = 'when'
 
+    def get_queryset(self, request):
+        # Подгружаем данные для колонок списка записей
+        # разом на всю страницу, чтобы количество запросов
+        # не зависело от её размера.
+        return super().get_queryset(request).select_related(
+            'sugarmetering',
+        ).prefetch_related(
+            'meal_set',
+            Prefetch(
+                'insulininjection_set',
+                queryset=InsulinInjection.objects.select_related(
+                    'insulin_syringe__insulin_mark',
+                ).order_by(
+                    'pk',
+                ),
+            ),
+            'comment_set',
+        )
+
     def get_changelist(self, request, **kwargs):
         return RecordAdminChangeList
 
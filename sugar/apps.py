@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SugarConfig(AppConfig):
     name = 'sugar'
+
+    def ready(self):
+        from . import signals  # noqa
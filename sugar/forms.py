@@ -9,6 +9,9 @@ from .models import (
     Comment,
 )
 
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 10000
+
 
 class CommentForm(forms.ModelForm):
     content = forms.CharField(
@@ -33,3 +36,9 @@ class ListViewForm(forms.Form):
         min_value=1,
         initial=1,
     )
+    page_size = forms.IntegerField(
+        label='Строк на странице',
+        min_value=1,
+        max_value=MAX_PAGE_SIZE,
+        initial=DEFAULT_PAGE_SIZE,
+    )
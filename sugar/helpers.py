@@ -1,10 +1,27 @@
+import asyncio
 import calendar
+import hashlib
+import json
+import math
+import uuid
+from array import (
+    array,
+)
+from base64 import (
+    urlsafe_b64decode,
+    urlsafe_b64encode,
+)
 from bisect import (
     bisect_right,
+    insort_right,
+)
+from collections import (
+    deque,
 )
 from datetime import (
     date,
     datetime,
+    time,
     timedelta,
 )
 from decimal import (
@@ -18,7 +35,6 @@ from itertools import (
     groupby,
     islice,
     product,
-    repeat,
 )
 from operator import (
     attrgetter,
@@ -27,7 +43,7 @@ from operator import (
 from typing import (
     Any,
     Callable,
-    Collection,
+    Deque,
     Dict,
     Iterable,
     Iterator,
@@ -39,17 +55,37 @@ from typing import (
     Union,
 )
 
+from asgiref.sync import (
+    sync_to_async,
+)
 from django.conf import (
     settings,
 )
+from django.core.cache import (
+    cache,
+)
+from django.db import (
+    close_old_connections,
+    connections,
+)
 from django.db.models import (
+    Count,
     DateTimeField,
+    DecimalField,
+    F,
+    Max,
+    Min,
     Model,
     QuerySet,
+    Sum,
 )
 from django.db.models.functions import (
     Trunc,
 )
+from django.db.transaction import (
+    atomic,
+    on_commit,
+)
 from pytz import (
     timezone,
 )
@@ -59,9 +95,19 @@ from sugar.enums import (
 )
 
 from .models import (
+    DailyInsulinSummary,
+    DailySugarSummary,
+    InsulinInjection,
+    Meal,
+    Record,
     SugarMetering,
+    TimeLabelGroup,
 )
 
+SEEK_CHUNK_SIZE = 100
+INDEX_CHUNK_SIZE = 1000
+SUMMARY_CHUNK_DAYS = 92
+
 ONE_SECOND = timedelta(seconds=1)
 ONE_DAY = timedelta(days=1)
 ONE_WEEK = timedelta(days=7)
@@ -104,6 +150,47 @@ TIME_LABEL_ENDS: Dict[str, Callable[[datetime], datetime]] = {
 }
 
 
+def _truncate_local(when: datetime, days_back: int = 0, **replace) -> datetime:
+    using_timezone = timezone(settings.TIME_ZONE)
+    local_when = helpers.with_server_timezone(when).replace(
+        tzinfo=None,
+        **replace,
+    )
+    return using_timezone.localize(
+        local_when - timedelta(days=days_back),
+    )
+
+
+_START_OF_DAY = dict(hour=0, minute=0, second=0, microsecond=0)
+
+
+TIME_LABEL_STARTS: Dict[str, Callable[[datetime], datetime]] = {
+    # Python-аналоги аннотации `time_label`
+    # (см. `get_time_label_expression`)
+    DateAggregateEnum.NONE: lambda when: _truncate_local(when, microsecond=0),
+    DateAggregateEnum.DAY: lambda when: _truncate_local(when, **_START_OF_DAY),
+    DateAggregateEnum.WEEK: lambda when: _truncate_local(
+        when,
+        days_back=helpers.with_server_timezone(when).weekday(),
+        **_START_OF_DAY,
+    ),
+    DateAggregateEnum.MONTH: lambda when: _truncate_local(when, day=1, **_START_OF_DAY),  # noqa
+    DateAggregateEnum.YEAR: lambda when: _truncate_local(when, month=1, day=1, **_START_OF_DAY),  # noqa
+}
+
+
+def get_time_label_expression(
+        groupping: str,
+        expression: str = 'when',
+) -> Trunc:
+    return Trunc(
+        expression=expression,
+        kind=TRUNC_TYPES[groupping],
+        output_field=DateTimeField(),
+        tzinfo=timezone(settings.TIME_ZONE),
+    )
+
+
 # FIXME: don't use NamedTuples?
 class SliceParams(NamedTuple):
     records: QuerySet
@@ -199,14 +286,509 @@ def slice_records(
     )
 
 
+def slice_records_by_index(
+        records: QuerySet,
+        who_id: int,
+        groupping: str,
+        target_page_number: int,
+        page_size: int,
+) -> SliceParams:
+    """
+    То же, что и `slice_records`, но границы страницы
+    берутся из индекса `TimeLabelGroup`, поэтому
+    стоимость не зависит ни от объёма истории
+    пользователя, ни от номера страницы.
+    """
+    # при значении -1 вернём последнюю страницу
+    assert target_page_number == -1 or target_page_number >= 1
+
+    groups = TimeLabelGroup.objects.filter(
+        who=who_id,
+        groupping=groupping,
+    )
+    last_position = _get_last_position(groups)
+    if last_position is None and records.exists():
+        # индекс ещё не построен (например, записи
+        # появились до его введения)
+        rebuild_time_label_index(who_id, (groupping,))
+        last_position = _get_last_position(groups)
+
+    total_rows_count = 0 if last_position is None else 1 + last_position
+    total_pages_count = math.ceil(total_rows_count / page_size)
+
+    if target_page_number == -1 or target_page_number > total_pages_count:
+        # если запрошенной страницы нет -- отдадим последнюю
+        target_page_number = total_pages_count
+
+    slice_stop = target_page_number * page_size
+    slice_start = slice_stop - page_size
+
+    slice_filter: Optional[Dict[str, Any]] = None
+    if total_rows_count:
+        # группы нумеруются от самой ранней, а строки
+        # таблицы -- от самой поздней
+        page_bounds = groups.filter(
+            position__range=(
+                max(0, last_position - slice_stop + 1),
+                last_position - slice_start,
+            ),
+        ).aggregate(
+            min_when=Min('min_when'),
+            max_when=Max('max_when'),
+        )
+        slice_filter = dict(
+            when__range=(
+                page_bounds['min_when'],
+                page_bounds['max_when'],
+            ),
+        )
+        records = records.filter(
+            **slice_filter,
+        )
+
+    return SliceParams(
+        records=records,
+        slice_filter=slice_filter,
+        total_rows_count=total_rows_count,
+        total_pages_count=total_pages_count,
+        page_number=target_page_number,
+        first_shown=1+slice_start,
+        last_shown=min(total_rows_count, slice_stop),
+    )
+
+
+def _get_last_position(groups: QuerySet) -> Optional[int]:
+    return groups.order_by(
+        '-position',
+    ).values_list(
+        'position',
+        flat=True,
+    ).first()
+
+
+@atomic
+def refresh_time_label_group(
+        who_id: int,
+        groupping: str,
+        time_label: datetime,
+) -> None:
+    """
+    Приводит элемент индекса `TimeLabelGroup` в
+    соответствие с записями пользователя, попадающими в
+    группу с меткой `time_label`.
+    """
+    groups = TimeLabelGroup.objects.filter(
+        who=who_id,
+        groupping=groupping,
+    )
+    stats = Record.objects.filter(
+        who=who_id,
+        when__gte=time_label,
+        when__lt=TIME_LABEL_ENDS[groupping](time_label),
+    ).aggregate(
+        records_count=Count('pk'),
+        min_when=Min('when'),
+        max_when=Max('when'),
+    )
+    group: Optional[TimeLabelGroup] = groups.filter(
+        time_label=time_label,
+    ).first()
+
+    if not stats['records_count']:
+        if group is not None:
+            group.delete()
+            groups.filter(
+                position__gt=group.position,
+            ).update(
+                position=F('position') - 1,
+            )
+        return
+
+    if group is not None:
+        for attr, value in stats.items():
+            setattr(group, attr, value)
+        group.save()
+        return
+
+    last_group: Optional[TimeLabelGroup] = groups.order_by(
+        '-position',
+    ).first()
+    if last_group is None:
+        position = 0
+    elif last_group.time_label < time_label:
+        # обычный случай: новая запись позже всех прочих
+        position = 1 + last_group.position
+    else:
+        position = groups.filter(
+            time_label__lt=time_label,
+        ).count()
+        groups.filter(
+            position__gte=position,
+        ).update(
+            position=F('position') + 1,
+        )
+
+    TimeLabelGroup.objects.create(
+        who_id=who_id,
+        groupping=groupping,
+        time_label=time_label,
+        position=position,
+        **stats,
+    )
+
+
+def refresh_time_label_index(
+        who_id: int,
+        moments: Iterable[datetime],
+) -> None:
+    moments = tuple(moments)
+    for groupping in DateAggregateEnum.values:
+        time_labels = {
+            TIME_LABEL_STARTS[groupping](moment)
+            for moment in moments
+        }
+        for time_label in time_labels:
+            refresh_time_label_group(who_id, groupping, time_label)
+
+
+@atomic
+def rebuild_time_label_index(
+        who_id: int,
+        grouppings: Optional[Iterable[str]] = None,
+        chunk_size: int = INDEX_CHUNK_SIZE,
+) -> None:
+    if grouppings is None:
+        grouppings = DateAggregateEnum.values
+
+    for groupping in grouppings:
+        TimeLabelGroup.objects.filter(
+            who=who_id,
+            groupping=groupping,
+        ).delete()
+
+        time_labels_iterator = Record.objects.filter(
+            who=who_id,
+        ).order_by(
+            'when',
+        ).annotate(
+            time_label=get_time_label_expression(groupping),
+        ).values_list(
+            'time_label',
+            'when',
+        ).iterator(
+            chunk_size=chunk_size,
+        )
+
+        groups_iterator = (
+            TimeLabelGroup(
+                who_id=who_id,
+                groupping=groupping,
+                time_label=time_label,
+                position=position,
+                records_count=len(whens),
+                min_when=whens[0],
+                max_when=whens[-1],
+            )
+            for position, (time_label, whens) in enumerate(
+                (time_label, tuple(map(itemgetter(1), group)))
+                for time_label, group in groupby(
+                    time_labels_iterator,
+                    key=itemgetter(0),
+                )
+            )
+        )
+
+        while True:
+            chunk = list(islice(groups_iterator, chunk_size))
+            if not chunk:
+                break
+            TimeLabelGroup.objects.bulk_create(chunk)
+
+
+# FIXME: don't use NamedTuples?
+class SeekParams(NamedTuple):
+    records: QuerySet
+    slice_filter: Optional[Dict[str, Any]]
+    next_cursor: Optional[str]
+    # Курсор для запроса следующей страницы; None, если
+    # страница последняя.
+
+
+def encode_cursor(time_label: datetime) -> str:
+    return urlsafe_b64encode(
+        time_label.isoformat().encode('ascii'),
+    ).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> datetime:
+    try:
+        time_label = datetime.fromisoformat(
+            urlsafe_b64decode(cursor.encode('ascii')).decode('ascii'),
+        )
+    except ValueError:
+        raise ValueError(f'Incorrect cursor {cursor!r}')
+
+    if time_label.tzinfo is None:
+        raise ValueError(f'Incorrect cursor {cursor!r}')
+
+    return time_label
+
+
+def _iter_seek_time_labels(
+        records: QuerySet,
+        cursor: Optional[datetime],
+        chunk_size: int,
+) -> Iterator[Dict[str, Any]]:
+    # Записи упорядочены по убыванию `when`, а пара
+    # (who, when) уникальна, поэтому каждую следующую
+    # порцию можно получать по индексу условием
+    # `when < when последней полученной записи`.
+    time_labels = records.values(
+        'when',
+        'time_label',
+    )
+    upper_when = cursor
+    while True:
+        chunk_queryset = time_labels
+        if upper_when is not None:
+            chunk_queryset = chunk_queryset.filter(
+                when__lt=upper_when,
+            )
+        chunk = list(chunk_queryset[:chunk_size])
+        yield from chunk
+
+        if len(chunk) < chunk_size:
+            return
+        upper_when = chunk[-1]['when']
+
+
+def seek_records(
+        records: QuerySet,
+        cursor: Optional[datetime],
+        page_size: int,
+        chunk_size: int = SEEK_CHUNK_SIZE,
+) -> SeekParams:
+    """
+    Keyset-пагинация: в отличие от `slice_records` читает
+    только записи запрошенной страницы (и первую запись
+    следующей), начиная с момента `cursor`.
+    """
+    assert page_size >= 1
+
+    groupped_iterator = groupby(
+        iterable=_iter_seek_time_labels(records, cursor, chunk_size),
+        key=itemgetter('time_label'),
+    )
+
+    max_when: Optional[datetime] = None
+    min_when: Optional[datetime] = None
+    last_time_label: Optional[datetime] = None
+    next_cursor: Optional[str] = None
+
+    for group_idx, (time_label, group) in enumerate(groupped_iterator):
+        if group_idx == page_size:
+            # на следующей странице есть хотя бы одна строка
+            next_cursor = encode_cursor(last_time_label)
+            break
+
+        for item in group:
+            if max_when is None:
+                max_when = item['when']
+            min_when = item['when']
+        last_time_label = time_label
+
+    if max_when is None or min_when is None:
+        return SeekParams(
+            records=records.none(),
+            slice_filter=None,
+            next_cursor=None,
+        )
+
+    slice_filter = dict(
+        when__range=(min_when, max_when),
+    )
+    return SeekParams(
+        records=records.filter(
+            **slice_filter,
+        ),
+        slice_filter=slice_filter,
+        next_cursor=next_cursor,
+    )
+
+
+def count_time_labels(records: QuerySet) -> int:
+    return records.order_by().values(
+        'time_label',
+    ).distinct().count()
+
+
+# FIXME: don't use NamedTuples?
+class AttachmentColumns(NamedTuple):
+    offsets: 'array[int]'
+    # Границы прикреплений строк (CSR): прикрепления
+    # i-й строки лежат в колонках на позициях
+    # [offsets[i], offsets[i + 1])
+
+    columns: Dict[str, List[Any]]
+    # Значения прикреплений по именам атрибутов
+
+    per_group: bool
+    # Строки -- группы (метки времени), а не записи
+
+
+class RecordBatch:
+    """
+    Колоночное представление страницы записей.
+
+    Вместо словаря на каждую запись хранит параллельные
+    массивы идентификаторов и моментов записей, список
+    меток времени с границами групп и прикрепления в
+    CSR-формате (колонки значений и массив смещений).
+    Собирается один раз на запрос и используется всеми
+    `get_*_display_data`.
+    """
+
+    def __init__(
+            self,
+            records: Iterable[Tuple[int, datetime, datetime, datetime]],
+    ) -> None:
+        # records -- (id, when, localized_when, time_label)
+        # в порядке убывания `when`
+        self.ids: 'array[int]' = array('q')
+        self.timestamps: 'array[int]' = array('q')
+        self.time_labels: List[datetime] = []
+        # записи группы i: [group_offsets[i], group_offsets[i + 1])
+        self.group_offsets: 'array[int]' = array('q')
+        self.first_when: Optional[datetime] = None
+        self.last_when: Optional[datetime] = None
+        self._attachments: Dict[str, AttachmentColumns] = {}
+        self._positions: Optional[Dict[int, int]] = None
+
+        when: Optional[datetime] = None
+        for record_id, when, localized_when, time_label in records:
+            if self.last_when is None:
+                self.last_when = when
+            if not self.time_labels or self.time_labels[-1] != time_label:
+                self.time_labels.append(time_label)
+                self.group_offsets.append(len(self.ids))
+            self.ids.append(record_id)
+            self.timestamps.append(round(localized_when.timestamp()))
+        self.first_when = when
+        self.group_offsets.append(len(self.ids))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get_position(self, record_id: int) -> int:
+        if self._positions is None:
+            self._positions = {
+                record_id: position
+                for position, record_id in enumerate(self.ids)
+            }
+        return self._positions[record_id]
+
+    def set_attachments(
+            self,
+            set_name: str,
+            positions: List[int],
+            columns: Dict[str, List[Any]],
+            per_group: bool = False,
+    ) -> None:
+        """
+        Раскладывает прикрепления по строкам. `positions`
+        -- номер строки (записи или группы) каждого
+        прикрепления, `columns` -- значения атрибутов
+        прикреплений в том же порядке. Порядок
+        прикреплений внутри строки сохраняется.
+        """
+        rows_count = len(self.time_labels) if per_group else len(self.ids)
+        offsets = array('q', [0]) * (rows_count + 1)
+        for position in positions:
+            offsets[position + 1] += 1
+        for idx in range(rows_count):
+            offsets[idx + 1] += offsets[idx]
+
+        # сортировка подсчётом по номеру строки
+        free_places = array('q', offsets)
+        order = [0] * len(positions)
+        for idx, position in enumerate(positions):
+            order[free_places[position]] = idx
+            free_places[position] += 1
+
+        self._attachments[set_name] = AttachmentColumns(
+            offsets=offsets,
+            columns={
+                name: [values[idx] for idx in order]
+                for name, values in columns.items()
+            },
+            per_group=per_group,
+        )
+
+    def iter_groups_values(
+            self,
+            set_name: str,
+            *names: str,
+    ) -> Iterator[List[Tuple[Any, ...]]]:
+        """
+        Для каждой группы (метки времени) -- список
+        кортежей значений `names` её прикреплений.
+        """
+        attachments = self._attachments.get(set_name)
+        if attachments is None:
+            for _ in self.time_labels:
+                yield []
+            return
+
+        bounds: Iterable[int]
+        if attachments.per_group:
+            bounds = attachments.offsets
+        else:
+            # Записи группы идут подряд, поэтому и их
+            # прикрепления занимают непрерывный отрезок.
+            bounds = [
+                attachments.offsets[position]
+                for position in self.group_offsets
+            ]
+        columns = [
+            attachments.columns[name]
+            for name in names
+        ]
+        for start, stop in zip(bounds, islice(bounds, 1, None)):
+            yield list(zip(*(
+                column[start:stop]
+                for column in columns
+            )))
+
+    def iter_chronological_values(
+            self,
+            set_name: str,
+            name: str,
+    ) -> Iterator[Tuple[int, Any]]:
+        """
+        (timestamp записи, значение `name`) для всех
+        прикреплений записей в порядке возрастания
+        времени.
+        """
+        attachments = self._attachments.get(set_name)
+        if attachments is None:
+            return
+
+        assert not attachments.per_group
+        offsets = attachments.offsets
+        values = attachments.columns[name]
+        for position in reversed(range(len(self.ids))):
+            timestamp = self.timestamps[position]
+            for idx in range(offsets[position], offsets[position + 1]):
+                yield timestamp, values[idx]
+
+
 # FIXME: don't use NamedTuples?
 class AttachmentMeta(NamedTuple):
     model: Type[Model]
     # Класс модели атачмента
 
     set_name: str
-    # Имя ключа, по которому надо положить к
-    # словарю-записи список её атачментов этого типа.
+    # Имя набора прикреплений этого типа в `RecordBatch`
 
     fk_name: str
     # Имя внешнего ключа, через который этот атачмент
@@ -219,110 +801,308 @@ class AttachmentMeta(NamedTuple):
     # Какие атрибуты атачмента следует извлечь
 
 
-def export_attachments(
-        records: QuerySet,
-        *args: Tuple[AttachmentMeta, ...],
+def fetch_attachments(meta: AttachmentMeta) -> List[Tuple[Any, ...]]:
+    # (id записи, *export_values) каждого прикрепления
+    return list(meta.model.objects.filter(
+        **{
+            f'{meta.fk_name}__{k}': v
+            for k, v in meta.filter_.items()
+        }
+    ).values_list(
+        meta.fk_name,
+        *meta.export_values,
+    ))
+
+
+def attach_attachments(
+        batch: RecordBatch,
+        meta: AttachmentMeta,
+        attachments: Iterable[Tuple[Any, ...]],
 ) -> None:
-    records_by_ids: Dict[int, Dict[str, Any]] = {
-        record['id']: record
-        for record in records
+    positions: List[int] = []
+    columns: Dict[str, List[Any]] = {
+        name: []
+        for name in meta.export_values
     }
+    columns_values = list(columns.values())
+    for record_pk, *values in attachments:
+        positions.append(batch.get_position(record_pk))
+        for column, value in zip(columns_values, values):
+            column.append(value)
+
+    batch.set_attachments(
+        meta.set_name,
+        positions,
+        columns,
+    )
 
-    for record in records_by_ids.values():
-        record.update(
-            **{
-                meta.set_name: []
-                for meta in args
-            },
-        )
 
+def export_attachments(
+        batch: RecordBatch,
+        *args: AttachmentMeta,
+) -> None:
     meta: AttachmentMeta
     for meta in args:
-        attachments = meta.model.objects.filter(
-            **{
-                f'{meta.fk_name}__{k}': v
-                for k, v in meta.filter_.items()
-            }
-        ).values(
-            meta.fk_name,
-            *meta.export_values,
-        )
-        for attachment in attachments:
-            record_pk = attachment[meta.fk_name]
-            current_record = records_by_ids[record_pk]
-            current_record[meta.set_name].append(
-                attachment,
-            )
+        if meta.filter_ is None:
+            # срез пустой, прикреплять нечего
+            continue
+
+        attach_attachments(
+            batch,
+            meta,
+            fetch_attachments(meta),
+        )
+
+
+# FIXME: don't use NamedTuples?
+class AggregatedAttachmentMeta(NamedTuple):
+    model: Type[Model]
+    # Класс модели атачмента
+
+    set_name: str
+    # Имя набора агрегатов атачментов этого типа в
+    # `RecordBatch`
+
+    fk_name: str
+    # Имя внешнего ключа, через который этот атачмент
+    # ссылается на модель записи.
+
+    filter_: Optional[Dict[str, Any]]
+    # Фильтр записей
+
+    export_values: Iterable[str]
+    # По каким атрибутам атачмента (помимо метки
+    # времени) следует группировать
+
+    sum_values: Iterable[str]
+    # Какие атрибуты атачмента следует суммировать
+
+
+def fetch_aggregated_attachments(
+        meta: AggregatedAttachmentMeta,
+        groupping: str,
+) -> List[Tuple[Any, ...]]:
+    # (time_label, *export_values, *суммы sum_values)
+    # каждой группы прикреплений
+    return list(meta.model.objects.filter(
+        **{
+            f'{meta.fk_name}__{k}': v
+            for k, v in meta.filter_.items()
+        }
+    ).annotate(
+        time_label=get_time_label_expression(
+            groupping,
+            expression=f'{meta.fk_name}__when',
+        ),
+    ).order_by().values(
+        'time_label',
+        *meta.export_values,
+    ).annotate(
+        **{
+            f'total_{name}': Sum(name)
+            for name in meta.sum_values
+        },
+    ).values_list(
+        'time_label',
+        *meta.export_values,
+        *(
+            f'total_{name}'
+            for name in meta.sum_values
+        ),
+    ))
+
+
+def attach_aggregated_attachments(
+        batch: RecordBatch,
+        meta: AggregatedAttachmentMeta,
+        aggregated_attachments: Iterable[Tuple[Any, ...]],
+) -> None:
+    groups_positions: Dict[datetime, int] = {
+        time_label: position
+        for position, time_label in enumerate(batch.time_labels)
+    }
+    # Не все БД сохраняют точность суммы DecimalField
+    # (например, SQLite вернёт Decimal('18') вместо
+    # Decimal('18.0')), поэтому приводим её явно.
+    quantize_values: List[Optional[Decimal]] = [
+        Decimal(1).scaleb(-field.decimal_places)
+        if isinstance(field, DecimalField) else None
+        for field in (
+            meta.model._meta.get_field(name)  # noqa
+            for name in meta.sum_values
+        )
+    ]
+
+    positions: List[int] = []
+    columns: Dict[str, List[Any]] = {
+        name: []
+        for name in chain(meta.export_values, meta.sum_values)
+    }
+    export_columns = list(columns.values())[:len(meta.export_values)]
+    sum_columns = list(columns.values())[len(meta.export_values):]
+    for time_label, *values in aggregated_attachments:
+        positions.append(groups_positions[time_label])
+        for column, value in zip(export_columns, values):
+            column.append(value)
+        totals = values[len(export_columns):]
+        for column, value, quantize_value in zip(
+                sum_columns,
+                totals,
+                quantize_values,
+        ):
+            if quantize_value is not None and value is not None:
+                value = value.quantize(quantize_value)
+            column.append(value)
+
+    batch.set_attachments(
+        meta.set_name,
+        positions,
+        columns,
+        per_group=True,
+    )
+
+
+def export_aggregated_attachments(
+        batch: RecordBatch,
+        groupping: str,
+        *args: AggregatedAttachmentMeta,
+) -> None:
+    """
+    Аналог `export_attachments`, который вместо самих
+    атачментов получает из БД их суммы по группам
+    (GROUP BY time_label) и прикрепляет их к группам
+    `batch`, а не к записям.
+    """
+    meta: AggregatedAttachmentMeta
+    for meta in args:
+        if meta.filter_ is None:
+            # срез пустой, прикреплять нечего
+            continue
+
+        attach_aggregated_attachments(
+            batch,
+            meta,
+            fetch_aggregated_attachments(meta, groupping),
+        )
+
+
+def _fetch_in_own_connection(
+        fetch_func: Callable[..., List[Tuple[Any, ...]]],
+        *args: Any,
+) -> List[Tuple[Any, ...]]:
+    # Вызывается в потоке из пула, у которого своё
+    # соединение с БД; закрываем его так же, как Django
+    # закрывает соединение в конце запроса (с учётом
+    # CONN_MAX_AGE).
+    try:
+        return fetch_func(*args)
+    finally:
+        close_old_connections()
+
+
+async def export_attachments_concurrently(
+        batch: RecordBatch,
+        groupping: str,
+        attachments_metas: Iterable[AttachmentMeta],
+        aggregated_metas: Iterable[AggregatedAttachmentMeta],
+) -> None:
+    """
+    Асинхронный аналог `export_attachments` и
+    `export_aggregated_attachments`: запросы всех
+    прикреплений выполняются одновременно, каждый в
+    своём потоке со своим соединением с БД.
+    """
+    attachments_metas = [
+        meta
+        for meta in attachments_metas
+        if meta.filter_ is not None
+    ]
+    aggregated_metas = [
+        meta
+        for meta in aggregated_metas
+        if meta.filter_ is not None
+    ]
+    fetch = sync_to_async(
+        _fetch_in_own_connection,
+        thread_sensitive=False,
+    )
+
+    results = await asyncio.gather(
+        *(
+            fetch(fetch_attachments, meta)
+            for meta in attachments_metas
+        ),
+        *(
+            fetch(fetch_aggregated_attachments, meta, groupping)
+            for meta in aggregated_metas
+        ),
+    )
+
+    results_iterator = iter(results)
+    for meta in attachments_metas:
+        attach_attachments(batch, meta, next(results_iterator))
+    for meta in aggregated_metas:
+        attach_aggregated_attachments(batch, meta, next(results_iterator))
 
 
 def get_meal_display_data(
-        records: Iterable[Dict[str, Any]],
+        batch: RecordBatch,
         columns: List[Dict[str, str]],
         response_rows: List[Dict[str, Any]],
-        key_func: Callable[[Dict[str, Any]], Any],
 ) -> None:
     columns.append(dict(
         data_index='meal',
         header='Съедено (ХЕ)',
     ))
-    records_groups_iterator = map(
-        itemgetter(1),
-        groupby(records, key_func)
-    )
 
     zipped = zip(
         response_rows,
-        records_groups_iterator,
+        batch.iter_groups_values('meals', 'food_quantity'),
     )
-
-    for row, records_group in zipped:
-        row['meal'] = Decimal()
-        for record in records_group:
-            for meal_info in record['meals']:  # fixme: pass attachment_set_name
-                row['meal'] += meal_info['food_quantity']
-
-    for row in response_rows:
-        value = row['meal']
-        row['meal'] = str(value) if value else None
+    for row, meals in zipped:
+        value = sum(
+            (food_quantity for food_quantity, in meals),
+            Decimal(),
+        )
+        # Decimal отдаётся сериализатором строкой
+        row['meal'] = value or None
 
 
 def get_injections_display_data(
-        records: Iterable[Dict[str, Any]],
+        batch: RecordBatch,
         columns: List[Dict[str, str]],
         response_rows: List[Dict[str, Any]],
-        key_func: Callable[[Dict[str, Any]], Any],
 ) -> None:
-    records_groups_iterator = map(
-        itemgetter(1),
-        groupby(records, key_func)
-    )
     zipped = zip(
         response_rows,
-        records_groups_iterator,
+        batch.iter_groups_values(
+            'injections',
+            'insulin_syringe__insulin_mark',
+            'insulin_syringe__insulin_mark__name',
+            'insulin_quantity',
+        ),
     )
 
     data_indices: Dict[int, str] = dict()
     insulin_columns: List[Dict[str, str]] = []
 
-    for row, records_group in zipped:
-        for record in records_group:
-            for injection_info in record['injections']:  # fixme: pass attachment_set_name
-                mark_id = injection_info['insulin_syringe__insulin_mark']
-                data_index = data_indices.get(
+    for row, injections in zipped:
+        for mark_id, mark_name, insulin_quantity in injections:
+            data_index = data_indices.get(
+                mark_id,
+            )
+            if data_index is None:
+                data_index = 'insulin_{}'.format(
                     mark_id,
                 )
-                if data_index is None:
-                    data_index = 'insulin_{}'.format(
-                        mark_id,
-                    )
-                    insulin_columns.append(dict(
-                        header=injection_info['insulin_syringe__insulin_mark__name'],
-                        data_index=data_index,
-                    ))
-                    data_indices[mark_id] = data_index
-                    for row_ in response_rows:
-                        row_.setdefault(data_index, 0)
-                row[data_index] += injection_info['insulin_quantity']
+                insulin_columns.append(dict(
+                    header=mark_name,
+                    data_index=data_index,
+                ))
+                data_indices[mark_id] = data_index
+                for row_ in response_rows:
+                    row_.setdefault(data_index, 0)
+            row[data_index] += insulin_quantity
 
     for row in response_rows:
         for idx in data_indices.values():
@@ -333,31 +1113,80 @@ def get_injections_display_data(
     columns.extend(insulin_columns)
 
 
+def get_page_insulin_columns(
+        who_id: int,
+        groupping: str,
+        slice_filter: Dict[str, Any],
+) -> List[Dict[str, str]]:
+    """
+    Колонки инсулина, которые `get_injections_display_data`
+    добавит для всей страницы `slice_filter`, -- когда
+    строки страницы собираются по частям. Для
+    `SUMMARIZED_GROUPPINGS` сводки страницы уже должны
+    быть построены.
+    """
+    min_when, max_when = slice_filter['when__range']
+    marks: QuerySet
+    if groupping in SUMMARIZED_GROUPPINGS:
+        marks = DailyInsulinSummary.objects.filter(
+            summary__who=who_id,
+            summary__day__range=(
+                _get_local_day(min_when),
+                _get_local_day(max_when),
+            ),
+        ).values_list(
+            'insulin_mark',
+            'insulin_mark__name',
+        )
+    else:
+        marks = InsulinInjection.objects.filter(
+            **{
+                f'record__{k}': v
+                for k, v in slice_filter.items()
+            }
+        ).values_list(
+            'insulin_syringe__insulin_mark',
+            'insulin_syringe__insulin_mark__name',
+        )
+
+    insulin_columns: List[Dict[str, str]] = [
+        dict(
+            header=mark_name,
+            data_index='insulin_{}'.format(
+                mark_id,
+            ),
+        )
+        for mark_id, mark_name in marks.order_by().distinct()
+    ]
+    insulin_columns.sort(key=itemgetter('header', 'data_index'))
+    return insulin_columns
+
+
 def get_sugar_display_data(
-        records: List[Dict[str, Any]],  # на самом деле не list, а values-QuerySet
+        batch: RecordBatch,
         columns: List[Dict[str, str]],
         response_rows: List[Dict[str, Any]],
-        key_func: Callable[[Dict[str, Any]], Any],
         groupping: str,
+        who_id: int,
 ) -> None:
     if groupping == DateAggregateEnum.NONE:
         _get_single_sugar_display_data(
-            records,
+            batch,
             columns,
             response_rows,
         )
     else:
         _get_groupped_sugar_display_data(
-            records,
+            batch,
             columns,
             response_rows,
-            key_func,
             groupping,
+            who_id,
         )
 
 
 def _get_single_sugar_display_data(
-        records: Collection[Dict[str, Any]],
+        batch: RecordBatch,
         columns: List[Dict[str, str]],
         response_rows: List[Dict[str, Any]],
 ) -> None:
@@ -368,211 +1197,144 @@ def _get_single_sugar_display_data(
 
     # Если нет группировки, то у нас каждой записи из
     # БД соответствует одна строка таблицы
-    for row, record in zip(response_rows, records):
-        try:
-            sugar_value = next(
-                iter(record['sugar_meterings']),
-            )
-            row['sugar_level'] = str(sugar_value['sugar_level'])
-        except StopIteration:
+    zipped = zip(
+        response_rows,
+        batch.iter_groups_values('sugar_meterings', 'sugar_level'),
+    )
+    for row, sugar_meterings in zipped:
+        if sugar_meterings:
+            (sugar_level,), *_ = sugar_meterings
+            row['sugar_level'] = sugar_level
+        else:
             row['sugar_level'] = '-'
 
 
-def _extend_stored_meterings(
-        stored_time_moments_iterator: Iterator[int],  # fixme: rename to `timestamps`
-        stored_values_iterator: Iterator[float],
+# FIXME: don't use NamedTuples?
+class NeighbourMeterings(NamedTuple):
+    before_first: Optional[Tuple[datetime, Decimal]]
+    # Последнее измерение пользователя раньше
+    # `first_moment`: (момент, уровень сахара)
+
+    after_last: Optional[Tuple[datetime, Decimal]]
+    # Первое измерение пользователя позже `last_moment`
+
+
+def get_neighbour_meterings(
+        who_id: int,
         first_moment: datetime,
         last_moment: datetime,
-) -> Tuple[Iterator[float], Iterator[float]]:
-    # done: достать из базы измерение сахара,
-    #  предшествующее самому раннему из
-    #  присутствующих, чтобы более точно
-    #  интерполировать.
-    queryset = SugarMetering.objects.annotate(
-        localized_when=Trunc(
-            expression='record__when',
-            kind='second',
-            output_field=DateTimeField(),
-            tzinfo=timezone(settings.TIME_ZONE),
-        ),
-    ).values(
-        'localized_when',
+        after_lookup: str = 'gt',
+) -> NeighbourMeterings:
+    """
+    Ищет измерения пользователя, соседние с промежутком
+    [first_moment, last_moment]. Оба поиска идут по
+    индексу (who, when) записей и, если БД позволяет,
+    выполняются одним запросом (UNION двух LIMIT 1).
+    """
+    meterings = SugarMetering.objects.filter(
+        record__who=who_id,
+    ).values_list(
+        'record__when',
         'sugar_level',
     )
-
-    before_first = queryset.filter(
+    before_first_queryset = meterings.filter(
         record__when__lt=first_moment,
-    ).last()
-
-    after_last = queryset.filter(
-        record__when__gt=last_moment,
-    ).first()
-
-    if before_first is not None and after_last is not None:
-        stored_time_moments_iterator = chain(
-            (
-                round(before_first['localized_when'].timestamp()),
-            ),
-            stored_time_moments_iterator,
-            (
-                round(after_last['localized_when'].timestamp()),
-            ),
-        )
-        stored_values_iterator = chain(
-            (
-                float(before_first['sugar_level']),
-            ),
-            stored_values_iterator,
-            (
-                float(after_last['sugar_level']),
-            ),
+    ).order_by(
+        '-record__when',
+    )[:1]
+    after_last_queryset = meterings.filter(
+        **{f'record__when__{after_lookup}': last_moment},
+    ).order_by(
+        'record__when',
+    )[:1]
+
+    neighbours: Iterable[Tuple[datetime, Decimal]]
+    if connections[meterings.db].features.supports_slicing_ordering_in_compound:  # noqa
+        neighbours = before_first_queryset.union(
+            after_last_queryset,
+            all=True,
         )
-
-    elif before_first is not None:
-        stored_time_moments_iterator = chain(
-            (
-                round(before_first['localized_when'].timestamp()),
-            ),
-            stored_time_moments_iterator,
-        )
-        stored_values_iterator = chain(
-            (
-                float(before_first['sugar_level']),
-            ),
-            stored_values_iterator,
-        )
-
-    elif after_last is not None:
-        stored_time_moments_iterator = chain(
-            stored_time_moments_iterator,
-            (
-                round(after_last['localized_when'].timestamp()),
-            ),
-        )
-        stored_values_iterator = chain(
-            stored_values_iterator,
-            (
-                float(after_last['sugar_level']),
-            ),
+    else:
+        neighbours = chain(
+            before_first_queryset,
+            after_last_queryset,
         )
 
-    return (
-        stored_time_moments_iterator,
-        stored_values_iterator,
-    )
-
-
-def _interpolate_meterings(
-        records: List[Dict[str, Any]],  # на самом деле не list, а values-QuerySet
-        stored_moments: Tuple[int, ...],
-        stored_values: Tuple[float, ...],
-        key_func: Callable[[Dict[str, Any]], Any],
-        end_group_func: Callable[[datetime], datetime],
-
-) -> Tuple[
-    List[int],
-    Collection[float],
-]:
-    ext_moments: List[int]
-    ext_moments = sorted(set(chain(
-        stored_moments,
-        chain.from_iterable((
-            map(
-                round,
-                (
-                    moment.timestamp(),
-                    end_group_func(moment).timestamp(),
-                ),
-            )
-            for moment in (
-                key_func(record)
-                for record in records
-            )
-        )),
-    )))[:-1]
+    before_first = after_last = None
+    for when, sugar_level in neighbours:
+        if when < first_moment:
+            before_first = (when, sugar_level)
+        else:
+            after_last = (when, sugar_level)
 
-    ext_values = helpers.numpy_interp(
-        ext_moments,
-        stored_moments,
-        stored_values,
+    return NeighbourMeterings(
+        before_first=before_first,
+        after_last=after_last,
     )
-    if settings.DEBUG:
-        ext_values = tuple(ext_values)
 
-    return ext_moments, ext_values
 
-
-def _extend_and_interpolate(
-        records: List[Dict[str, Any]],  # на самом деле не list, а values-QuerySet
-        key_func: Callable[[Dict[str, Any]], Any],
-        end_group_func: Callable[[datetime], datetime],
-) -> Tuple[List[float], Collection[float]]:
-    stored_time_moments_iterator: Iterator[int]
-    stored_time_moments_iterator = (
-        round(record['localized_when'].timestamp())
-        for record in reversed(records)
-        if record['sugar_meterings']
-    )
-    stored_values_iterator = (
-        float(metering['sugar_level'])
-        for record in reversed(records)
-        for metering in record['sugar_meterings']
+def _extend_stored_meterings(
+        stored_meterings_iterator: Iterator[Tuple[int, float]],
+        who_id: int,
+        first_moment: datetime,
+        last_moment: datetime,
+) -> Iterator[Tuple[int, float]]:
+    # done: достать из базы измерение сахара,
+    #  предшествующее самому раннему из
+    #  присутствующих, чтобы более точно
+    #  интерполировать.
+    neighbours = get_neighbour_meterings(
+        who_id,
+        first_moment,
+        last_moment,
     )
 
-    stored_time_moments_iterator, stored_values_iterator = _extend_stored_meterings(  # noqa
-        stored_time_moments_iterator,
-        stored_values_iterator,
-        records[len(records) - 1]['when'],
-        records[0]['when'],
-    )
+    def get_stored_metering(
+            metering: Optional[Tuple[datetime, Decimal]],
+    ) -> Iterator[Tuple[int, float]]:
+        if metering is not None:
+            when, sugar_level = metering
+            yield (
+                round(when.replace(microsecond=0).timestamp()),
+                float(sugar_level),
+            )
 
-    stored_moments: Tuple[int, ...]
-    stored_moments = tuple(stored_time_moments_iterator)
+    return chain(
+        get_stored_metering(neighbours.before_first),
+        stored_meterings_iterator,
+        get_stored_metering(neighbours.after_last),
+    )
 
-    stored_values: Tuple[float, ...]
-    stored_values = tuple(stored_values_iterator)
 
-    return _interpolate_meterings(
-        records,
-        stored_moments,
-        stored_values,
-        key_func,
-        end_group_func,
+GROUPPED_SUGAR_COLUMNS: Tuple[Dict[str, str], ...] = (
+    dict(
+        data_index='sugar_level',
+        header='Средний сахар',
+    ),
+    dict(
+        data_index='max_sugar',
+        header='Max',
+    ),
+    dict(
+        data_index='min_sugar',
+        header='Min',
+    ),
+    dict(
+        data_index='meterings_count',
+        header='Измерений',
     )
+)
 
 
-def _get_groupped_sugar_display_data(
-        records: List[Dict[str, Any]],  # на самом деле не list, а values-QuerySet
+def _extend_groupped_sugar_columns(
         columns: List[Dict[str, str]],
         response_rows: List[Dict[str, Any]],
-        key_func: Callable[[Dict[str, Any]], Any],
-        groupping: str,
 ) -> None:
-    end_group_func: Callable[[datetime], datetime]
-    end_group_func = TIME_LABEL_ENDS[groupping]
-
-    extending_columns: Tuple[Dict[str, str], ...]
-    extending_columns = (
-        dict(
-            data_index='sugar_level',
-            header='Средний сахар',
-        ),
-        dict(
-            data_index='max_sugar',
-            header='Max',
-        ),
-        dict(
-            data_index='min_sugar',
-            header='Min',
-        ),
-        dict(
-            data_index='meterings_count',
-            header='Измерений',
-        )
+    columns.extend(
+        dict(column)
+        for column in GROUPPED_SUGAR_COLUMNS
     )
 
-    columns.extend(extending_columns)
-
     new_cells_iterator: Iterator[Tuple[
         Dict[str, Any],  # row
         str,  # data_index
@@ -581,96 +1343,271 @@ def _get_groupped_sugar_display_data(
         response_rows,
         map(
             itemgetter('data_index'),
-            extending_columns,
+            GROUPPED_SUGAR_COLUMNS,
         ),
     )
     for row, data_index in new_cells_iterator:
         row[data_index] = '-'
 
-    ext_moments, ext_values = _extend_and_interpolate(
-        records,
-        key_func,
-        end_group_func,
+
+def _get_sugar_display(value: float) -> str:
+    display = '{:.2f}'.format(value)
+    if display[-1] == '0':
+        display = display[:-1]
+
+    return display
+
+
+def _get_groupped_sugar_display_data(
+        batch: RecordBatch,
+        columns: List[Dict[str, str]],
+        response_rows: List[Dict[str, Any]],
+        groupping: str,
+        who_id: int,
+) -> None:
+    end_group_func: Callable[[datetime], datetime]
+    end_group_func = TIME_LABEL_ENDS[groupping]
+
+    _extend_groupped_sugar_columns(
+        columns,
+        response_rows,
+    )
+
+    if not response_rows:
+        return
+
+    stored_meterings_iterator: Iterator[Tuple[int, float]]
+    stored_meterings_iterator = (
+        (timestamp, float(sugar_level))
+        for timestamp, sugar_level in batch.iter_chronological_values(
+            'sugar_meterings',
+            'sugar_level',
+        )
+    )
+
+    stored_meterings_iterator = _extend_stored_meterings(
+        stored_meterings_iterator,
+        who_id,
+        batch.first_when,
+        batch.last_when,
     )
 
-    ext_arrays_length = len(ext_moments)
-    assert ext_arrays_length == len(ext_values)
+    periods: List[Tuple[int, int]] = [
+        (
+            round(time_label.timestamp()),
+            round(end_group_func(time_label).timestamp()),
+        )
+        for time_label in reversed(batch.time_labels)
+    ]
 
-    records_groups_iterator = map(
-        itemgetter(1),
-        groupby(reversed(records), key_func),
+    groups_stats_iterator = iter_groupped_sugar_stats(
+        stored_meterings_iterator,
+        periods,
     )
     zipped = zip(
         reversed(response_rows),
-        records_groups_iterator,
+        groups_stats_iterator,
     )
-    ext_start = 0
-    for row, records_group in zipped:
-        records_group_iterator = (
-            record
-            for record in records_group
-            if record['sugar_meterings']
-        )
-        try:
-            first_record = next(records_group_iterator)
-            time_label = first_record['time_label']
-            records_group_len = sum(
-                (1 for _ in records_group_iterator),
-                1,
-            )
-        except StopIteration:
+    for row, group_stats in zipped:
+        if group_stats is None:
             continue
 
-        start_period = round(time_label.timestamp())
-        stop_period = round(end_group_func(time_label).timestamp())
+        row['sugar_level'] = '{:.2f}'.format(group_stats.average)
 
-        while (ext_start < ext_arrays_length
-                and ext_moments[ext_start] < start_period):
-            ext_start += 1
-
-        ext_stop = ext_start + records_group_len
+        display_values = map(
+            _get_sugar_display,
+            (group_stats.min_value, group_stats.max_value),
+        )
+        row['min_sugar'], row['max_sugar'] = display_values
 
-        assert ext_moments[ext_stop] <= stop_period
-        while (ext_stop < ext_arrays_length
-                and ext_moments[ext_stop] < stop_period):
-            ext_stop += 1
+        row['meterings_count'] = group_stats.meterings_count
 
-        if ext_stop >= ext_arrays_length:
-            stop_period = ext_moments[-1]
 
-        ext_moments_slice = ext_moments[ext_start:ext_stop+1]
-        ext_values_slice = ext_values[ext_start:ext_stop+1]
+# FIXME: don't use NamedTuples?
+class SugarGroupStats(NamedTuple):
+    average: float
+    min_value: float
+    max_value: float
+    meterings_count: int
+
+
+class _SugarMeteringsCursor:
+    """
+    Курсор по упорядоченному по времени потоку измерений
+    (момент, значение). Помнит два последних пройденных
+    измерения и заглядывает вперёд не больше, чем на два,
+    поэтому расходует O(1) памяти.
+    """
+    def __init__(self, meterings: Iterable[Tuple[int, float]]) -> None:
+        self._iterator: Iterator[Tuple[int, float]] = iter(meterings)
+        self._passed: Deque[Tuple[int, float]] = deque(maxlen=2)
+        self._ahead: Deque[Tuple[int, float]] = deque()
+
+    def peek(self, idx: int = 0) -> Optional[Tuple[int, float]]:
+        while len(self._ahead) <= idx:
+            metering = next(self._iterator, None)
+            if metering is None:
+                return None
+            self._ahead.append(metering)
+        return self._ahead[idx]
+
+    def pass_one(self) -> None:
+        self.peek()
+        self._passed.append(self._ahead.popleft())
+
+    def pass_before(self, moment: int) -> None:
+        while True:
+            metering = self.peek()
+            if metering is None or metering[0] >= moment:
+                return
+            self.pass_one()
+
+    def get_value(self, moment: int) -> float:
+        """
+        Значение в момент `moment` по тем же правилам, что
+        и в `core.helpers.numpy_interp`: берётся отрезок,
+        правый конец которого -- первое измерение не раньше
+        `moment`, а за крайними измерениями значения
+        экстраполируются по крайним отрезкам.
+        """
+        self.pass_before(moment)
+        head = self.peek()
+        if head is not None and self._passed:
+            left, right = self._passed[-1], head
+        elif head is not None:
+            left, right = head, self.peek(1)
+        elif len(self._passed) == 2:
+            left, right = self._passed
+        else:
+            left, right = self._passed[-1], None
 
-        integrated_value = helpers.scipy_integrate_trapz(
-            ext_values_slice,
-            ext_moments_slice,
+        return _get_linear_value(
+            [left] if right is None else [left, right],
+            moment,
         )
-        averaged_value = integrated_value / (stop_period - start_period)
-        row['sugar_level'] = '{:.2f}'.format(averaged_value)
 
-        ext_values_slice_iterator = iter(ext_values_slice)
-        max_value = min_value = next(ext_values_slice_iterator)
-        for value in ext_values_slice_iterator:
-            if value > max_value:
-                max_value = value
-            elif value < min_value:
-                min_value = value
 
-        def get_display(value: float) -> str:
-            display = '{:.2f}'.format(value)
-            if display[-1] == '0':
-                display = display[:-1]
+def _get_linear_value(
+        meterings: List[Tuple[int, float]],
+        moment: int,
+) -> float:
+    """
+    Значение в момент `moment` на прямой через два
+    измерения (или постоянное, если измерение одно).
+    """
+    if len(meterings) == 1:
+        # единственное измерение
+        (_, value), = meterings
+        return value
+
+    (prev_arg, prev_value), (arg, value) = meterings
+    factor = 1 / (arg - prev_arg)
+    scale = (value - prev_value) * factor
+    offset = (arg*prev_value - prev_arg*value) * factor
+    return scale*moment + offset
+
+
+def _integrate_linear(
+        meterings: List[Tuple[int, float]],
+        begin: int,
+        end: int,
+) -> float:
+    """
+    Интеграл прямой `_get_linear_value(meterings, ...)`
+    на промежутке [begin, end].
+    """
+    return (end - begin) * (
+        _get_linear_value(meterings, begin)
+        + _get_linear_value(meterings, end)
+    ) / 2
+
+
+def _get_group_stats(
+        cursor: _SugarMeteringsCursor,
+        start_period: int,
+        stop_period: int,
+        is_last: bool,
+) -> Optional[SugarGroupStats]:
+    cursor.pass_before(start_period)
+    head = cursor.peek()
+    if head is None or head[0] >= stop_period:
+        # в группе нет измерений
+        return None
+
+    prev_moment = start_period
+    prev_value = cursor.get_value(start_period)
+    min_value = max_value = prev_value
+    double_integral = 0.0
+    meterings_count = 0
+
+    def add_point(moment: int, value: float) -> None:
+        nonlocal prev_moment, prev_value, min_value, max_value, double_integral  # noqa
+        double_integral += (moment - prev_moment) * (value + prev_value)
+        if value > max_value:
+            max_value = value
+        elif value < min_value:
+            min_value = value
+        prev_moment, prev_value = moment, value
+
+    while head is not None and head[0] < stop_period:
+        meterings_count += 1
+        if head[0] > start_period:
+            add_point(head[0], cursor.get_value(head[0]))
+        cursor.pass_one()
+        head = cursor.peek()
+
+    # Самая поздняя группа заканчивается на последнем
+    # измерении, если после неё измерений нет.
+    is_clipped = is_last and (
+        head is None
+        or head[0] == stop_period and cursor.peek(1) is None
+    )
+    if is_clipped:
+        stop_period = prev_moment
+    else:
+        add_point(stop_period, cursor.get_value(stop_period))
+
+    if stop_period == start_period:
+        average = prev_value
+    else:
+        average = double_integral / 2 / (stop_period - start_period)
+
+    return SugarGroupStats(
+        average=average,
+        min_value=min_value,
+        max_value=max_value,
+        meterings_count=meterings_count,
+    )
 
-            return display
 
-        display_values = map(
-            get_display,
-            (min_value, max_value),
+def iter_groupped_sugar_stats(
+        meterings: Iterable[Tuple[int, float]],
+        periods: Iterable[Tuple[int, int]],
+) -> Iterator[Optional[SugarGroupStats]]:
+    """
+    Однопроходный расчёт среднего (методом трапеций),
+    минимума, максимума и количества измерений по
+    группам. `meterings` -- измерения (unix-время,
+    значение), `periods` -- границы групп [начало,
+    конец); и те, и другие упорядочены по времени.
+
+    Для каждого периода выдаёт `SugarGroupStats` или
+    None, если в нём нет измерений. Уровень сахара на
+    границах групп интерполируется по соседним
+    измерениям, а до первого измерения -- линейно
+    экстраполируется.
+    """
+    cursor = _SugarMeteringsCursor(meterings)
+    periods_iterator = iter(periods)
+    period = next(periods_iterator, None)
+    while period is not None:
+        next_period = next(periods_iterator, None)
+        yield _get_group_stats(
+            cursor,
+            *period,
+            is_last=next_period is None,
         )
-        row['min_sugar'], row['max_sugar'] = display_values
-
-        row['meterings_count'] = records_group_len
-        ext_start = ext_stop
+        period = next_period
 
 
 class SugarMeteringTuple(NamedTuple):
@@ -693,23 +1630,57 @@ class ISugarAverager:
 
 
 class TrapezoidalSugarAverager(ISugarAverager):
+    """
+    Пока значений не запрашивали, измерения только
+    накапливаются и при первом запросе сортируются разом.
+    После этого каждое новое измерение встраивается на своё
+    место: добавление в конец (по времени) дописывает один
+    отрезок, а вставка в середину заменяет отрезок между
+    соседями двумя, так что чередование `add_metering` и
+    запросов не пересчитывает всё заново.
+    """
     STAMPS_EPSILON = 1e-6
 
     def __init__(self) -> None:
         self._meterings: List[SugarMeteringTuple] = []
-        self._unix_stamps: Optional[Tuple[float, ...]] = None
-        self._prepared: bool = True
-        self._coeffs: Optional[List[
-                Optional[Tuple[
-                    float,
-                    float,
-                ]]
-            ]]
-        self._coeffs = None
+        self._unix_stamps: List[float] = []
+        self._prepared: bool = False
+        self._coeffs: List[Tuple[
+            float,
+            float,
+        ]] = []
 
     def add_metering(self, metering: SugarMeteringTuple) -> None:
-        self._meterings.append(metering)
-        self._prepared = False
+        if not self._prepared:
+            self._meterings.append(metering)
+            return
+
+        unix_when = metering.when.timestamp()
+        # после измерений с тем же временем, как при
+        # устойчивой сортировке в `_prepare`
+        idx = bisect_right(self._unix_stamps, unix_when)
+        self._meterings.insert(idx, metering)
+        insort_right(self._unix_stamps, unix_when)
+        try:
+            new_coeffs = [
+                self._get_segment_coeffs(
+                    self._meterings[segment_idx],
+                    self._meterings[1+segment_idx],
+                )
+                for segment_idx in (idx-1, idx)
+                if 0 <= segment_idx < len(self._meterings)-1
+            ]
+        except ZeroDivisionError:
+            # измерения с одинаковым временем: ошибка, как и
+            # раньше, -- при запросе
+            self._prepared = False
+            return
+
+        # Отрезок между соседями делится на два, а с краю
+        # добавляется один новый отрезок.
+        start = max(idx-1, 0)
+        is_inner = 0 < idx < len(self._meterings)-1
+        self._coeffs[start:start+is_inner] = new_coeffs
 
     def get_value(self, when: Union[datetime, float], chunk_idx: Optional[int] = None, force: bool = False) -> float:
         self._prepare()
@@ -802,13 +1773,24 @@ class TrapezoidalSugarAverager(ISugarAverager):
             self._meterings.sort(
                 key=attrgetter('when'),
             )
-            self._unix_stamps = tuple(
+            self._unix_stamps = [
                 item.when.timestamp()
                 for item in self._meterings
-            )
+            ]
             self._do_prepare()
             self._prepared = True
 
+    @staticmethod
+    def _get_segment_coeffs(
+            prev_point: SugarMeteringTuple,
+            curr_point: SugarMeteringTuple,
+    ) -> Tuple[float, float]:
+        float_curr_point_value: float = float(curr_point.value)
+        float_curr_point_when: float = curr_point.when.timestamp()
+        factor: float = (float_curr_point_value - float(prev_point.value)) / (float_curr_point_when - prev_point.when.timestamp())
+        offset: float = float_curr_point_value - factor*float_curr_point_when
+        return offset, factor
+
     def _do_prepare(self) -> None:
         assert not self._prepared
         meterings_pairs_iterator: Iterator[Tuple[
@@ -819,16 +1801,10 @@ class TrapezoidalSugarAverager(ISugarAverager):
             self._meterings,
             islice(self._meterings, 1, None),
         )
-        self._coeffs = list(repeat(
-            None,
-            times=len(self._meterings) - 1,
-        ))
-        for idx, (prev_point, curr_point) in enumerate(meterings_pairs_iterator):
-            float_curr_point_value: float = float(curr_point.value)
-            float_curr_point_when: float = curr_point.when.timestamp()
-            factor: float = (float_curr_point_value - float(prev_point.value)) / (float_curr_point_when - prev_point.when.timestamp())
-            offset: float = float_curr_point_value - factor*float_curr_point_when
-            self._coeffs[idx] = (offset, factor)
+        self._coeffs = [
+            self._get_segment_coeffs(prev_point, curr_point)
+            for prev_point, curr_point in meterings_pairs_iterator
+        ]
 
     def _determine_chunk_idx(self, unix_when: float) -> int:
         assert self._prepared
@@ -838,3 +1814,671 @@ class TrapezoidalSugarAverager(ISugarAverager):
             unix_when,
         )
         return chunk_idx
+
+
+SUMMARIZED_GROUPPINGS: Tuple[str, ...] = (
+    # группировки, строки которых собираются
+    # из суточных сводок
+    DateAggregateEnum.WEEK,
+    DateAggregateEnum.MONTH,
+    DateAggregateEnum.YEAR,
+)
+
+
+def _get_day_start(day: date) -> datetime:
+    using_timezone = timezone(settings.TIME_ZONE)
+    return using_timezone.localize(datetime.combine(
+        day,
+        time(),
+    ))
+
+
+def _get_local_day(when: datetime) -> date:
+    return helpers.with_server_timezone(when).date()
+
+
+def _get_user_meterings(who_id: int) -> QuerySet:
+    return SugarMetering.objects.filter(
+        record__who=who_id,
+    ).order_by(
+        'record__when',
+    ).values_list(
+        'record__when',
+        'sugar_level',
+    )
+
+
+def _get_days_totals(
+        queryset: QuerySet,
+        *export_values: str,
+        sum_value: str,
+) -> Iterator[Tuple[Any, ...]]:
+    """
+    Суммы `sum_value` по суткам (и по `export_values`);
+    каждый элемент -- (дата, *export_values, сумма).
+    """
+    totals = queryset.annotate(
+        time_label=get_time_label_expression(
+            DateAggregateEnum.DAY,
+            expression='record__when',
+        ),
+    ).order_by().values(
+        'time_label',
+        *export_values,
+    ).annotate(
+        total=Sum(sum_value),
+    ).values_list(
+        'time_label',
+        *export_values,
+        'total',
+    )
+    for time_label, *values in totals:
+        yield (_get_local_day(time_label), *values)
+
+
+def _refresh_daily_summaries_chunk(
+        who_id: int,
+        first_day: date,
+        last_day: date,
+) -> None:
+    begin = _get_day_start(first_day)
+    end = _get_day_start(last_day + ONE_DAY)
+
+    window_meterings: List[SugarMeteringTuple] = [
+        SugarMeteringTuple(*metering)
+        for metering in _get_user_meterings(who_id).filter(
+            record__when__gte=begin,
+            record__when__lt=end,
+        )
+    ]
+    # Соседние измерения нужны, чтобы проинтегрировать
+    # уровень сахара на краях промежутка.
+    all_meterings: List[SugarMeteringTuple] = [
+        SugarMeteringTuple(*metering)
+        for metering in get_neighbour_meterings(
+            who_id,
+            begin,
+            end,
+            after_lookup='gte',
+        )
+        if metering is not None
+    ]
+    all_meterings.extend(window_meterings)
+
+    averager: Optional[TrapezoidalSugarAverager] = None
+    if len(all_meterings) > 1:
+        averager = TrapezoidalSugarAverager()
+        for metering in all_meterings:
+            averager.add_metering(metering)
+        first_when = min(map(attrgetter('when'), all_meterings))
+        last_when = max(map(attrgetter('when'), all_meterings))
+
+    summaries_by_days: Dict[date, DailySugarSummary] = {}
+
+    def get_summary(day_: date) -> DailySugarSummary:
+        summary_ = summaries_by_days.get(day_)
+        if summary_ is None:
+            summary_ = summaries_by_days[day_] = DailySugarSummary(
+                who_id=who_id,
+                day=day_,
+            )
+        return summary_
+
+    for day, day_meterings in groupby(
+            window_meterings,
+            lambda metering_: _get_local_day(metering_.when),
+    ):
+        values = [metering.value for metering in day_meterings]
+        summary = get_summary(day)
+        summary.meterings_count = len(values)
+        summary.min_sugar = min(values)
+        summary.max_sugar = max(values)
+
+    if averager is not None:
+        day = first_day
+        while day <= last_day:
+            day_start = _get_day_start(day)
+            day_end = _get_day_start(day + ONE_DAY)
+            integrate_begin = max(day_start, first_when)
+            integrate_end = min(day_end, last_when)
+            if integrate_begin < integrate_end:
+                summary = get_summary(day)
+                summary.sugar_duration = (
+                    integrate_end - integrate_begin
+                ).total_seconds()
+                summary.sugar_integral = summary.sugar_duration * averager.get_avg(  # noqa
+                    integrate_begin,
+                    integrate_end,
+                )
+                if first_when <= day_start:
+                    summary.start_sugar = averager.get_value(day_start)
+                if day_end <= last_when:
+                    summary.end_sugar = averager.get_value(day_end)
+            day += ONE_DAY
+
+    for day, total in _get_days_totals(
+            Meal.objects.filter(
+                record__who=who_id,
+                record__when__gte=begin,
+                record__when__lt=end,
+            ),
+            sum_value='food_quantity',
+    ):
+        if total:
+            get_summary(day).total_meal = total
+
+    insulin_totals: List[Tuple[date, int, int]] = [
+        (day, mark_id, total)
+        for day, mark_id, total in _get_days_totals(
+            InsulinInjection.objects.filter(
+                record__who=who_id,
+                record__when__gte=begin,
+                record__when__lt=end,
+            ),
+            'insulin_syringe__insulin_mark',
+            sum_value='insulin_quantity',
+        )
+        if total
+    ]
+    for day, _, _ in insulin_totals:
+        get_summary(day)
+
+    DailySugarSummary.objects.filter(
+        who=who_id,
+        day__range=(first_day, last_day),
+    ).delete()
+    DailySugarSummary.objects.bulk_create(
+        summaries_by_days.values(),
+    )
+
+    if insulin_totals:
+        # `bulk_create` возвращает первичные ключи не во
+        # всех БД, поэтому достаём их по уникальному ключу.
+        summaries_ids: Dict[date, int] = dict(
+            DailySugarSummary.objects.filter(
+                who=who_id,
+                day__range=(first_day, last_day),
+            ).values_list(
+                'day',
+                'pk',
+            ),
+        )
+        DailyInsulinSummary.objects.bulk_create(
+            DailyInsulinSummary(
+                summary_id=summaries_ids[day],
+                insulin_mark_id=mark_id,
+                total_insulin=total,
+            )
+            for day, mark_id, total in insulin_totals
+        )
+
+
+def _refresh_daily_summaries_range(
+        who_id: int,
+        first_day: date,
+        last_day: date,
+        chunk_days: int = SUMMARY_CHUNK_DAYS,
+) -> None:
+    chunk_first_day = first_day
+    while chunk_first_day <= last_day:
+        chunk_last_day = min(
+            last_day,
+            chunk_first_day + timedelta(days=chunk_days - 1),
+        )
+        _refresh_daily_summaries_chunk(
+            who_id,
+            chunk_first_day,
+            chunk_last_day,
+        )
+        chunk_first_day = chunk_last_day + ONE_DAY
+
+
+@atomic
+def refresh_daily_summaries(
+        who_id: int,
+        first_moment: datetime,
+        last_moment: Optional[datetime] = None,
+) -> None:
+    """
+    Пересчитывает суточные сводки после изменения
+    данных пользователя между моментами `first_moment`
+    и `last_moment` (включительно). Изменение измерения
+    сахара влияет на интеграл вплоть до соседних
+    измерений, поэтому пересчитываются и их сутки.
+    """
+    if last_moment is None:
+        last_moment = first_moment
+
+    before_first, after_last = get_neighbour_meterings(
+        who_id,
+        first_moment,
+        last_moment,
+    )
+
+    _refresh_daily_summaries_range(
+        who_id,
+        _get_local_day(
+            first_moment if before_first is None else before_first[0],
+        ),
+        _get_local_day(
+            last_moment if after_last is None else after_last[0],
+        ),
+    )
+
+
+@atomic
+def rebuild_daily_summaries(
+        who_id: int,
+        chunk_days: int = SUMMARY_CHUNK_DAYS,
+) -> None:
+    DailySugarSummary.objects.filter(
+        who=who_id,
+    ).delete()
+
+    bounds = Record.objects.filter(
+        who=who_id,
+    ).aggregate(
+        first_when=Min('when'),
+        last_when=Max('when'),
+    )
+    if bounds['first_when'] is None:
+        return
+
+    _refresh_daily_summaries_range(
+        who_id,
+        _get_local_day(bounds['first_when']),
+        _get_local_day(bounds['last_when']),
+        chunk_days,
+    )
+
+
+# FIXME: don't use NamedTuples?
+class DailySummaryTuple(NamedTuple):
+    day: date
+    meterings_count: int
+    min_sugar: Optional[Decimal]
+    max_sugar: Optional[Decimal]
+    start_sugar: Optional[float]
+    end_sugar: Optional[float]
+    sugar_integral: float
+    sugar_duration: float
+
+
+def export_daily_summaries(
+        batch: RecordBatch,
+        who_id: int,
+        groupping: str,
+) -> None:
+    """
+    Прикрепляет к группам `batch` суточные сводки
+    пользователя (набор `sugar_summaries`), а также
+    суммы съеденного (`meals`) и введённого инсулина
+    (`injections`) из них, так что их можно показывать
+    теми же `get_*_display_data`, что и прикрепления
+    записей.
+    """
+    assert groupping in SUMMARIZED_GROUPPINGS
+
+    time_labels = batch.time_labels
+    if not time_labels:
+        return
+
+    summaries = DailySugarSummary.objects.filter(
+        who=who_id,
+    )
+    if not summaries.exists():
+        # сводки ещё ни разу не строились
+        rebuild_daily_summaries(who_id)
+
+    time_label_start: Callable[[datetime], datetime]
+    time_label_start = TIME_LABEL_STARTS[groupping]
+    groups_positions: Dict[datetime, int] = {
+        time_label: position
+        for position, time_label in enumerate(time_labels)
+    }
+
+    def get_group_position(day_: date) -> Optional[int]:
+        return groups_positions.get(
+            time_label_start(_get_day_start(day_)),
+        )
+
+    first_day = _get_local_day(min(time_labels))
+    last_day = _get_local_day(
+        TIME_LABEL_ENDS[groupping](max(time_labels)),
+    ) - ONE_DAY
+    summaries = summaries.filter(
+        day__range=(first_day, last_day),
+    ).order_by(
+        'day',
+    ).values_list(
+        *DailySummaryTuple._fields,
+        'total_meal',
+    )
+
+    summaries_positions: List[int] = []
+    summaries_columns: Dict[str, List[Any]] = {
+        name: []
+        for name in DailySummaryTuple._fields
+    }
+    meals_positions: List[int] = []
+    meals_columns: Dict[str, List[Any]] = {
+        'food_quantity': [],
+    }
+    for *values, total_meal in summaries:
+        position = get_group_position(values[0])
+        if position is None:
+            continue
+        summaries_positions.append(position)
+        for column, value in zip(summaries_columns.values(), values):
+            column.append(value)
+        if total_meal:
+            meals_positions.append(position)
+            meals_columns['food_quantity'].append(total_meal)
+
+    insulin_summaries = DailyInsulinSummary.objects.filter(
+        summary__who=who_id,
+        summary__day__range=(first_day, last_day),
+    ).values_list(
+        'summary__day',
+        'insulin_mark',
+        'insulin_mark__name',
+        'total_insulin',
+    )
+    injections_positions: List[int] = []
+    injections_columns: Dict[str, List[Any]] = {
+        'insulin_syringe__insulin_mark': [],
+        'insulin_syringe__insulin_mark__name': [],
+        'insulin_quantity': [],
+    }
+    for day, *values in insulin_summaries:
+        position = get_group_position(day)
+        if position is None:
+            continue
+        injections_positions.append(position)
+        for column, value in zip(injections_columns.values(), values):
+            column.append(value)
+
+    for set_name, positions, columns in (
+            ('sugar_summaries', summaries_positions, summaries_columns),
+            ('meals', meals_positions, meals_columns),
+            ('injections', injections_positions, injections_columns),
+    ):
+        batch.set_attachments(
+            set_name,
+            positions,
+            columns,
+            per_group=True,
+        )
+
+
+# FIXME: don't use NamedTuples?
+class EdgeMeterings(NamedTuple):
+    first: List[Tuple[int, float]]
+    # Два самых ранних измерения пользователя (одно, если
+    # оно единственное): (unix-время, уровень сахара)
+
+    last: List[Tuple[int, float]]
+    # Два самых поздних, тоже по возрастанию времени
+
+
+def get_edge_meterings(who_id: int) -> Optional[EdgeMeterings]:
+    """
+    Крайние измерения пользователя, по которым уровень
+    сахара экстраполируется за пределы его измерений;
+    None, если измерений нет. Два запроса по индексу
+    (who, when) записей.
+    """
+    meterings = _get_user_meterings(who_id)
+
+    def get_stored_meterings(
+            queryset: QuerySet,
+    ) -> List[Tuple[int, float]]:
+        return [
+            (
+                round(when.replace(microsecond=0).timestamp()),
+                float(sugar_level),
+            )
+            for when, sugar_level in queryset[:2]
+        ]
+
+    first = get_stored_meterings(meterings)
+    if not first:
+        return None
+
+    return EdgeMeterings(
+        first=first,
+        last=get_stored_meterings(meterings.reverse())[::-1],
+    )
+
+
+def get_summarized_group_stats(
+        summaries: List[DailySummaryTuple],
+        edges: EdgeMeterings,
+        time_label: datetime,
+        groupping: str,
+        is_last: bool,
+) -> Optional[SugarGroupStats]:
+    """
+    То же, что `_get_group_stats`, но по суточным сводкам
+    дней группы с меткой `time_label`. Сводки
+    хранят интеграл и уровни сахара на границах суток
+    только между крайними измерениями пользователя, а за
+    ними уровень сахара, как и в `_get_group_stats`,
+    экстраполируется по двум крайним измерениям (`edges`);
+    эта часть считается здесь, чтобы изменение крайних
+    измерений не требовало пересчитывать сводки всех
+    суток до и после них.
+    """
+    meterings_count = sum(map(
+        attrgetter('meterings_count'),
+        summaries,
+    ))
+    if not meterings_count:
+        return None
+
+    (first_moment, _), *_ = edges.first
+    *_, (last_moment, _) = edges.last
+    end_time_label = TIME_LABEL_ENDS[groupping](time_label)
+    start_period = round(time_label.timestamp())
+    stop_period = round(end_time_label.timestamp())
+    first_day = _get_local_day(time_label)
+    last_day = _get_local_day(end_time_label) - ONE_DAY
+    first_summary, last_summary = summaries[0], summaries[-1]
+
+    def get_boundary_value(
+            moment: int,
+            summary: DailySummaryTuple,
+            day: date,
+            field_name: str,
+    ) -> Optional[float]:
+        if moment <= first_moment:
+            return _get_linear_value(edges.first, moment)
+        if moment >= last_moment:
+            return _get_linear_value(edges.last, moment)
+        if summary.day != day:
+            return None
+        return getattr(summary, field_name)
+
+    values: List[float] = [
+        float(value)
+        for summary in summaries
+        if summary.meterings_count
+        for value in (summary.min_sugar, summary.max_sugar)
+    ]
+    start_value = get_boundary_value(
+        start_period,
+        first_summary,
+        first_day,
+        'start_sugar',
+    )
+    if start_value is not None:
+        values.append(start_value)
+
+    integral = sum(map(
+        attrgetter('sugar_integral'),
+        summaries,
+    ))
+    if start_period < first_moment:
+        integral += _integrate_linear(
+            edges.first,
+            start_period,
+            first_moment,
+        )
+
+    # Самая поздняя группа заканчивается на последнем
+    # своём измерении, если после неё измерений нет.
+    if is_last and last_moment <= stop_period:
+        if last_moment < stop_period:
+            stop_period = last_moment
+        else:
+            # последнее измерение -- ровно на конце группы,
+            # то есть уже в следующей
+            (stop_period, _), _ = edges.last
+            integral -= _integrate_linear(
+                edges.last,
+                stop_period,
+                last_moment,
+            )
+    else:
+        if last_moment < stop_period:
+            integral += _integrate_linear(
+                edges.last,
+                last_moment,
+                stop_period,
+            )
+        end_value = get_boundary_value(
+            stop_period,
+            last_summary,
+            last_day,
+            'end_sugar',
+        )
+        if end_value is not None:
+            values.append(end_value)
+
+    if stop_period == start_period:
+        # единственное измерение группы -- на её начале,
+        # и оно последнее
+        average = start_value
+    else:
+        average = integral / (stop_period - start_period)
+
+    return SugarGroupStats(
+        average=average,
+        min_value=min(values),
+        max_value=max(values),
+        meterings_count=meterings_count,
+    )
+
+
+def get_summarized_sugar_display_data(
+        batch: RecordBatch,
+        columns: List[Dict[str, str]],
+        response_rows: List[Dict[str, Any]],
+        groupping: str,
+        who_id: int,
+        last_time_label: Optional[datetime] = None,
+) -> None:
+    """
+    Аналог `_get_groupped_sugar_display_data`, который
+    вместо интерполяции измерений складывает суточные
+    сводки (см. `export_daily_summaries`) и даёт те же
+    значения. `last_time_label` -- самая поздняя метка
+    страницы, если `batch` -- только её часть.
+    """
+    _extend_groupped_sugar_columns(
+        columns,
+        response_rows,
+    )
+
+    if not response_rows:
+        return
+
+    edges = get_edge_meterings(who_id)
+    if edges is None:
+        return
+
+    if last_time_label is None:
+        last_time_label = max(batch.time_labels)
+
+    zipped = zip(
+        response_rows,
+        batch.time_labels,
+        batch.iter_groups_values(
+            'sugar_summaries',
+            *DailySummaryTuple._fields,
+        ),
+    )
+    for row, time_label, summaries_values in zipped:
+        group_stats = get_summarized_group_stats(
+            list(map(DailySummaryTuple._make, summaries_values)),
+            edges,
+            time_label,
+            groupping,
+            is_last=time_label == last_time_label,
+        )
+        if group_stats is None:
+            continue
+
+        row['sugar_level'] = '{:.2f}'.format(group_stats.average)
+
+        display_values = map(
+            _get_sugar_display,
+            (group_stats.min_value, group_stats.max_value),
+        )
+        row['min_sugar'], row['max_sugar'] = display_values
+
+        row['meterings_count'] = group_stats.meterings_count
+
+
+DATA_VERSION_KEY_TEMPLATE = 'sugar:data_version:{}'
+GLOBAL_DATA_VERSION_KEY = 'sugar:data_version'
+ROWS_CACHE_KEY_TEMPLATE = 'sugar:rows:{who_id}:{global_version}:{user_version}:{params_hash}'  # noqa
+
+
+def _get_version(key: str) -> str:
+    version = cache.get(key)
+    if version is None:
+        # Версия могла быть вытеснена из кэша, поэтому
+        # новая версия должна отличаться от всех прежних.
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def _set_new_version(key: str) -> None:
+    cache.set(key, uuid.uuid4().hex, timeout=None)
+
+
+def _bump_version(key: str) -> None:
+    _set_new_version(key)
+    # Ответ, посчитанный параллельным запросом до
+    # фиксации транзакции, мог попасть в кэш уже с новой
+    # версией, поэтому после фиксации меняем её ещё раз.
+    on_commit(partial(_set_new_version, key))
+
+
+def bump_data_version(who_id: Optional[int] = None) -> None:
+    """
+    Сбрасывает закэшированные ответы списка записей
+    пользователя `who_id` (или всех пользователей).
+    """
+    if who_id is None:
+        _bump_version(GLOBAL_DATA_VERSION_KEY)
+    else:
+        _bump_version(DATA_VERSION_KEY_TEMPLATE.format(who_id))
+
+
+def get_rows_cache_key(
+        who_id: int,
+        params: Iterable[Tuple[str, Any]],
+) -> str:
+    params_hash = hashlib.md5(json.dumps(
+        sorted(params),
+    ).encode('utf-8')).hexdigest()
+    return ROWS_CACHE_KEY_TEMPLATE.format(
+        who_id=who_id,
+        global_version=_get_version(GLOBAL_DATA_VERSION_KEY),
+        user_version=_get_version(DATA_VERSION_KEY_TEMPLATE.format(who_id)),
+        params_hash=params_hash,
+    )
@@ -1,25 +1,47 @@
 import csv
+import glob
+import os.path
 import pytz
 import re
 from argparse import (
     RawTextHelpFormatter,
 )
+from collections import (
+    deque,
+)
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+)
 from datetime import (
+    date,
     datetime,
+    tzinfo,
 )
 from decimal import (
     Decimal,
 )
-from operator import (
-    itemgetter,
+from itertools import (
+    chain,
+    islice,
 )
 from typing import (
-    Any,
+    Callable,
+    Collection,
+    Deque,
     Dict,
+    Iterable,
+    Iterator,
     List,
+    NamedTuple,
+    Optional,
     Pattern,
+    TextIO,
+    Tuple,
 )
 
+import django
 from django.apps import (
     apps,
 )
@@ -30,7 +52,29 @@ from django.core.management.base import (
     BaseCommand,
     CommandParser,
 )
+from django.db import (
+    connection,
+)
+from django.db.models import (
+    Max,
+)
+from django.db.transaction import (
+    atomic,
+)
+
+from core.changelog import (
+    log_changes,
+)
+from core.helpers import (
+    track_time,
+)
 
+from sugar.helpers import (
+    bump_data_version,
+    rebuild_time_label_index,
+    refresh_daily_summaries,
+    refresh_time_label_index,
+)
 from sugar.models import (
     Record,
     SugarMetering,
@@ -40,6 +84,60 @@ from sugar.models import (
 
 User = apps.get_model(settings.AUTH_USER_MODEL)  # noqa
 
+CHUNK_SIZE = 5000
+# Сколько новых записей можно добавить в индекс страниц
+# по одной (иначе он перестраивается целиком)
+INDEX_REFRESH_LIMIT = 1000
+
+ON_CONFLICT_FAIL = 'fail'
+ON_CONFLICT_SKIP = 'skip'
+ON_CONFLICT_UPDATE = 'update'
+ON_CONFLICT_CHOICES = (
+    ON_CONFLICT_FAIL,
+    ON_CONFLICT_SKIP,
+    ON_CONFLICT_UPDATE,
+)
+
+
+# FIXME: don't use NamedTuples?
+class ImportStats(NamedTuple):
+    created_moments: List[datetime]
+    updated_moments: List[datetime]
+    skipped: int
+
+
+# FIXME: don't use NamedTuples?
+class ImportTotals(NamedTuple):
+    rows_count: int
+    created: int
+    updated: int
+    skipped: int
+
+    def __add__(self, other: 'ImportTotals') -> 'ImportTotals':
+        return ImportTotals(*(
+            value + other_value
+            for value, other_value in zip(self, other)
+        ))
+
+    def format(self, elapsed_time: float) -> str:
+        return (
+            f'{self.rows_count} rows are imported in {elapsed_time:.1f}s '
+            f'({self.rows_count / (elapsed_time or 1):.0f} rows/s): '
+            f'{self.created} created, {self.updated} updated, '
+            f'{self.skipped} skipped'
+        )
+
+
+def parse_csv_rows(
+        rows: List[Tuple[int, List[str]]],
+) -> List[Tuple[datetime, Decimal]]:
+    """
+    Разбирает и проверяет порцию прочитанных строк файла;
+    выполняется в процессах пула, пока основной процесс
+    пишет в БД.
+    """
+    return list(Command().parse_rows(rows))
+
 
 class Command(BaseCommand):
     ENCODING: str = 'utf-8'
@@ -72,8 +170,11 @@ class Command(BaseCommand):
             '-u',
             '--user',
             dest='username',
-            required=True,
             type=str,
+            help=(
+                'Whose diary to import to; if omitted, the user is taken\n'
+                'from each file name: <username>.csv'
+            ),
         )
         parser.add_argument(
             '-f',
@@ -81,7 +182,41 @@ class Command(BaseCommand):
             dest='csv_file_path',
             required=True,
             type=str,
-            help='Path to csv-file'
+            help=(
+                'Path to csv-file, to directory with csv-files\n'
+                'or glob pattern (quote it in the shell)'
+            ),
+        )
+        parser.add_argument(
+            '-j',
+            '--jobs',
+            dest='jobs',
+            type=int,
+            default=None,
+            help=(
+                'How many processes parse files concurrently\n'
+                '(default: number of CPUs, at most number of files)'
+            ),
+        )
+        parser.add_argument(
+            '--chunk-size',
+            dest='chunk_size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='How many rows to insert at once',
+        )
+        parser.add_argument(
+            '--on-conflict',
+            dest='on_conflict',
+            choices=ON_CONFLICT_CHOICES,
+            default=ON_CONFLICT_FAIL,
+            help=(
+                'What to do with rows whose moment is already in the diary '
+                '(or repeats in the file):\n'
+                '    fail: abort the import (default)\n'
+                '    skip: keep the existing record\n'
+                '    update: overwrite the sugar level'
+            ),
         )
 
     @staticmethod
@@ -91,6 +226,24 @@ class Command(BaseCommand):
         except User.DoesNotExist:
             raise ValueError(f'There is no user {username!r}')
 
+    @staticmethod
+    def get_csv_file_paths(csv_file_path: str) -> List[str]:
+        if os.path.isfile(csv_file_path):
+            return [csv_file_path]
+
+        pattern = csv_file_path
+        if os.path.isdir(csv_file_path):
+            pattern = os.path.join(csv_file_path, '*.csv')
+        csv_file_paths = sorted(
+            path
+            for path in glob.glob(pattern)
+            if os.path.isfile(path)
+        )
+        if not csv_file_paths:
+            raise ValueError(f'There are no csv-files at {csv_file_path!r}')
+
+        return csv_file_paths
+
     @staticmethod
     def get_pack(user: User) -> TestStripPack:
         try:
@@ -109,80 +262,588 @@ class Command(BaseCommand):
 
         return pack
 
-    def handle(self, username, csv_file_path: str, *args, **kwargs) -> None:
+    def iter_rows(self, csv_file_path: str) -> Iterator[Tuple[datetime, Decimal]]:  # noqa
+        """
+        Читает файл построчно и возвращает (момент, уровень
+        сахара) каждой строки.
+        """
+        with self.open_csv_file(csv_file_path) as csv_file:
+            yield from self.parse_rows(self.read_rows(csv_file))
+
+    def open_csv_file(self, csv_file_path: str) -> TextIO:
+        # без перевода строк, чтобы `csv.reader` сам
+        # разбирал переводы строк внутри кавычек
+        return open(
+            csv_file_path,
+            'rt',
+            encoding=self.ENCODING,
+            newline='',
+        )
+
+    def read_rows(
+            self,
+            csv_file: Iterable[str],
+    ) -> Iterator[Tuple[int, List[str]]]:
+        """
+        Строки `csv.reader` с номерами строк файла, с которых
+        они начинаются: значение в кавычках может занимать
+        несколько строк файла.
+        """
+        reader = csv.reader(
+            csv_file,
+            delimiter=self.DELIMITER,
+            quotechar=self.QUOTE,
+        )
+        line_number = 1
+        for row in reader:
+            yield line_number, row
+            line_number = reader.line_num + 1
+
+    def iter_parsed_rows(
+            self,
+            executor: Executor,
+            csv_file_path: str,
+            chunk_size: int,
+            jobs: int,
+    ) -> Iterator[Tuple[datetime, Decimal]]:
+        """
+        То же, что `iter_rows`, но строки, прочитанные
+        `csv.reader` в основном процессе, разбираются
+        порциями по `chunk_size` в процессах `executor`.
+        Порций в разборе не больше `jobs` (и одна --
+        в основном процессе), так что память ограничена
+        ими, а не размером файла.
+        """
+        futures: Deque[Future] = deque()
+        try:
+            with self.open_csv_file(csv_file_path) as csv_file:
+                rows = self.read_rows(csv_file)
+                for chunk in iter(lambda: list(islice(rows, chunk_size)), []):  # noqa
+                    futures.append(executor.submit(
+                        parse_csv_rows,
+                        chunk,
+                    ))
+                    if len(futures) > jobs:
+                        yield from futures.popleft().result()
+            while futures:
+                yield from futures.popleft().result()
+        finally:
+            # импорт файла прерван ошибкой
+            for future in futures:
+                future.cancel()
+
+    def parse_rows(
+            self,
+            rows: Iterable[Tuple[int, List[str]]],
+    ) -> Iterator[Tuple[datetime, Decimal]]:
+        """
+        Разбирает строки файла (с номерами, см.
+        `read_rows`) и возвращает (момент, уровень сахара)
+        каждой.
+
+        В выгрузке одни и те же даты, время и уровни сахара
+        повторяются много раз, поэтому каждое значение
+        проверяется регулярным выражением и разбирается
+        один раз, а дальше берётся из словаря. Смещение
+        часового пояса тоже вычисляется раз на дату, если в
+        эти сутки нет перехода на летнее время.
+        """
         timezone = pytz.timezone(settings.TIME_ZONE)
 
-        user = self.get_user(username)
-        pack = self.get_pack(user)
+        # строка даты -> (год, месяц, день) или None
+        dates: Dict[str, Optional[Tuple[int, int, int]]] = {}
+        # строка времени -> (час, минута) или None
+        times: Dict[str, Optional[Tuple[int, int]]] = {}
+        # (год, месяц, день) -> tzinfo суток или None, если
+        # смещение в течение суток меняется
+        day_tzinfos: Dict[Tuple[int, int, int], Optional[tzinfo]] = {}
+        sugar_levels: Dict[str, Optional[Decimal]] = {}
+
+        for line_number, row in rows:
+            raw_date = row[0]
+            try:
+                date_parts = dates[raw_date]
+            except KeyError:
+                date_match = self.DATE_PATTERN.match(raw_date)
+                date_parts = dates[raw_date] = None if date_match is None else (  # noqa
+                    int(date_match.group('year')),
+                    int(date_match.group('month')),
+                    int(date_match.group('day')),
+                )
+
+            raw_time = row[1]
+            try:
+                time_parts = times[raw_time]
+            except KeyError:
+                time_match = self.TIME_PATTERN.match(raw_time)
+                time_parts = times[raw_time] = None if time_match is None else (  # noqa
+                    int(time_match.group('hour')),
+                    int(time_match.group('minute')),
+                )
+
+            if date_parts is None:
+                raise ValueError(
+                    f'Incorrect date value {row[0]!r} in line {line_number}',
+                )
+
+            if time_parts is None:
+                raise ValueError(
+                    f'Incorrect time value {row[1]!r} in line {line_number}',
+                )
+
+            try:
+                day_tzinfo = day_tzinfos[date_parts]
+            except KeyError:
+                day_tzinfo = day_tzinfos[date_parts] = self.get_day_tzinfo(  # noqa
+                    timezone,
+                    date_parts,
+                )
+
+            if day_tzinfo is not None:
+                when = datetime(*date_parts, *time_parts, tzinfo=day_tzinfo)
+            else:
+                when = timezone.localize(datetime(*date_parts, *time_parts))
+
+            raw_sugar_level = row[2]
+            try:
+                sugar_level = sugar_levels[raw_sugar_level]
+            except KeyError:
+                sugar_level = None
+                if self.SUGAR_LEVEL_PATTERN.match(raw_sugar_level):
+                    sugar_level = Decimal(raw_sugar_level)
+                sugar_levels[raw_sugar_level] = sugar_level
+
+            if sugar_level is None:
+                raise ValueError(
+                    f'Incorrect sugar_level value {row[2]!r} in line {line_number}',
+                )
 
-        records_data: Dict[datetime, Dict[str, Any]] = {}
-        records: List[Record] = []
+            yield when, sugar_level
 
-        with open(csv_file_path, 'rt', encoding=self.ENCODING) as csv_file:
-            reader = csv.reader(
-                csv_file,
-                delimiter=self.DELIMITER,
-                quotechar=self.QUOTE,
+    @staticmethod
+    def get_day_tzinfo(
+            timezone: pytz.BaseTzInfo,
+            date_parts: Tuple[int, int, int],
+    ) -> Optional[tzinfo]:
+        """
+        tzinfo, которым можно локализовать любой момент
+        суток, или None, если в эти сутки меняется смещение
+        (тогда каждый момент локализуется отдельно). Для
+        несуществующей даты выбрасывает ту же ошибку, что и
+        конструктор `datetime`.
+        """
+        day_start = timezone.localize(datetime(*date_parts))
+        day_end = timezone.localize(datetime(*date_parts, 23, 59))
+        if day_start.tzinfo is not day_end.tzinfo:
+            return None
+
+        return day_start.tzinfo
+
+    @staticmethod
+    def create_records(
+            user: User,
+            moments: List[datetime],
+    ) -> List[int]:
+        """
+        Создаёт записи пользователя и возвращает их
+        первичные ключи в порядке `moments`.
+        """
+        records = Record.objects.bulk_create(
+            Record(
+                who=user,
+                when=when,
             )
+            for when in moments
+        )
+        if connection.features.can_return_rows_from_bulk_insert:
+            return [record.pk for record in records]
 
-            for row_idx, row in enumerate(reader):
-                date_match = self.DATE_PATTERN.match(row[0])
-                time_match = self.TIME_PATTERN.match(row[1])
+        # Иначе достаём ключи по индексу (who, when):
+        # пара уникальна, а порция занимает непрерывный
+        # промежуток времени, в котором лишних записей
+        # пользователя обычно мало.
+        pks_by_when: Dict[datetime, int] = dict.fromkeys(moments)
+        created_records = Record.objects.filter(
+            who=user,
+            when__range=(min(moments), max(moments)),
+        ).values_list(
+            'when',
+            'pk',
+        )
+        for when, pk in created_records.iterator():
+            if when in pks_by_when:
+                pks_by_when[when] = pk
 
-                if date_match is None:
-                    raise ValueError(
-                        f'Incorrect date value {row[0]!r} in line {row_idx+1}',
-                    )
+        return [pks_by_when[when] for when in moments]
 
-                if time_match is None:
-                    raise ValueError(
-                        f'Incorrect time value {row[1]!r} in line {row_idx+1}',
-                    )
+    @staticmethod
+    def get_metering_pks(
+            user: User,
+            moments: Collection[datetime],
+            meterings: List[SugarMetering],
+    ) -> List[int]:
+        """
+        Первичные ключи созданных `bulk_create` измерений
+        (если БД их не вернула -- одним запросом по индексу
+        (who, when) на промежуток времени порции `moments`).
+        """
+        if connection.features.can_return_rows_from_bulk_insert:
+            return [metering.pk for metering in meterings]
+        if not meterings:
+            return []
+
+        pks_by_record_pk: Dict[int, int] = dict.fromkeys(
+            metering.record_id
+            for metering in meterings
+        )
+        created_meterings = SugarMetering.objects.filter(
+            record__who=user,
+            record__when__range=(min(moments), max(moments)),
+        ).values_list(
+            'record_id',
+            'pk',
+        )
+        for record_pk, pk in created_meterings.iterator():
+            if record_pk in pks_by_record_pk:
+                pks_by_record_pk[record_pk] = pk
 
-                when = timezone.localize(datetime(
-                    year=int(date_match.group('year')),
-                    month=int(date_match.group('month')),
-                    day=int(date_match.group('day')),
-                    hour=int(time_match.group('hour')),
-                    minute=int(time_match.group('minute')),
-                ))
-
-                records.append(Record(
-                    who=user,
-                    when=when,
-                ))
-
-                sugar_level_match = self.SUGAR_LEVEL_PATTERN.match(row[2])
-                if sugar_level_match is None:
+        return [pks_by_record_pk[metering.record_id] for metering in meterings]
+
+    @staticmethod
+    def get_existing_records(
+            user: User,
+            moments: Collection[datetime],
+    ) -> Dict[datetime, Tuple[int, Optional[int], Optional[Decimal]]]:
+        """
+        Уже существующие записи пользователя в моменты
+        `moments`: момент -> (pk записи, pk измерения,
+        уровень сахара). Один запрос по индексу (who, when)
+        на промежуток времени порции.
+        """
+        existing_records = Record.objects.filter(
+            who=user,
+            when__range=(min(moments), max(moments)),
+        ).values_list(
+            'when',
+            'pk',
+            'sugarmetering__pk',
+            'sugarmetering__sugar_level',
+        )
+        return {
+            when: values
+            for when, *values in existing_records.iterator()
+            if when in moments
+        }
+
+    def import_chunk(
+            self,
+            user: User,
+            pack: TestStripPack,
+            chunk: List[Tuple[datetime, Decimal]],
+            on_conflict: str,
+            last_old_record_pk: int = 0,
+    ) -> ImportStats:
+        """
+        Записывает порцию строк файла. Записи с ключом больше
+        `last_old_record_pk` созданы предыдущими порциями
+        этого же файла, так что совпадение с ними -- повтор
+        момента в файле.
+        """
+        sugar_levels: Dict[datetime, Decimal] = {}
+        for when, sugar_level in chunk:
+            if when in sugar_levels:
+                if on_conflict == ON_CONFLICT_FAIL:
                     raise ValueError(
-                        f'Incorrect sugar_level value {row[2]!r} in line {row_idx+1}',
+                        f'Duplicate moment {when.isoformat()} in the file',
                     )
+                if on_conflict == ON_CONFLICT_SKIP:
+                    continue
+            sugar_levels[when] = sugar_level
+
+        existing_records = self.get_existing_records(user, sugar_levels.keys())
+        if existing_records and on_conflict == ON_CONFLICT_FAIL:
+            # момент в том виде, в каком он прочитан из файла
+            when = next(
+                when
+                for when in sugar_levels
+                if when in existing_records
+            )
+            record_pk, *_ = existing_records[when]
+            if record_pk > last_old_record_pk:
+                raise ValueError(
+                    f'Duplicate moment {when.isoformat()} in the file',
+                )
+            raise ValueError(
+                f'Record at {when.isoformat()} already exists',
+            )
+
+        new_moments = [
+            when
+            for when in sugar_levels
+            if when not in existing_records
+        ]
+        new_meterings: List[SugarMetering] = []
+        new_record_pks: List[int] = []
+        if new_moments:
+            new_record_pks = self.create_records(user, new_moments)
+            new_meterings.extend(
+                SugarMetering(
+                    record_id=record_pk,
+                    sugar_level=sugar_levels[when],
+                    pack=pack,
+                )
+                for when, record_pk in zip(new_moments, new_record_pks)
+            )
 
-                records_data[when] = {
-                    'sugar_metering': SugarMetering(
-                        sugar_level=Decimal(row[2]),
+        changed_moments: List[datetime] = list(new_moments)
+        updated_meterings: List[SugarMetering] = []
+        if on_conflict == ON_CONFLICT_UPDATE:
+            for when, (record_pk, metering_pk, sugar_level) in existing_records.items():  # noqa
+                new_sugar_level = sugar_levels[when]
+                if metering_pk is None:
+                    new_meterings.append(SugarMetering(
+                        record_id=record_pk,
+                        sugar_level=new_sugar_level,
                         pack=pack,
-                    ),
-                }
-
-        Record.objects.bulk_create(records)
-
-        created_records_by_when: Dict[datetime, Any] = dict(
-            Record.objects.filter(
-                when__in=tuple(map(
-                    datetime.isoformat,
-                    records_data.keys(),  # noqa
-                )),
-            ).values_list(
-                'when',
-                'pk',
-            ),
+                    ))
+                elif sugar_level != new_sugar_level:
+                    updated_meterings.append(SugarMetering(
+                        pk=metering_pk,
+                        sugar_level=new_sugar_level,
+                    ))
+                else:
+                    continue
+                changed_moments.append(when)
+
+        SugarMetering.objects.bulk_create(new_meterings)
+        SugarMetering.objects.bulk_update(
+            updated_meterings,
+            ('sugar_level',),
         )
+        # массовые операции не отправляют сигналы, поэтому
+        # журнал изменений пополняем явно
+        log_changes(Record, new_record_pks)
+        log_changes(SugarMetering, chain(
+            (metering.pk for metering in updated_meterings),
+            self.get_metering_pks(user, sugar_levels.keys(), new_meterings),
+        ))
 
-        for when, data in records_data.items():
-            data['sugar_metering'].record_id = created_records_by_when[when]
+        return ImportStats(
+            created_moments=new_moments,
+            updated_moments=changed_moments[len(new_moments):],
+            skipped=len(chunk) - len(changed_moments),
+        )
 
-        SugarMetering.objects.bulk_create(map(
-            itemgetter('sugar_metering'),
-            records_data.values(),
-        ))
+    @staticmethod
+    def refresh_daily_summaries(
+            user: User,
+            changed_days: Dict[date, Tuple[datetime, datetime]],
+    ) -> None:
+        """
+        Пересчитывает сводки только вокруг изменённых
+        суток: подряд идущие сутки -- одним вызовом.
+        """
+        first_moment: Optional[datetime] = None
+        last_moment: Optional[datetime] = None
+        last_day: Optional[date] = None
+        for day in sorted(changed_days):
+            day_first_moment, day_last_moment = changed_days[day]
+            if last_day is not None and (day - last_day).days > 1:
+                refresh_daily_summaries(user.pk, first_moment, last_moment)
+                first_moment = None
+            if first_moment is None:
+                first_moment = day_first_moment
+            last_moment = day_last_moment
+            last_day = day
+
+        if first_moment is not None:
+            refresh_daily_summaries(user.pk, first_moment, last_moment)
+
+    def import_file(
+            self,
+            user: User,
+            rows: Iterable[Tuple[datetime, Decimal]],
+            chunk_size: int,
+            on_conflict: str,
+            verbosity: int,
+    ) -> ImportTotals:
+        pack = self.get_pack(user)
+
+        rows_count = created = updated = skipped = 0
+        # Новые записи добавляются в индекс страниц по
+        # одной, а если их много -- индекс перестраивается.
+        created_moments: Optional[List[datetime]] = []
+        # сутки -> (первый, последний) изменённые моменты
+        changed_days: Dict[date, Tuple[datetime, datetime]] = {}
+
+        # Порции записываются по мере чтения файла, но в
+        # одной транзакции: при ошибке в любой строке файл
+        # не импортируется совсем.
+        with atomic():
+            # записи с ключами больше созданы этим файлом
+            last_old_record_pk = Record.objects.aggregate(
+                last_pk=Max('pk'),
+            )['last_pk'] or 0
+            rows_iterator = iter(rows)
+            while True:
+                chunk = list(islice(rows_iterator, chunk_size))
+                if not chunk:
+                    break
+
+                stats = self.import_chunk(
+                    user,
+                    pack,
+                    chunk,
+                    on_conflict,
+                    last_old_record_pk,
+                )
+                rows_count += len(chunk)
+                created += len(stats.created_moments)
+                updated += len(stats.updated_moments)
+                skipped += stats.skipped
+
+                if created_moments is not None:
+                    created_moments.extend(stats.created_moments)
+                    if len(created_moments) > INDEX_REFRESH_LIMIT:
+                        created_moments = None
+
+                for when in chain(stats.created_moments, stats.updated_moments):  # noqa
+                    # моменты из файла -- в часовом поясе сервера
+                    day = when.date()
+                    day_moments = changed_days.get(day)
+                    if day_moments is None:
+                        changed_days[day] = (when, when)
+                    else:
+                        changed_days[day] = (
+                            min(day_moments[0], when),
+                            max(day_moments[1], when),
+                        )
+
+                if verbosity >= 2:
+                    self.stdout.write(f'{rows_count} rows are imported')
+
+            # `bulk_create` не отправляет сигналы, поэтому
+            # индекс страниц и сводки обновляем явно
+            if created_moments is None:
+                rebuild_time_label_index(user.pk)
+            elif created_moments:
+                refresh_time_label_index(user.pk, created_moments)
+            if changed_days:
+                self.refresh_daily_summaries(user, changed_days)
+                bump_data_version(user.pk)
+
+        return ImportTotals(
+            rows_count=rows_count,
+            created=created,
+            updated=updated,
+            skipped=skipped,
+        )
+
+    def import_files(
+            self,
+            username: Optional[str],
+            csv_file_paths: List[str],
+            get_rows: Callable[[str], Iterable[Tuple[datetime, Decimal]]],
+            chunk_size: int,
+            on_conflict: str,
+            verbosity: int,
+    ) -> ImportTotals:
+        """
+        Импортирует файлы по очереди, каждый -- в своей
+        транзакции. Ошибка в одном из нескольких файлов не
+        мешает импорту остальных: она выводится, а в конце
+        выбрасывается общая ошибка.
+        """
+        totals = ImportTotals(0, 0, 0, 0)
+        failed_paths: List[str] = []
+        for csv_file_path in csv_file_paths:
+            file_username = username
+            if file_username is None:
+                file_username, _ = os.path.splitext(
+                    os.path.basename(csv_file_path),
+                )
+
+            try:
+                with track_time() as tracker:
+                    file_totals = self.import_file(
+                        self.get_user(file_username),
+                        get_rows(csv_file_path),
+                        chunk_size,
+                        on_conflict,
+                        verbosity,
+                    )
+            except ValueError as error:
+                if len(csv_file_paths) == 1:
+                    raise
+                failed_paths.append(csv_file_path)
+                self.stderr.write(f'{csv_file_path}: {error}')
+                continue
+
+            totals += file_totals
+            message = file_totals.format(tracker.elapsed_time)
+            if len(csv_file_paths) > 1:
+                message = f'{csv_file_path}: {message}'
+            self.stdout.write(message)
+
+        if failed_paths:
+            raise ValueError(
+                f'{len(failed_paths)} of {len(csv_file_paths)} files '
+                f'are not imported: {", ".join(failed_paths)}',
+            )
+
+        return totals
+
+    def handle(
+            self,
+            username: Optional[str],
+            csv_file_path: str,
+            jobs: Optional[int],
+            chunk_size: int,
+            on_conflict: str,
+            *args,
+            **kwargs,
+    ) -> None:
+        csv_file_paths = self.get_csv_file_paths(csv_file_path)
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        jobs = min(jobs, len(csv_file_paths))
+
+        with track_time() as tracker:
+            if jobs <= 1:
+                # файл читается лениво, порциями
+                totals = self.import_files(
+                    username,
+                    csv_file_paths,
+                    self.iter_rows,
+                    chunk_size,
+                    on_conflict,
+                    kwargs['verbosity'],
+                )
+            else:
+                # Процессы пула разбирают и проверяют порции
+                # файла, а основной процесс по порядку
+                # записывает их в БД (соединение с БД только у
+                # него).
+                with ProcessPoolExecutor(
+                        max_workers=jobs,
+                        initializer=django.setup,
+                ) as executor:
+                    totals = self.import_files(
+                        username,
+                        csv_file_paths,
+                        lambda path: self.iter_parsed_rows(
+                            executor,
+                            path,
+                            chunk_size,
+                            jobs,
+                        ),
+                        chunk_size,
+                        on_conflict,
+                        kwargs['verbosity'],
+                    )
+
+        if len(csv_file_paths) > 1:
+            self.stdout.write(
+                f'Total: {len(csv_file_paths)} files, '
+                f'{totals.format(tracker.elapsed_time)}',
+            )
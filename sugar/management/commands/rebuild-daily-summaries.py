@@ -0,0 +1,87 @@
+from typing import (
+    List,
+    Optional,
+)
+
+from django.apps import (
+    apps,
+)
+from django.conf import (
+    settings,
+)
+from django.core.management.base import (
+    BaseCommand,
+    CommandParser,
+)
+
+from sugar.helpers import (
+    SUMMARY_CHUNK_DAYS,
+    rebuild_daily_summaries,
+)
+
+
+User = apps.get_model(settings.AUTH_USER_MODEL)  # noqa
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает суточные сводки дневника '
+        '(DailySugarSummary).'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '-u',
+            '--user',
+            dest='usernames',
+            action='append',
+            help='Имя пользователя (по умолчанию -- все пользователи)',
+        )
+        parser.add_argument(
+            '--users-chunk-size',
+            dest='users_chunk_size',
+            type=int,
+            default=100,
+            help='Сколько пользователей загружать из БД за раз',
+        )
+        parser.add_argument(
+            '--days-chunk-size',
+            dest='days_chunk_size',
+            type=int,
+            default=SUMMARY_CHUNK_DAYS,
+            help='За сколько суток пересчитывать сводки за раз',
+        )
+
+    def handle(
+            self,
+            usernames: Optional[List[str]],
+            users_chunk_size: int,
+            days_chunk_size: int,
+            *args,
+            **kwargs,
+    ) -> None:
+        users = User.objects.order_by('pk')
+        if usernames:
+            users = users.filter(
+                username__in=usernames,
+            )
+
+        last_user_id = None
+        while True:
+            users_chunk = users
+            if last_user_id is not None:
+                users_chunk = users_chunk.filter(
+                    pk__gt=last_user_id,
+                )
+            users_chunk = list(users_chunk.values_list(
+                'pk',
+                'username',
+            )[:users_chunk_size])
+            if not users_chunk:
+                break
+
+            for user_id, username in users_chunk:
+                rebuild_daily_summaries(user_id, days_chunk_size)
+                self.stdout.write(f'Summaries of {username!r} are rebuilt')
+
+            last_user_id = users_chunk[-1][0]
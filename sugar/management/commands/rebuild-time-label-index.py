@@ -0,0 +1,66 @@
+from typing import (
+    List,
+    Optional,
+)
+
+from django.apps import (
+    apps,
+)
+from django.conf import (
+    settings,
+)
+from django.core.management.base import (
+    BaseCommand,
+    CommandParser,
+)
+
+from sugar.enums import (
+    DateAggregateEnum,
+)
+from sugar.helpers import (
+    rebuild_time_label_index,
+)
+
+
+User = apps.get_model(settings.AUTH_USER_MODEL)  # noqa
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает индекс границ страниц списка '
+        'записей дневника (TimeLabelGroup).'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '-u',
+            '--user',
+            dest='usernames',
+            action='append',
+            help='Имя пользователя (по умолчанию -- все пользователи)',
+        )
+        parser.add_argument(
+            '-g',
+            '--groupping',
+            dest='grouppings',
+            action='append',
+            choices=DateAggregateEnum.values,
+            help='Группировка (по умолчанию -- все группировки)',
+        )
+
+    def handle(
+            self,
+            usernames: Optional[List[str]],
+            grouppings: Optional[List[str]],
+            *args,
+            **kwargs,
+    ) -> None:
+        users = User.objects.order_by('pk')
+        if usernames:
+            users = users.filter(
+                username__in=usernames,
+            )
+
+        for user_id, username in users.values_list('pk', 'username'):
+            rebuild_time_label_index(user_id, grouppings)
+            self.stdout.write(f'Index of {username!r} is rebuilt')
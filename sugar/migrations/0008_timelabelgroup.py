@@ -0,0 +1,41 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sugar', '0007_record_who_and_when_are_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimeLabelGroup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('groupping', models.CharField(choices=[('none', 'Без группировки'), ('day', 'По дням'), ('week', 'По неделям'), ('month', 'По месяцам'), ('year', 'По годам')], max_length=5, verbose_name='Группировка')),
+                ('time_label', models.DateTimeField(verbose_name='Метка времени')),
+                ('position', models.PositiveIntegerField(verbose_name='Порядковый номер группы')),
+                ('records_count', models.PositiveIntegerField(verbose_name='Количество записей')),
+                ('min_when', models.DateTimeField(verbose_name='Момент создания самой ранней записи')),
+                ('max_when', models.DateTimeField(verbose_name='Момент создания самой поздней записи')),
+                ('who', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Группа записей',
+                'verbose_name_plural': 'Группы записей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelabelgroup',
+            index=models.Index(fields=['who', 'groupping', 'position'], name='sugar_tlg_position_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelabelgroup',
+            unique_together={('who', 'groupping', 'time_label')},
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sugar', '0008_timelabelgroup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySugarSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Дата')),
+                ('meterings_count', models.PositiveIntegerField(default=0, verbose_name='Количество измерений')),
+                ('min_sugar', models.DecimalField(decimal_places=1, max_digits=3, null=True, verbose_name='Минимальное измерение сахара')),
+                ('max_sugar', models.DecimalField(decimal_places=1, max_digits=3, null=True, verbose_name='Максимальное измерение сахара')),
+                ('start_sugar', models.FloatField(null=True, verbose_name='Уровень сахара в начале суток')),
+                ('end_sugar', models.FloatField(null=True, verbose_name='Уровень сахара в конце суток')),
+                ('sugar_integral', models.FloatField(default=0.0, verbose_name='Интеграл уровня сахара (ммоль/л * с)')),
+                ('sugar_duration', models.FloatField(default=0.0, verbose_name='Длительность интегрирования (с)')),
+                ('total_meal', models.DecimalField(decimal_places=1, default=0, max_digits=6, verbose_name='Количество употреблённых углеводов (ХЕ)')),
+                ('who', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Суточная сводка',
+                'verbose_name_plural': 'Суточные сводки',
+                'unique_together': {('who', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyInsulinSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_insulin', models.PositiveIntegerField(verbose_name='Количество введённого инсулина')),
+                ('insulin_mark', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='sugar.insulinkind', verbose_name='Вид инсулина')),
+                ('summary', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='insulin_summaries', to='sugar.dailysugarsummary', verbose_name='Суточная сводка')),
+            ],
+            options={
+                'verbose_name': 'Суточная сводка по инсулину',
+                'verbose_name_plural': 'Суточные сводки по инсулину',
+                'unique_together': {('summary', 'insulin_mark')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sugar', '0009_dailysugarsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='insulininjection',
+            index=models.Index(fields=['record', 'insulin_syringe', 'insulin_quantity'], name='sugar_inj_record_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insulinsyringe',
+            index=models.Index(fields=['whose', 'expiry_actual', 'opening'], name='insulinsyringe_actual_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['record', 'food_quantity'], name='sugar_meal_record_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sugarmetering',
+            index=models.Index(fields=['record', 'sugar_level'], name='sugar_meter_record_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teststrippack',
+            index=models.Index(fields=['whose', 'expiry_actual', 'opening'], name='teststrippack_actual_idx'),
+        ),
+    ]
@@ -2,7 +2,10 @@ from collections import defaultdict
 from datetime import datetime
 from decimal import Decimal
 from typing import (
+    Any,
+    Iterable,
     Optional,
+    Tuple,
 )
 
 from django.db import (
@@ -13,6 +16,9 @@ from core.helpers import (
     NumericSum,
     get_date_display,
 )
+from sugar.enums import (
+    DateAggregateEnum,
+)
 
 
 class Record(models.Model):
@@ -26,51 +32,67 @@ class Record(models.Model):
         on_delete=models.CASCADE,
         related_name='records',
         verbose_name='Автор',
-        # FIXME: add index?
+        # Отдельный индекс по `who` не нужен: все выборки
+        # записей идут по `who` с фильтрацией или
+        # сортировкой по `when`, и их обслуживает
+        # уникальный индекс (who, when).
     )
     when = models.DateTimeField(
         verbose_name='Момент создания записи',
     )
 
+    # Методы ниже выводятся колонками в списке записей
+    # админки. `RecordAdmin.get_queryset` заранее
+    # подгружает все нужные им данные, поэтому здесь
+    # они берутся из кэша, если он есть.
+
+    def _is_prefetched(self, related_name: str) -> bool:
+        return related_name in getattr(
+            self,
+            '_prefetched_objects_cache',
+            (),
+        )
+
     def sugar_level(self) -> Optional[Decimal]:
-        # FIXME: N+1 problem
-        sugar_meterings = SugarMetering.objects.filter(
-            record=self.pk)
-        assert sugar_meterings.count() <= 1
-        return sugar_meterings.values_list(
-            'sugar_level',
-            flat=True
-        ).first()
+        try:
+            sugar_metering = self.sugarmetering
+        except SugarMetering.DoesNotExist:
+            return
+        return sugar_metering.sugar_level
 
     def total_meal(self) -> Optional[Decimal]:
-        # FIXME: N+1 problem
-        meals = Meal.objects.filter(
-            record=self.pk
-        )
-        if not meals.exists():
+        food_quantities = [
+            meal.food_quantity
+            for meal in self.meal_set.all()
+        ]
+        if not food_quantities:
             return
 
-        return sum(meals.values_list(
-            'food_quantity',
-            flat=1,
-        ))
+        return sum(food_quantities)
 
     def injections_info(self):
-        # FIXME: N+1 problem
-        injections = InsulinInjection.objects.filter(
-            record=self.pk
-        )
-        if injections.count() == 0:
-            return
+        injections: Iterable[Tuple[str, Optional[int]]]
+        if self._is_prefetched('insulininjection_set'):
+            injections = (
+                (
+                    injection.insulin_syringe.insulin_mark.name,
+                    injection.insulin_quantity,
+                )
+                for injection in self.insulininjection_set.all()
+            )
+        else:
+            injections = self.insulininjection_set.values_list(
+                'insulin_syringe__insulin_mark__name',
+                'insulin_quantity',
+            )
 
         injections_by_kind = defaultdict(list)
-        injections = injections.values_list(
-            'insulin_syringe__insulin_mark__name',
-            'insulin_quantity',
-        )
         for kind, quantity in injections:
             injections_by_kind[kind].append(quantity)
 
+        if not injections_by_kind:
+            return
+
         return ', '.join(
             '{} {}'.format(
                 '+'.join(map(str, quantities)),
@@ -81,11 +103,9 @@ class Record(models.Model):
         )
 
     def short_comments(self):
-        # FIXME: N+1 problem
         comments = tuple(
             comment.short()
-            for comment in Comment.objects.filter(
-                record=self.pk)
+            for comment in self.comment_set.all()
         )
         if not comments:
             return
@@ -101,6 +121,173 @@ class Record(models.Model):
         )
 
 
+class TimeLabelGroup(models.Model):
+    """
+    Элемент индекса границ страниц списка записей:
+    группа записей пользователя с одинаковой меткой
+    времени при заданной группировке.
+
+    Группы пользователя нумеруются (`position`) от самой
+    ранней, поэтому добавление новых записей не сдвигает
+    номера уже существующих групп.
+    """
+    # производные данные: не попадают в инкрементальные
+    # выгрузки и пересчитываются после их применения
+    # (`signals.rebuild_derived_data_on_deltas_applied`)
+    track_changes = False
+
+    who = models.ForeignKey(
+        to='auth.User',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    groupping = models.CharField(
+        verbose_name='Группировка',
+        max_length=5,
+        choices=DateAggregateEnum.choices,
+    )
+    time_label = models.DateTimeField(
+        verbose_name='Метка времени',
+    )
+    position = models.PositiveIntegerField(
+        verbose_name='Порядковый номер группы',
+    )
+    records_count = models.PositiveIntegerField(
+        verbose_name='Количество записей',
+    )
+    min_when = models.DateTimeField(
+        verbose_name='Момент создания самой ранней записи',
+    )
+    max_when = models.DateTimeField(
+        verbose_name='Момент создания самой поздней записи',
+    )
+
+    class Meta:
+        verbose_name = 'Группа записей'
+        verbose_name_plural = 'Группы записей'
+
+        unique_together = (
+            ('who', 'groupping', 'time_label'),
+        )
+        indexes = (
+            models.Index(
+                fields=('who', 'groupping', 'position'),
+                name='sugar_tlg_position_idx',
+            ),
+        )
+
+
+class DailySugarSummary(models.Model):
+    """
+    Сводка дневника пользователя за сутки (по местному
+    времени). Из сводок собираются строки списка записей
+    при группировке по неделям, месяцам и годам.
+
+    Интеграл уровня сахара считается методом трапеций по
+    измерениям и ограничивается промежутком между самым
+    ранним и самым поздним измерениями пользователя;
+    линейная экстраполяция за их пределы добавляется при
+    сборке строк (`helpers.get_summarized_group_stats`),
+    чтобы сводки не зависели от крайних измерений.
+    """
+    # производные данные: не попадают в инкрементальные
+    # выгрузки и пересчитываются после их применения
+    # (`signals.rebuild_derived_data_on_deltas_applied`)
+    track_changes = False
+
+    who = models.ForeignKey(
+        to='auth.User',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    day = models.DateField(
+        verbose_name='Дата',
+    )
+    meterings_count = models.PositiveIntegerField(
+        verbose_name='Количество измерений',
+        default=0,
+    )
+    min_sugar = models.DecimalField(
+        verbose_name='Минимальное измерение сахара',
+        max_digits=3,
+        decimal_places=1,
+        null=True,
+    )
+    max_sugar = models.DecimalField(
+        verbose_name='Максимальное измерение сахара',
+        max_digits=3,
+        decimal_places=1,
+        null=True,
+    )
+    start_sugar = models.FloatField(
+        verbose_name='Уровень сахара в начале суток',
+        null=True,
+    )
+    end_sugar = models.FloatField(
+        verbose_name='Уровень сахара в конце суток',
+        null=True,
+    )
+    sugar_integral = models.FloatField(
+        verbose_name='Интеграл уровня сахара (ммоль/л * с)',
+        default=0.0,
+    )
+    sugar_duration = models.FloatField(
+        verbose_name='Длительность интегрирования (с)',
+        default=0.0,
+    )
+    total_meal = models.DecimalField(
+        verbose_name='Количество употреблённых углеводов (ХЕ)',
+        max_digits=6,
+        decimal_places=1,
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Суточная сводка'
+        verbose_name_plural = 'Суточные сводки'
+
+        unique_together = (
+            ('who', 'day'),
+        )
+
+
+class DailyInsulinSummary(models.Model):
+    """
+    Суммарное количество введённого за сутки инсулина
+    одного вида
+    """
+    # производные данные: не попадают в инкрементальные
+    # выгрузки и пересчитываются после их применения
+    # (`signals.rebuild_derived_data_on_deltas_applied`)
+    track_changes = False
+
+    summary = models.ForeignKey(
+        to=DailySugarSummary,
+        on_delete=models.CASCADE,
+        related_name='insulin_summaries',
+        verbose_name='Суточная сводка',
+    )
+    insulin_mark = models.ForeignKey(
+        to='InsulinKind',
+        on_delete=models.PROTECT,
+        related_name='+',
+        verbose_name='Вид инсулина',
+    )
+    total_insulin = models.PositiveIntegerField(
+        verbose_name='Количество введённого инсулина',
+    )
+
+    class Meta:
+        verbose_name = 'Суточная сводка по инсулину'
+        verbose_name_plural = 'Суточные сводки по инсулину'
+
+        unique_together = (
+            ('summary', 'insulin_mark'),
+        )
+
+
 class Attachment(models.Model):
     """
     Прикрепление к записи. На каждую запись может
@@ -149,6 +336,15 @@ class Meal(Attachment):
         verbose_name = 'Приём пищи'
         verbose_name_plural = 'Приёмы пищи'
 
+        indexes = (
+            # покрывающий индекс для выгрузки приёмов пищи
+            # вместе с записями (см. `export_attachments`)
+            models.Index(
+                fields=('record', 'food_quantity'),
+                name='sugar_meal_record_value_idx',
+            ),
+        )
+
 
 class InsulinKind(models.Model):
     """
@@ -195,6 +391,13 @@ class InsulinInjection(Attachment):
         verbose_name = 'Инъекция инсулина'
         verbose_name_plural = 'Инъекции инсулина'
 
+        indexes = (
+            models.Index(
+                fields=('record', 'insulin_syringe', 'insulin_quantity'),
+                name='sugar_inj_record_value_idx',
+            ),
+        )
+
 
 class SugarMetering(Attachment):
     """
@@ -225,6 +428,13 @@ class SugarMetering(Attachment):
         verbose_name = 'Измерение сахара'
         verbose_name_plural = 'Измерения сахара'
 
+        indexes = (
+            models.Index(
+                fields=('record', 'sugar_level'),
+                name='sugar_meter_record_value_idx',
+            ),
+        )
+
 
 class Comment(Attachment):
     content = models.CharField(
@@ -256,6 +466,14 @@ class AbstractMedication(models.Model):
     class Meta:
         abstract = True
 
+        indexes = (
+            # для `get_actual_items`
+            models.Index(
+                fields=('whose', 'expiry_actual', 'opening'),
+                name='%(class)s_actual_idx',
+            ),
+        )
+
     whose = models.ForeignKey(
         to='auth.User',
         on_delete=models.CASCADE,
@@ -284,11 +502,21 @@ class AbstractMedication(models.Model):
     )
     
     @classmethod
-    def get_actual_items(cls, on_date: Optional[datetime]) -> models.QuerySet:
+    def get_actual_items(
+            cls,
+            on_date: Optional[datetime],
+            whose: Optional[Any] = None,
+    ) -> models.QuerySet:
         if on_date is None:
             on_date = datetime.now()
 
-        result = cls.objects.filter(
+        result = cls.objects.all()
+        if whose is not None:
+            result = result.filter(
+                whose=whose,
+            )
+
+        result = result.filter(
             models.Q(
                 expiry_actual__isnull=True,
             ) | models.Q(
@@ -341,7 +569,7 @@ class AbstractMedication(models.Model):
 class InsulinSyringe(AbstractMedication):
     USAGES_MANAGER_NAME = 'injections'
 
-    class Meta:
+    class Meta(AbstractMedication.Meta):
         verbose_name = 'Шприц'
         verbose_name_plural = 'Шприцы'
 
@@ -443,7 +671,7 @@ class InsulinOrdering(models.Model):
 
 
 class TestStripPack(AbstractMedication):
-    class Meta:
+    class Meta(AbstractMedication.Meta):
         verbose_name = 'Пачка тест-полосок'
         verbose_name_plural = 'Пачки тест-полосок'
 
@@ -0,0 +1,174 @@
+"""
+Сериализация ответов JSON-эндпоинтов дневника.
+
+`Decimal` отдаётся строкой (так не теряется точность и
+сохраняется прежний вид чисел в ответах), `date` и
+`datetime` -- в ISO 8601. Если установлен `orjson`, он
+используется вместо стандартного `json`; выбрать
+сериализатор явно можно настройкой `JSON_SERIALIZER`.
+"""
+import json
+from datetime import (
+    date,
+)
+from decimal import (
+    Decimal,
+)
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+)
+
+from django.conf import (
+    settings,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(
+        f'Object of type {type(value).__name__} is not JSON serializable',
+    )
+
+
+class JSONSerializer:
+    name = 'json'
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        dumps_kwargs: Dict[str, Any]
+        if pretty:
+            dumps_kwargs = dict(
+                indent=4,
+            )
+        else:
+            # без пробелов после разделителей -- как orjson
+            dumps_kwargs = dict(
+                separators=(',', ':'),
+            )
+
+        return json.dumps(
+            data,
+            default=_default,
+            ensure_ascii=False,
+            **dumps_kwargs,
+        ).encode()
+
+    def iter_dumps(
+            self,
+            data: Dict[str, Any],
+            list_key: str,
+            chunk_size: int,
+    ) -> Iterator[bytes]:
+        """
+        Сериализует `data` по частям: элементы списка
+        `data[list_key]` -- порциями по `chunk_size`, так
+        что JSON целиком в памяти не собирается.
+        """
+        items: List[Any] = data[list_key]
+        return self.iter_chunks_dumps(
+            data,
+            list_key,
+            (
+                items[chunk_start:chunk_start + chunk_size]
+                for chunk_start in range(0, len(items), chunk_size)
+            ),
+        )
+
+    def iter_chunks_dumps(
+            self,
+            data: Dict[str, Any],
+            list_key: str,
+            chunks: Iterable[List[Any]],
+    ) -> Iterator[bytes]:
+        """
+        Как `iter_dumps`, но элементы списка `list_key`
+        берутся из `chunks` (значение `data[list_key]`
+        не используется), так что и сами элементы можно
+        собирать по мере сериализации.
+        """
+        head = self.dumps({
+            key: value
+            for key, value in data.items()
+            if key != list_key
+        })
+        if head != b'{}':
+            head = head[:-1] + b','
+        else:
+            head = b'{'
+        yield head + self.dumps(list_key) + b':['
+
+        is_first_chunk = True
+        for chunk in chunks:
+            if not chunk:
+                continue
+            # "[a,b]" -> "a,b"
+            encoded_chunk = self.dumps(chunk)[1:-1]
+            if not is_first_chunk:
+                encoded_chunk = b',' + encoded_chunk
+            is_first_chunk = False
+            yield encoded_chunk
+
+        yield b']}'
+
+
+class OrjsonSerializer(JSONSerializer):
+    name = 'orjson'
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        return orjson.dumps(
+            data,
+            default=_default,
+            option=orjson.OPT_INDENT_2 if pretty else 0,
+        )
+
+
+SERIALIZERS: Dict[str, JSONSerializer] = {
+    serializer.name: serializer
+    for serializer in (
+        JSONSerializer(),
+        OrjsonSerializer(),
+    )
+}
+
+
+def get_serializer(name: Optional[str] = None) -> JSONSerializer:
+    if name is None:
+        name = settings.JSON_SERIALIZER
+    if name is None:
+        name = 'json' if orjson is None else 'orjson'
+
+    if name == 'orjson' and orjson is None:
+        raise ImportError('orjson is not installed')
+
+    return SERIALIZERS[name]
+
+
+def to_columnar(
+        response_rows: List[Dict[str, Any]],
+        columns: List[Dict[str, str]],
+) -> List[List[Any]]:
+    """
+    Значения строк таблицы по колонкам: i-й список --
+    значения колонки `columns[i]` во всех строках. Ключи
+    не повторяются в каждой строке, поэтому ответ
+    компактнее списка словарей.
+    """
+    return [
+        [
+            row.get(column['data_index'])
+            for row in response_rows
+        ]
+        for column in columns
+    ]
@@ -0,0 +1,161 @@
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_save,
+)
+from django.contrib.auth import (
+    get_user_model,
+)
+from django.dispatch import (
+    receiver,
+)
+
+from core.signals import (
+    data_restored,
+    deltas_applied,
+)
+
+from .helpers import (
+    bump_data_version,
+    rebuild_daily_summaries,
+    rebuild_time_label_index,
+    refresh_daily_summaries,
+    refresh_time_label_index,
+)
+from .models import (
+    Attachment,
+    InsulinInjection,
+    InsulinKind,
+    Meal,
+    Record,
+    SugarMetering,
+)
+
+
+@receiver(pre_save, sender=Record)
+def remember_previous_state(sender, instance: Record, raw, **kwargs):
+    instance._previous_state = None
+    if raw or instance.pk is None:
+        return
+
+    instance._previous_state = Record.objects.filter(
+        pk=instance.pk,
+    ).values_list(
+        'who_id',
+        'when',
+    ).first()
+
+
+@receiver(post_save, sender=Record)
+def update_time_label_index_on_save(sender, instance: Record, raw, **kwargs):
+    if raw:
+        # при загрузке фикстур индекс загружается вместе
+        # с записями
+        return
+
+    moments = [instance.when]
+
+    previous_state = getattr(instance, '_previous_state', None)
+    if previous_state is not None:
+        previous_who_id, previous_when = previous_state
+        if previous_who_id != instance.who_id:
+            refresh_time_label_index(previous_who_id, (previous_when,))
+        elif previous_when != instance.when:
+            moments.append(previous_when)
+        else:
+            # запись изменилась, но не переместилась
+            return
+
+    refresh_time_label_index(instance.who_id, moments)
+
+
+@receiver(post_delete, sender=Record)
+def update_time_label_index_on_delete(sender, instance: Record, **kwargs):
+    refresh_time_label_index(instance.who_id, (instance.when,))
+
+
+@receiver(post_save, sender=Record)
+def update_daily_summaries_on_record_move(sender, instance: Record, raw, **kwargs):  # noqa
+    # Новая запись ещё без прикреплений и на сводки не
+    # влияет, а прикрепления удаляемой записи удаляются
+    # каскадно и обрабатываются своими сигналами.
+    previous_state = getattr(instance, '_previous_state', None)
+    if raw or previous_state is None:
+        return
+
+    previous_who_id, previous_when = previous_state
+    if (previous_who_id, previous_when) == (instance.who_id, instance.when):
+        return
+
+    refresh_daily_summaries(previous_who_id, previous_when)
+    refresh_daily_summaries(instance.who_id, instance.when)
+
+
+@receiver(post_save, sender=Record)
+@receiver(post_delete, sender=Record)
+def bump_data_version_on_record_change(sender, instance: Record, raw=False, **kwargs):  # noqa
+    if raw:
+        # при загрузке фикстур сбрасываем кэш всех
+        # пользователей
+        bump_data_version()
+        return
+
+    bump_data_version(instance.who_id)
+    previous_state = getattr(instance, '_previous_state', None)
+    if previous_state is not None and previous_state[0] != instance.who_id:
+        bump_data_version(previous_state[0])
+
+
+@receiver(post_save, sender=SugarMetering)
+@receiver(post_save, sender=Meal)
+@receiver(post_save, sender=InsulinInjection)
+@receiver(post_delete, sender=SugarMetering)
+@receiver(post_delete, sender=Meal)
+@receiver(post_delete, sender=InsulinInjection)
+def update_on_attachment_change(sender, instance: Attachment, raw=False, **kwargs):  # noqa
+    if raw:
+        bump_data_version()
+        return
+
+    record_state = Record.objects.filter(
+        pk=instance.record_id,
+    ).values_list(
+        'who_id',
+        'when',
+    ).first()
+    if record_state is None:
+        # запись уже удалена
+        return
+
+    who_id, when = record_state
+    refresh_daily_summaries(who_id, when)
+    bump_data_version(who_id)
+
+
+@receiver(post_save, sender=InsulinKind)
+@receiver(post_delete, sender=InsulinKind)
+def bump_data_version_on_insulin_kind_change(sender, **kwargs):
+    # названия видов инсулина -- заголовки колонок
+    # у всех пользователей
+    bump_data_version()
+
+
+@receiver(deltas_applied)
+def rebuild_derived_data_on_deltas_applied(sender, **kwargs):
+    # индекс страниц и сводки не попадают в инкрементальные
+    # выгрузки
+    user_ids = get_user_model().objects.order_by(
+        'pk',
+    ).values_list(
+        'pk',
+        flat=True,
+    )
+    for user_id in user_ids:
+        rebuild_time_label_index(user_id)
+        rebuild_daily_summaries(user_id)
+    bump_data_version()
+
+
+@receiver(data_restored)
+def bump_data_version_on_data_restored(sender, **kwargs):
+    bump_data_version()
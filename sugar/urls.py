@@ -14,4 +14,9 @@ urlpatterns = [
         views.rows_view,
         name='rows',
     ),
+    url(
+        r'^rows-async.json',
+        views.rows_async_view,
+        name='rows-async',
+    ),
 ]
@@ -1,34 +1,51 @@
-import json
+import math
 from datetime import (
     datetime,
 )
 from itertools import (
-    groupby,
-)
-from operator import (
-    itemgetter,
+    chain,
 )
 from typing import (
     Any,
     Callable,
     Dict,
+    Iterator,
     List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
 )
 
+from asgiref.sync import (
+    sync_to_async,
+)
 from django.conf import (
     settings,
 )
 from django.contrib.auth.decorators import (
     login_required,
 )
+from django.contrib.auth.views import (
+    redirect_to_login,
+)
+from django.core.cache import (
+    cache,
+)
+from django.core.exceptions import (
+    ValidationError,
+)
 from django.db.models import (
     DateTimeField,
+    QuerySet,
 )
 from django.db.models.functions import (
     Trunc,
 )
 from django.http import (
     HttpResponse,
+    HttpResponseBadRequest,
+    StreamingHttpResponse,
 )
 from django.shortcuts import (
     render,
@@ -40,19 +57,36 @@ from pytz import (
     timezone,
 )
 
+from .enums import (
+    DateAggregateEnum,
+)
 from .forms import (
+    DEFAULT_PAGE_SIZE,
     ListViewForm,
 )
 from .helpers import (
+    SUMMARIZED_GROUPPINGS,
     TIME_LABEL_FORMAT,
-    TRUNC_TYPES,
+    AggregatedAttachmentMeta,
     AttachmentMeta,
+    RecordBatch,
+    SeekParams,
     SliceParams,
+    count_time_labels,
+    decode_cursor,
+    export_aggregated_attachments,
     export_attachments,
+    export_attachments_concurrently,
+    export_daily_summaries,
     get_injections_display_data,
     get_meal_display_data,
+    get_page_insulin_columns,
+    get_rows_cache_key,
     get_sugar_display_data,
-    slice_records,
+    get_summarized_sugar_display_data,
+    get_time_label_expression,
+    seek_records,
+    slice_records_by_index,
 )
 from .models import (
     InsulinInjection,
@@ -60,6 +94,10 @@ from .models import (
     Record,
     SugarMetering,
 )
+from .serializers import (
+    get_serializer,
+    to_columnar,
+)
 
 
 def list_view(request):
@@ -74,17 +112,191 @@ def list_view(request):
     )
 
 
+ROWS_CACHE_PARAMS = (
+    # параметры запроса, от которых зависит ответ
+    'groupping',
+    'page_number',
+    'cursor',
+    'with_totals',
+    'page_size',
+    'format',
+)
+
+ROWS_FORMAT = 'rows'
+# значения по колонкам вместо списка словарей-строк
+# (см. `to_columnar`)
+COLUMNAR_FORMAT = 'columnar'
+
+# Начиная с такого размера страницы ответ сериализуется
+# и отдаётся по частям, а не одной строкой; строки
+# формата `rows` и собираются по частям (см.
+# `_iter_streamed_rows`).
+STREAMING_PAGE_SIZE = 1000
+STREAMING_CHUNK_ROWS = 500
+
+
 @requires_csrf_token
 @login_required
 def rows_view(request, *args, **kwargs):
+    # Повторные просмотры той же страницы отдаются из
+    # кэша. Ключ включает версию данных пользователя,
+    # которую меняют сигналы при любом изменении записей
+    # и прикреплений, поэтому устаревший ответ не отдаётся.
+    cache_key = _get_cache_key(request)
+    if cache_key is not None:
+        content = cache.get(cache_key)
+        if content is not None:
+            return HttpResponse(
+                content,
+                content_type='application/json',
+            )
+
+    page = _get_rows_page(request)
+    if isinstance(page, HttpResponse):
+        return page
+
+    if page.batch is not None:
+        # иначе прикрепления выгружаются по частям
+        # (см. `_iter_rows_chunks`)
+        _export_page_attachments(page)
+    response = _render_rows_page(page)
+    _cache_response(cache_key, response)
+
+    return response
+
+
+async def rows_async_view(request, *args, **kwargs):
+    """
+    Асинхронный вариант `rows_view` для работы под ASGI
+    (см. `main.asgi`): запросы прикреплений страницы
+    выполняются одновременно, а построение страницы и
+    сериализация -- вне цикла событий.
+    """
+    # AuthenticationMiddleware загружает пользователя
+    # лениво, обращаясь к сессии в БД
+    is_authenticated = await sync_to_async(
+        lambda: request.user.is_authenticated,
+    )()
+    if not is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    cache_key = await sync_to_async(_get_cache_key)(request)
+    if cache_key is not None:
+        content = await sync_to_async(cache.get)(cache_key)
+        if content is not None:
+            return HttpResponse(
+                content,
+                content_type='application/json',
+            )
+
+    # Ответ отдаётся уже в цикле событий, поэтому строки
+    # большой страницы собираются здесь целиком.
+    page = await sync_to_async(_get_rows_page)(
+        request,
+        stream_rows=False,
+    )
+    if isinstance(page, HttpResponse):
+        return page
+
+    if page.groupping in SUMMARIZED_GROUPPINGS:
+        await sync_to_async(_export_page_attachments)(page)
+    else:
+        await export_attachments_concurrently(
+            page.batch,
+            page.groupping,
+            page.attachments_metas,
+            page.aggregated_metas,
+        )
+    response = await sync_to_async(_render_rows_page)(page)
+    await sync_to_async(_cache_response)(cache_key, response)
+
+    return response
+
+
+def _get_cache_key(request) -> Optional[str]:
+    if not settings.ROWS_CACHE_TIMEOUT:
+        return None
+
+    return get_rows_cache_key(
+        request.user.id,
+        [
+            (name, request.POST.get(name))
+            for name in ROWS_CACHE_PARAMS
+        ],
+    )
+
+
+def _cache_response(
+        cache_key: Optional[str],
+        response: HttpResponse,
+) -> None:
+    if (
+            cache_key is not None
+            and response.status_code == 200
+            and not response.streaming
+    ):
+        cache.set(cache_key, response.content, settings.ROWS_CACHE_TIMEOUT)
+
+
+# FIXME: don't use NamedTuples?
+class RowsPage(NamedTuple):
+    who_id: int
+    groupping: str
+    page_size: int
+    payload_format: str
+
+    records: QuerySet
+    # Записи страницы (с метками времени)
+
+    slice_filter: Optional[Dict[str, Any]]
+    # Фильтр записей страницы (с автором); None, если
+    # страница пуста
+
+    batch: Optional[RecordBatch]
+    # Записи страницы; прикрепления добавляются в
+    # `_export_page_attachments`. None, если строки
+    # собираются по частям при отдаче ответа
+
+    pagination_data: Dict[str, Any]
+
+    attachments_metas: List[AttachmentMeta]
+    # Прикрепления, выгружаемые для каждой записи
+
+    aggregated_metas: List[AggregatedAttachmentMeta]
+    # Прикрепления, суммы которых выгружаются по группам
+
+
+def _get_rows_page(
+        request,
+        stream_rows: bool = True,
+) -> Union[RowsPage, HttpResponse]:
+    """
+    Параметры и записи запрошенной страницы. Со
+    `stream_rows` строки большой страницы (см.
+    `STREAMING_PAGE_SIZE`) в формате `rows` собираются не
+    здесь, а по частям при отдаче ответа.
+    """
     groupping = request.POST.get('groupping')
 
-    page_size = 10  # FIXME: get it from request
+    page_size = DEFAULT_PAGE_SIZE
+    if request.POST.get('page_size'):
+        try:
+            page_size = ListViewForm.base_fields['page_size'].clean(
+                request.POST['page_size'],
+            )
+        except ValidationError as exc:
+            return HttpResponseBadRequest(' '.join(exc.messages))
+
+    payload_format = request.POST.get('format') or ROWS_FORMAT
+    if payload_format not in (ROWS_FORMAT, COLUMNAR_FORMAT):
+        return HttpResponseBadRequest(
+            f'Unknown format: {payload_format}',
+        )
 
     page_number = 1
     try:
         page_number = int(request.POST.get('page_number'))
-    except ValueError:
+    except (TypeError, ValueError):
         pass
 
     records = Record.objects.filter(
@@ -93,12 +305,7 @@ def rows_view(request, *args, **kwargs):
         'who',
         '-when',
     ).annotate(
-        time_label=Trunc(
-            expression='when',
-            kind=TRUNC_TYPES[groupping],
-            output_field=DateTimeField(),
-            tzinfo=timezone(settings.TIME_ZONE),
-        ),
+        time_label=get_time_label_expression(groupping),
         localized_when=Trunc(
             expression='when',
             kind='second',
@@ -107,52 +314,210 @@ def rows_view(request, *args, **kwargs):
         ),
     )
 
-    slice_params: SliceParams = slice_records(
-        records=records,
-        target_page_number=page_number,
+    # Если клиент передал параметр `cursor` (в том числе
+    # пустой -- для первой страницы), то используем
+    # keyset-пагинацию, иначе -- постраничную по номеру.
+    cursor = request.POST.get('cursor')
+    pagination_data: Dict[str, Any]
+    slice_filter: Optional[Dict[str, Any]]
+
+    if cursor is None:
+        slice_params: SliceParams = slice_records_by_index(
+            records=records,
+            who_id=request.user.id,
+            groupping=groupping,
+            target_page_number=page_number,
+            page_size=page_size,
+        )
+        records = slice_params.records
+        slice_filter = slice_params.slice_filter
+        pagination_data = dict(
+            total_rows_count=slice_params.total_rows_count,
+            total_pages_count=slice_params.total_pages_count,
+            page_number=slice_params.page_number,
+            first_shown=slice_params.first_shown,
+            last_shown=slice_params.last_shown,
+        )
+    else:
+        try:
+            decoded_cursor = decode_cursor(cursor) if cursor else None
+        except ValueError as exc:
+            return HttpResponseBadRequest(str(exc))
+
+        seek_params: SeekParams = seek_records(
+            records=records,
+            cursor=decoded_cursor,
+            page_size=page_size,
+        )
+        pagination_data = dict(
+            next_cursor=seek_params.next_cursor,
+        )
+        if request.POST.get('with_totals') in ('1', 'true'):
+            # Общее количество строк требует полного
+            # прохода по истории пользователя, поэтому
+            # считаем его только по явному запросу.
+            total_rows_count = count_time_labels(records)
+            pagination_data.update(
+                total_rows_count=total_rows_count,
+                total_pages_count=math.ceil(
+                    total_rows_count / page_size,
+                ),
+            )
+        records = seek_params.records
+        slice_filter = seek_params.slice_filter
+
+    if slice_filter is not None:
+        # Прикрепления ищем только среди записей
+        # текущего пользователя.
+        slice_filter = dict(
+            slice_filter,
+            who=request.user.id,
+        )
+
+    batch: Optional[RecordBatch] = None
+    attachments_metas: List[AttachmentMeta] = []
+    aggregated_metas: List[AggregatedAttachmentMeta] = []
+    if not (
+            stream_rows
+            and page_size >= STREAMING_PAGE_SIZE
+            and payload_format == ROWS_FORMAT
+    ):
+        batch = _get_batch(records)
+        attachments_metas, aggregated_metas = _get_attachments_metas(
+            groupping,
+            slice_filter,
+        )
+
+    return RowsPage(
+        who_id=request.user.id,
+        groupping=groupping,
         page_size=page_size,
+        payload_format=payload_format,
+        records=records,
+        slice_filter=slice_filter,
+        batch=batch,
+        pagination_data=pagination_data,
+        attachments_metas=attachments_metas,
+        aggregated_metas=aggregated_metas,
     )
 
-    records = slice_params.records.values(
+
+def _get_batch(records: QuerySet) -> RecordBatch:
+    return RecordBatch(records.values_list(
         'id',
         'when',
         'localized_when',
         'time_label',
-    )
+    ))
 
-    export_attachments(
-        records,
-        AttachmentMeta(
-            model=Meal,
-            set_name='meals',
-            fk_name='record',
-            filter_=slice_params.slice_filter,
-            export_values=(
-                'food_quantity',
+
+def _get_attachments_metas(
+        groupping: str,
+        slice_filter: Optional[Dict[str, Any]],
+) -> Tuple[List[AttachmentMeta], List[AggregatedAttachmentMeta]]:
+    attachments_metas: List[AttachmentMeta] = []
+    aggregated_metas: List[AggregatedAttachmentMeta] = []
+    if groupping not in SUMMARIZED_GROUPPINGS:
+        # Строки недель, месяцев и лет собираются из
+        # суточных сводок, сами измерения не нужны.
+        attachments_metas.append(
+            AttachmentMeta(
+                model=SugarMetering,
+                set_name='sugar_meterings',
+                fk_name='record',
+                filter_=slice_filter,
+                export_values=(
+                    'sugar_level',
+                ),
             ),
-        ),
-        AttachmentMeta(
-            model=InsulinInjection,
-            set_name='injections',
-            fk_name='record',
-            filter_=slice_params.slice_filter,
-            export_values=(
-                'insulin_syringe__insulin_mark',
-                'insulin_syringe__insulin_mark__name',
-                'insulin_quantity',
+        )
+
+    if groupping == DateAggregateEnum.NONE:
+        # Каждая запись -- отдельная строка таблицы,
+        # суммировать в БД нечего.
+        attachments_metas.extend((
+            AttachmentMeta(
+                model=Meal,
+                set_name='meals',
+                fk_name='record',
+                filter_=slice_filter,
+                export_values=(
+                    'food_quantity',
+                ),
             ),
-        ),
-        AttachmentMeta(
-            model=SugarMetering,
-            set_name='sugar_meterings',
-            fk_name='record',
-            filter_=slice_params.slice_filter,
-            export_values=(
-                'sugar_level',
+            AttachmentMeta(
+                model=InsulinInjection,
+                set_name='injections',
+                fk_name='record',
+                filter_=slice_filter,
+                export_values=(
+                    'insulin_syringe__insulin_mark',
+                    'insulin_syringe__insulin_mark__name',
+                    'insulin_quantity',
+                ),
             ),
-        ),
+        ))
+    elif groupping == DateAggregateEnum.DAY:
+        aggregated_metas.extend((
+            AggregatedAttachmentMeta(
+                model=Meal,
+                set_name='meals',
+                fk_name='record',
+                filter_=slice_filter,
+                export_values=(),
+                sum_values=(
+                    'food_quantity',
+                ),
+            ),
+            AggregatedAttachmentMeta(
+                model=InsulinInjection,
+                set_name='injections',
+                fk_name='record',
+                filter_=slice_filter,
+                export_values=(
+                    'insulin_syringe__insulin_mark',
+                    'insulin_syringe__insulin_mark__name',
+                ),
+                sum_values=(
+                    'insulin_quantity',
+                ),
+            ),
+        ))
+
+    return attachments_metas, aggregated_metas
+
+
+def _export_page_attachments(page: RowsPage) -> None:
+    if page.groupping in SUMMARIZED_GROUPPINGS:
+        export_daily_summaries(
+            page.batch,
+            page.who_id,
+            page.groupping,
+        )
+    export_aggregated_attachments(
+        page.batch,
+        page.groupping,
+        *page.aggregated_metas,
+    )
+    export_attachments(
+        page.batch,
+        *page.attachments_metas,
     )
 
+
+def _get_rows(
+        batch: RecordBatch,
+        groupping: str,
+        who_id: int,
+        last_time_label: Optional[datetime] = None,
+        insulin_columns: Optional[List[Dict[str, str]]] = None,
+) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+    """
+    Колонки и строки таблицы для записей `batch`.
+    `last_time_label` и `insulin_columns` задаются, если
+    `batch` -- только часть страницы: самая поздняя метка
+    и колонки инсулина всей страницы.
+    """
     columns: List[Dict[str, str]] = [
         dict(
             data_index='time_label',
@@ -160,60 +525,195 @@ def rows_view(request, *args, **kwargs):
         ),
     ]
     time_label_display: Callable[[datetime], str] = TIME_LABEL_FORMAT[groupping]
-    key_func: Callable[[Dict[str, Any]], Any] = itemgetter('time_label')
 
     response_rows: List[Dict[str, Any]] = [
         {
             'time_label': time_label_display(time_label),
         }
-        for time_label, _ in groupby(records, key_func)
+        for time_label in batch.time_labels
     ]
 
     # todo: Написать класс-обёртку для columns,
     #  чтобы при каждом редактировании проверялась
     #  уникальность data_index-ов (в дебаге) с печатью
     #  сообщений об ошибках в лог.
-    get_sugar_display_data(
-        records,
-        columns,
-        response_rows,
-        key_func,
-        groupping,
-    )
+    if groupping in SUMMARIZED_GROUPPINGS:
+        get_summarized_sugar_display_data(
+            batch,
+            columns,
+            response_rows,
+            groupping,
+            who_id,
+            last_time_label,
+        )
+    else:
+        get_sugar_display_data(
+            batch,
+            columns,
+            response_rows,
+            groupping,
+            who_id,
+        )
     get_meal_display_data(
-        records,
+        batch,
         columns,
         response_rows,
-        key_func,
-    )
-    get_injections_display_data(
-        records,
-        columns,
-        response_rows,
-        key_func,
     )
+    if insulin_columns is None:
+        get_injections_display_data(
+            batch,
+            columns,
+            response_rows,
+        )
+    else:
+        get_injections_display_data(
+            batch,
+            [],
+            response_rows,
+        )
+        columns.extend(insulin_columns)
+        for row in response_rows:
+            for column in insulin_columns:
+                row.setdefault(column['data_index'], '-')
+
+    return columns, response_rows
+
+
+def _render_rows_page(page: RowsPage) -> HttpResponse:
+    serializer = get_serializer()
+    if page.batch is None:
+        return StreamingHttpResponse(
+            _iter_streamed_rows(page),
+            content_type='application/json',
+        )
 
-    response_data = dict(
-        rows=response_rows,
-        columns=columns,
-        total_rows_count=slice_params.total_rows_count,
-        total_pages_count=slice_params.total_pages_count,
-        page_number=slice_params.page_number,
-        first_shown=slice_params.first_shown,
-        last_shown=slice_params.last_shown,
+    columns, response_rows = _get_rows(
+        page.batch,
+        page.groupping,
+        page.who_id,
     )
-    dumps_kwargs: Dict[str, Any]
-    if settings.DEBUG:
-        dumps_kwargs = dict(
-            ensure_ascii=False,
-            indent=4,
+
+    response_data: Dict[str, Any]
+    list_key: str
+    if page.payload_format == COLUMNAR_FORMAT:
+        response_data = dict(
+            columns=columns,
+            values=to_columnar(response_rows, columns),
+            **page.pagination_data,
         )
+        list_key = 'values'
     else:
-        dumps_kwargs = dict(
-            ensure_ascii=True,
+        response_data = dict(
+            rows=response_rows,
+            columns=columns,
+            **page.pagination_data,
         )
+        list_key = 'rows'
 
-    return HttpResponse(json.dumps(
-        response_data,
-        **dumps_kwargs,
-    ))
+    if page.page_size >= STREAMING_PAGE_SIZE:
+        # Страница собрана целиком (колоночный формат или
+        # асинхронное представление), по частям только
+        # сериализуется.
+        return StreamingHttpResponse(
+            serializer.iter_dumps(
+                response_data,
+                list_key,
+                STREAMING_CHUNK_ROWS,
+            ),
+            content_type='application/json',
+        )
+
+    return HttpResponse(
+        serializer.dumps(
+            response_data,
+            pretty=settings.DEBUG,
+        ),
+        content_type='application/json',
+    )
+
+
+def _iter_streamed_rows(page: RowsPage) -> Iterator[bytes]:
+    """
+    Ответ со страницей `page` в формате `rows`, строки
+    которой собираются порциями по `STREAMING_CHUNK_ROWS`
+    (keyset-пагинацией внутри страницы) по мере отдачи,
+    так что в памяти одновременно только одна порция.
+    """
+    chunks = _iter_rows_chunks(page)
+    columns, first_chunk = next(chunks, (None, []))
+    if columns is None:
+        # пустая страница
+        columns, _ = _get_rows(
+            RecordBatch([]),
+            page.groupping,
+            page.who_id,
+        )
+
+    yield from get_serializer().iter_chunks_dumps(
+        dict(
+            rows=[],
+            columns=columns,
+            **page.pagination_data,
+        ),
+        'rows',
+        chain(
+            (first_chunk,),
+            (chunk_rows for _, chunk_rows in chunks),
+        ),
+    )
+
+
+def _iter_rows_chunks(
+        page: RowsPage,
+) -> Iterator[Tuple[List[Dict[str, str]], List[Dict[str, Any]]]]:
+    # Колонки и строки порций страницы: колонки у всех
+    # порций одни и те же.
+    insulin_columns: Optional[List[Dict[str, str]]] = None
+    last_time_label: Optional[datetime] = None
+    cursor: Optional[datetime] = None
+    while True:
+        seek_params: SeekParams = seek_records(
+            records=page.records,
+            cursor=cursor,
+            page_size=STREAMING_CHUNK_ROWS,
+        )
+        if seek_params.slice_filter is None:
+            return
+
+        slice_filter = dict(
+            seek_params.slice_filter,
+            who=page.who_id,
+        )
+        batch = _get_batch(seek_params.records)
+        attachments_metas, aggregated_metas = _get_attachments_metas(
+            page.groupping,
+            slice_filter,
+        )
+        _export_page_attachments(page._replace(
+            batch=batch,
+            attachments_metas=attachments_metas,
+            aggregated_metas=aggregated_metas,
+        ))
+
+        if insulin_columns is None:
+            # Первая порция -- самые поздние записи
+            # страницы; её сводки уже построены (см.
+            # `export_daily_summaries`).
+            last_time_label = max(batch.time_labels)
+            insulin_columns = get_page_insulin_columns(
+                page.who_id,
+                page.groupping,
+                page.slice_filter,
+            )
+
+        yield _get_rows(
+            batch,
+            page.groupping,
+            page.who_id,
+            last_time_label,
+            insulin_columns,
+        )
+
+        if seek_params.next_cursor is None:
+            return
+        cursor = decode_cursor(seek_params.next_cursor)
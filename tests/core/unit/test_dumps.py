@@ -0,0 +1,618 @@
+import gzip
+import io
+import json
+from decimal import (
+    Decimal,
+)
+
+import pytest
+from django.contrib.auth.models import (
+    Group,
+    User,
+)
+from django.core import (
+    serializers,
+)
+from django.core.management import (
+    CommandError,
+    call_command,
+)
+from django.http import (
+    FileResponse,
+)
+
+from core.changelog import (
+    clear_changes,
+    get_changes,
+    get_last_entry_id,
+    log_changes,
+)
+from core.dumps import (
+    COMPRESSIONS,
+    Compression,
+    apply_delta,
+    get_dumped_models,
+    iter_model_lines,
+)
+from sugar.models import (
+    Comment,
+    Record,
+    SugarMetering,
+    TimeLabelGroup,
+)
+from tests.sugar.test_rows_view import (
+    get_index_state,
+    get_summaries_state,
+)
+
+
+def parse_lines(content):
+    dumped_objects = [
+        json.loads(line)
+        for line in content.splitlines()
+    ]
+    # порядок связей многие-ко-многим не важен
+    for dumped_object in dumped_objects:
+        for field_name, value in dumped_object['fields'].items():
+            if isinstance(value, list):
+                dumped_object['fields'][field_name] = sorted(value)
+    return dumped_objects
+
+
+def test_lines_are_the_same_as_jsonl_serializer(
+        diary,
+):
+    dumped_models = get_dumped_models()
+    assert Record in dumped_models
+    assert Group in dumped_models
+
+    for model in dumped_models:
+        lines = b''.join(
+            chunk_lines
+            for _, chunk_lines in iter_model_lines(model, chunk_size=2)
+        )
+        expected_lines = serializers.serialize(
+            'jsonl',
+            model._default_manager.order_by('pk'),
+        )
+        assert parse_lines(lines.decode()) == parse_lines(expected_lines), model  # noqa
+
+
+def test_exclude(
+        diary,
+):
+    dumped_models = get_dumped_models(['auth', 'sugar.TimeLabelGroup'])
+
+    assert Group not in dumped_models
+    assert TimeLabelGroup not in dumped_models
+    assert Record in dumped_models
+
+
+def test_unknown_exclude(
+        db,
+):
+    with pytest.raises(LookupError):
+        get_dumped_models(['sugar.Unknown'])
+
+
+@pytest.mark.parametrize('chunk_size', (1, 2000))
+def test_dump_and_restore(
+        chunk_size,
+        diary,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    expected_meterings = list(SugarMetering.objects.values_list(
+        'record__who__username',
+        'record__when',
+        'sugar_level',
+    ))
+    expected_permissions = set(Group.objects.values_list(
+        'name',
+        'permissions__codename',
+    ))
+
+    stdout = io.StringIO()
+    call_command(
+        'gzip_dumpdata',
+        filename='dump.jsonl.gz',
+        chunk_size=chunk_size,
+        compression_level=1,
+        stdout=stdout,
+    )
+    output = stdout.getvalue()
+    assert 'sugar.Record: 1 objects\n' in output
+    assert f'objects are dumped to {tmp_path / "dump.jsonl.gz"}' in output
+
+    with gzip.open(tmp_path / 'dump.jsonl.gz', 'rt') as dump_file:
+        dumped_models = {
+            json.loads(line)['model']
+            for line in dump_file
+        }
+    assert {'auth.user', 'sugar.record', 'sugar.sugarmetering'} <= dumped_models  # noqa
+
+    Record.objects.all().delete()
+    Group.objects.all().delete()
+    call_command(
+        'loaddata',
+        str(tmp_path / 'dump.jsonl.gz'),
+        verbosity=0,
+    )
+
+    assert list(SugarMetering.objects.values_list(
+        'record__who__username',
+        'record__when',
+        'sugar_level',
+    )) == expected_meterings
+    assert set(Group.objects.values_list(
+        'name',
+        'permissions__codename',
+    )) == expected_permissions
+
+
+def test_restore_with_optional_compression(
+        diary,
+        monkeypatch,
+        settings,
+        tmp_path,
+):
+    # так подключаются zstd и lz4, если они установлены
+    monkeypatch.setitem(COMPRESSIONS, 'fake', Compression(
+        extension='fake',
+        content_type='application/gzip',
+        default_level=1,
+        open_for_writing=lambda path, level: gzip.open(path, 'wb', level),
+        open_for_reading=lambda path: gzip.open(path, 'rb'),
+    ))
+    settings.MEDIA_ROOT = str(tmp_path)
+    expected_records = list(Record.objects.values_list('who', 'when'))
+
+    call_command(
+        'gzip_dumpdata',
+        compression='fake',
+        verbosity=0,
+    )
+    dump_path, = tmp_path.glob('pocketbook-*.jsonl.fake')
+
+    Record.objects.all().delete()
+    call_command(
+        'restore',
+        str(dump_path),
+        stdout=io.StringIO(),
+    )
+
+    assert list(Record.objects.values_list('who', 'when')) == expected_records
+
+
+def test_changes_are_logged(
+        diary,
+):
+    clear_changes()
+    user = User.objects.get(username='user')
+    record = Record.objects.get()
+
+    record.save()
+    comment = Comment.objects.filter(record=record).get()
+    comment_pk = comment.pk
+    comment.delete()
+    Group.objects.get().user_set.clear()
+
+    changes = get_changes(get_last_entry_id())
+    assert changes == {
+        'sugar.record': {str(record.pk)},
+        'sugar.comment': {str(comment_pk)},
+        'auth.user': {str(user.pk)},
+    }
+    # индекс страниц изменился, но он не отслеживается
+    assert TimeLabelGroup.objects.exists()
+
+
+def get_diary_state():
+    return (
+        list(Record.objects.order_by('pk').values()),
+        list(SugarMetering.objects.order_by('pk').values()),
+        list(Comment.objects.order_by('pk').values()),
+        list(User.objects.order_by('pk').values_list(
+            'username',
+            'groups__name',
+        )),
+        get_index_state(),
+        get_summaries_state(),
+    )
+
+
+@pytest.fixture
+def download_dump(
+        admin,
+        create_client,
+):
+    client = create_client(
+        authenticated_with=admin,
+    )
+
+    def _download_dump(**data):
+        # выгрузка в этом же запросе, без очереди
+        data.setdefault('stream', '1')
+        response = client.get('/core/dump', data=data)
+        assert response.status_code == 200
+        content = b''.join(response.streaming_content)
+        return response, content
+
+    return _download_dump
+
+
+def test_dump_view(
+        diary,
+        download_dump,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+    response, content = download_dump()
+
+    assert response['Content-Type'] == 'application/gzip'
+    assert response['Content-Disposition'].startswith(
+        'inline; filename=pocketbook-',
+    )
+    assert response['Content-Disposition'].endswith('.jsonl.gz')
+    mark_object, *dumped_objects = parse_lines(
+        gzip.decompress(content).decode(),
+    )
+    assert mark_object['model'] == 'core.dumpmark'
+    assert {'auth.user', 'sugar.record'} <= {
+        dumped_object['model']
+        for dumped_object in dumped_objects
+    }
+    # без JSON_DUMP_CACHE_TIMEOUT файл не сохраняется
+    assert list(tmp_path.iterdir()) == []
+
+    response, content = download_dump(compression='none')
+    assert response['Content-Type'] == 'application/jsonl'
+    assert parse_lines(content.decode())[1:] == dumped_objects
+
+
+def test_dump_view_unknown_compression(
+        admin,
+        create_client,
+):
+    client = create_client(authenticated_with=admin)
+
+    response = client.get('/core/dump', data={'compression': 'rar'})
+
+    assert response.status_code == 400
+
+
+def test_dump_view_cache(
+        diary,
+        download_dump,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.JSON_DUMP_CACHE_TIMEOUT = 60
+
+    first_response, first_content = download_dump()
+    dump_path, = tmp_path.iterdir()
+    assert dump_path.read_bytes() == first_content
+
+    # данные не менялись -- отдаётся тот же файл
+    cached_response, cached_content = download_dump()
+    assert isinstance(cached_response, FileResponse)
+    assert cached_content == first_content
+    assert cached_response['Content-Disposition'] == (
+        f'inline; filename="{dump_path.name}"'
+    )
+
+    # другой способ сжатия -- новая выгрузка
+    response, _ = download_dump(compression='none')
+    assert not isinstance(response, FileResponse)
+
+    Record.objects.get().save()
+    response, content = download_dump()
+    assert not isinstance(response, FileResponse)
+    assert b'"sugar.record"' in gzip.decompress(content)
+
+
+def test_dump_view_incremental(
+        diary,
+        download_dump,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.JSON_DUMP_CACHE_TIMEOUT = 60
+    _, content = download_dump()
+    base_mark = parse_lines(gzip.decompress(content).decode())[0]
+
+    record = Record.objects.get()
+    record.save()
+    response, content = download_dump(incremental='1')
+
+    assert response['Content-Disposition'].endswith('-delta.jsonl.gz')
+    delta_mark, *delta_objects = parse_lines(
+        gzip.decompress(content).decode(),
+    )
+    assert delta_mark['fields']['base_id'] == (
+        base_mark['fields']['dump_id']
+    )
+    assert [
+        (delta_object['model'], delta_object['pk'])
+        for delta_object in delta_objects
+    ] == [('sugar.record', record.pk)]
+    # инкрементальные выгрузки не сохраняются
+    assert len(list(tmp_path.iterdir())) == 1
+
+    _, content = download_dump(incremental='1')
+    empty_delta_mark, = parse_lines(gzip.decompress(content).decode())
+    assert empty_delta_mark['fields']['base_id'] == (
+        delta_mark['fields']['dump_id']
+    )
+
+
+def test_incremental_dump_and_restore(
+        admin,
+        create_datetime,
+        create_record,
+        diary,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+    def dump(filename, **kwargs):
+        stdout = io.StringIO()
+        call_command('gzip_dumpdata', filename=filename, stdout=stdout, **kwargs)  # noqa
+        return stdout.getvalue()
+
+    dump('base.jsonl.gz')
+
+    new_record = create_record(
+        when=create_datetime('2021-05-11T08:00:00'),
+        metering_params=dict(sugar_level=Decimal('7.1')),
+    )
+    SugarMetering.objects.filter(
+        sugar_level=Decimal('5.5'),
+    ).update(
+        sugar_level=Decimal('6.5'),
+    )
+    log_changes(SugarMetering, SugarMetering.objects.values_list('pk', flat=True))  # noqa
+    Comment.objects.get().delete()
+    output = dump('delta-1.jsonl.gz', incremental=True)
+    assert 'sugar.Record: 1 objects\n' in output
+
+    with gzip.open(tmp_path / 'delta-1.jsonl.gz', 'rt') as delta_file:
+        delta_objects = [json.loads(line) for line in delta_file]
+    assert [
+        (delta_object['model'], delta_object.get('deleted', False))
+        for delta_object in delta_objects
+    ] == [
+        ('core.dumpmark', False),
+        ('sugar.comment', True),
+        ('sugar.record', False),
+        ('sugar.sugarmetering', False),
+        ('sugar.sugarmetering', False),
+    ]
+
+    new_record.delete()
+    User.objects.get(username='user').groups.clear()
+    dump('delta-2.jsonl.gz', incremental=True)
+    dump('delta-3.jsonl.gz', incremental=True)  # изменений нет
+
+    expected_state = get_diary_state()
+    call_command('flush', interactive=False, verbosity=0)
+    assert Record.objects.count() == 0
+
+    stdout = io.StringIO()
+    call_command(
+        'restore',
+        str(tmp_path / 'base.jsonl.gz'),
+        *(
+            str(tmp_path / f'delta-{idx}.jsonl.gz')
+            for idx in (1, 2, 3)
+        ),
+        stdout=stdout,
+    )
+
+    assert 'delta-2.jsonl.gz: 2 object(s) deleted, 1 object(s) saved' in stdout.getvalue()  # noqa
+    assert get_diary_state() == expected_state
+    assert get_changes(get_last_entry_id()) == {}
+
+
+def test_partial_dump_keeps_changes(
+        diary,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    call_command('gzip_dumpdata', filename='base.jsonl.gz', verbosity=0)
+    metering = SugarMetering.objects.get(sugar_level=Decimal('5.5'))
+    metering.sugar_level = Decimal('6.5')
+    metering.save()
+
+    # выгрузка без приложения sugar не удаляет его
+    # изменения из журнала
+    call_command(
+        'gzip_dumpdata',
+        filename='partial.jsonl.gz',
+        excludes=['sugar'],
+        verbosity=0,
+    )
+    call_command(
+        'gzip_dumpdata',
+        filename='delta.jsonl.gz',
+        incremental=True,
+        verbosity=0,
+    )
+
+    with gzip.open(tmp_path / 'delta.jsonl.gz', 'rt') as delta_file:
+        delta_objects = [json.loads(line) for line in delta_file]
+    assert ('sugar.sugarmetering', metering.pk) in {
+        (delta_object['model'], delta_object['pk'])
+        for delta_object in delta_objects
+    }
+
+    expected_state = get_diary_state()
+    call_command(
+        'restore',
+        str(tmp_path / 'base.jsonl.gz'),
+        str(tmp_path / 'delta.jsonl.gz'),
+        fast=True,
+        stdout=io.StringIO(),
+    )
+    assert get_diary_state() == expected_state
+
+
+@pytest.mark.parametrize('fast', (False, True))
+def test_restore_checks_deltas_chain(
+        diary,
+        fast,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    call_command('gzip_dumpdata', filename='old.jsonl.gz', verbosity=0)
+    call_command('gzip_dumpdata', filename='base.jsonl.gz', verbosity=0)
+    Record.objects.get().save()
+    call_command(
+        'gzip_dumpdata',
+        filename='delta.jsonl.gz',
+        incremental=True,
+        verbosity=0,
+    )
+    User.objects.create(username='extra')
+    expected_state = get_diary_state()
+
+    # выгрузка сделана после base.jsonl.gz, а не old.jsonl.gz
+    with pytest.raises(CommandError, match='does not follow'):
+        call_command(
+            'restore',
+            str(tmp_path / 'old.jsonl.gz'),
+            str(tmp_path / 'delta.jsonl.gz'),
+            fast=fast,
+            stdout=io.StringIO(),
+        )
+    assert get_diary_state() == expected_state
+
+    # к БД с другой загруженной выгрузкой она не применяется
+    call_command(
+        'restore',
+        str(tmp_path / 'old.jsonl.gz'),
+        fast=fast,
+        stdout=io.StringIO(),
+    )
+    with gzip.open(tmp_path / 'delta.jsonl.gz', 'rb') as delta_stream:
+        with pytest.raises(ValueError, match='but dump'):
+            apply_delta(delta_stream)
+
+
+def test_fast_restore(
+        admin,
+        create_datetime,
+        create_record,
+        diary,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    call_command('gzip_dumpdata', filename='base.jsonl.gz', verbosity=0)
+    Record.objects.get().save()
+    call_command(
+        'gzip_dumpdata',
+        filename='delta.jsonl.gz',
+        incremental=True,
+        verbosity=0,
+    )
+    expected_state = (
+        get_diary_state(),
+        sorted(Group.objects.values_list('name', 'permissions__codename')),
+        sorted(User.objects.values_list('username', 'user_permissions__codename')),  # noqa
+    )
+
+    # лишние объекты удаляются, а не остаются, как после `loaddata`
+    User.objects.create(username='extra')
+    stdout = io.StringIO()
+    call_command(
+        'restore',
+        str(tmp_path / 'base.jsonl.gz'),
+        str(tmp_path / 'delta.jsonl.gz'),
+        fast=True,
+        batch_size=2,
+        stdout=stdout,
+    )
+
+    output = stdout.getvalue()
+    assert 'sugar.Record: 1 objects\n' in output
+    assert 'Installed ' in output
+    assert (
+        get_diary_state(),
+        sorted(Group.objects.values_list('name', 'permissions__codename')),
+        sorted(User.objects.values_list('username', 'user_permissions__codename')),  # noqa
+    ) == expected_state
+    # значения первичных ключей не пересекаются с загруженными
+    restored_record = Record.objects.get()
+    assert create_record(
+        when=create_datetime('2021-05-11T08:00:00'),
+    ).pk > restored_record.pk
+
+
+def test_failed_fast_restore_keeps_data(
+        diary,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    call_command('gzip_dumpdata', filename='base.jsonl.gz', verbosity=0)
+    dump_path = tmp_path / 'base.jsonl.gz'
+    lines = gzip.decompress(dump_path.read_bytes()).splitlines(keepends=True)
+    # выгрузка обрывается на середине
+    dump_path.write_bytes(gzip.compress(
+        b''.join(lines[:len(lines) // 2]) + b'{"model": "sugar.record"',
+    ))
+    expected_state = get_diary_state()
+
+    with pytest.raises(ValueError):
+        call_command('restore', str(dump_path), fast=True, stdout=io.StringIO())  # noqa
+
+    assert get_diary_state() == expected_state
+
+
+@pytest.mark.parametrize('fast', (False, True))
+def test_restore_resets_cached_rows(
+        diary,
+        fast,
+        get_rows,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    call_command('gzip_dumpdata', filename='base.jsonl.gz', verbosity=0)
+    metering = SugarMetering.objects.get()
+    metering.sugar_level = Decimal('9.9')
+    metering.save()
+    response_data = get_rows(groupping='day', page_number=1)
+    assert response_data['rows'][0]['max_sugar'] == '9.9'
+
+    if not fast:
+        call_command('flush', interactive=False, verbosity=0)
+    call_command(
+        'restore',
+        str(tmp_path / 'base.jsonl.gz'),
+        fast=fast,
+        stdout=io.StringIO(),
+    )
+
+    response_data = get_rows(groupping='day', page_number=1)
+    assert response_data['rows'][0]['max_sugar'] == '5.5'
+
+
+def test_fast_restore_only_jsonl(
+        db,
+        tmp_path,
+):
+    dump_path = tmp_path / 'dump.json.gz'
+    dump_path.write_bytes(gzip.compress(b'[]'))
+
+    with pytest.raises(CommandError, match='restores only jsonl dumps'):
+        call_command('restore', str(dump_path), fast=True, stdout=io.StringIO())  # noqa
@@ -219,6 +219,14 @@ def test_is_sorted(kwargs, expected_value):
                 1.11,
             ],
         ],
+        [
+            {
+                'dest_args': [0.5, 1.5, 3],
+                'source_args': [2, 0, 1],
+                'source_values': [2, 1, 3],
+            },
+            [2, 2.5, 1],
+        ],
     ],
 )
 def test_numpy_interp(kwargs, expected_result):
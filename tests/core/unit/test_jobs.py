@@ -0,0 +1,229 @@
+import gzip
+import io
+import json
+from datetime import (
+    timedelta,
+)
+
+import pytest
+from django.core.management import (
+    call_command,
+)
+from django.http import (
+    FileResponse,
+)
+from django.utils import (
+    timezone,
+)
+
+from core.enums import (
+    JobStatusEnum,
+)
+from core.jobs import (
+    claim_next_job,
+    enqueue_job,
+    fail_stale_jobs,
+    run_pending_jobs,
+)
+from core.models import (
+    Job,
+)
+from sugar.models import (
+    Record,
+)
+
+
+@pytest.fixture
+def admin_client(
+        admin,
+        create_client,
+):
+    return create_client(
+        authenticated_with=admin,
+    )
+
+
+def test_jobs_are_run_in_order(
+        db,
+):
+    failed_job = enqueue_job('unknown-command')
+    done_job = enqueue_job('check', verbosity=0)
+
+    assert claim_next_job() == failed_job
+    assert claim_next_job() == done_job
+    # занятые задачи другим обработчикам не достаются
+    assert claim_next_job() is None
+
+    Job.objects.update(status=JobStatusEnum.PENDING)
+    assert run_pending_jobs() == 2
+    failed_job.refresh_from_db()
+    done_job.refresh_from_db()
+
+    assert failed_job.status == JobStatusEnum.FAILED
+    assert 'Unknown command' in failed_job.output
+    assert done_job.status == JobStatusEnum.DONE
+    assert done_job.started_at <= done_job.finished_at
+    assert run_pending_jobs() == 0
+
+
+def test_run_jobs_command(
+        db,
+):
+    enqueue_job('check', verbosity=0)
+    stdout = io.StringIO()
+
+    call_command('run_jobs', once=True, stdout=stdout)
+
+    assert stdout.getvalue() == '1 job(s) are done\n'
+    assert Job.objects.get().status == JobStatusEnum.DONE
+
+
+def test_run_jobs_command_fails_stale_jobs(
+        db,
+        settings,
+):
+    settings.JOB_TIMEOUT = 60
+    job = enqueue_job('check', verbosity=0)
+    Job.objects.update(
+        status=JobStatusEnum.RUNNING,
+        started_at=timezone.now() - timedelta(seconds=61),
+    )
+    stdout = io.StringIO()
+
+    call_command('run_jobs', once=True, stdout=stdout)
+
+    assert stdout.getvalue() == '1 stale job(s) are marked as failed\n'
+    job.refresh_from_db()
+    assert job.status == JobStatusEnum.FAILED
+
+
+def test_stale_jobs_are_failed(
+        db,
+        settings,
+):
+    settings.JOB_TIMEOUT = 60
+    stale_job = enqueue_job('check', verbosity=0)
+    running_job = enqueue_job('check', verbosity=0)
+    claim_next_job()
+    claim_next_job()
+    # обработчик stale_job упал
+    Job.objects.filter(id=stale_job.id).update(
+        started_at=timezone.now() - timedelta(seconds=61),
+    )
+
+    assert fail_stale_jobs() == 1
+    stale_job.refresh_from_db()
+    running_job.refresh_from_db()
+
+    assert stale_job.status == JobStatusEnum.FAILED
+    assert 'worker has probably crashed' in stale_job.output
+    assert stale_job.finished_at is not None
+    assert running_job.status == JobStatusEnum.RUNNING
+    assert fail_stale_jobs() == 0
+
+
+def test_dump_job(
+        admin_client,
+        create_record,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.JSON_DUMP_CACHE_TIMEOUT = 60
+    record = create_record()
+
+    response = admin_client.get('/core/dump')
+    assert response.status_code == 202
+    job_state = response.json()
+    assert job_state['status'] == 'pending'
+    assert job_state['url'] == f'/core/dump/{job_state["id"]}'
+
+    # пока выгрузка не выполнена, новая не ставится
+    assert admin_client.get('/core/dump').json() == job_state
+    assert admin_client.get(job_state['url']).json() == job_state
+    incremental_job_state = admin_client.get(
+        '/core/dump',
+        data={'incremental': '1'},
+    ).json()
+    assert incremental_job_state['id'] != job_state['id']
+    # после инкрементальной выгрузки полная уже не начало
+    # цепочки и повторно не отдаётся
+    Job.objects.filter(id=incremental_job_state['id']).delete()
+
+    call_command('run_jobs', once=True, verbosity=0)
+
+    job_state = admin_client.get(job_state['url']).json()
+    assert job_state['status'] == 'done'
+    response = admin_client.get(job_state['download_url'])
+    assert isinstance(response, FileResponse)
+    assert response['Content-Type'] == 'application/gzip'
+    content = b''.join(response.streaming_content)
+    assert {
+        'model': 'sugar.record',
+        'pk': record.pk,
+    }.items() <= json.loads(next(
+        line
+        for line in gzip.decompress(content).splitlines()
+        if b'"sugar.record"' in line
+    )).items()
+
+    # выгрузка выполнена, данные не менялись -- файл
+    # отдаётся сразу
+    response = admin_client.get('/core/dump')
+    assert isinstance(response, FileResponse)
+    assert b''.join(response.streaming_content) == content
+
+    Record.objects.get().save()
+    response = admin_client.get('/core/dump')
+    assert response.status_code == 202
+
+
+def test_stale_dump_job_is_not_reused(
+        admin_client,
+        settings,
+):
+    settings.JOB_TIMEOUT = 60
+    job_state = admin_client.get('/core/dump').json()
+    assert claim_next_job().id == job_state['id']
+    assert admin_client.get('/core/dump').json() == {
+        **job_state,
+        'status': 'running',
+    }
+
+    # обработчик упал, задача осталась выполняемой
+    Job.objects.update(started_at=timezone.now() - timedelta(seconds=61))
+    new_job_state = admin_client.get('/core/dump').json()
+
+    assert new_job_state['id'] != job_state['id']
+    assert new_job_state['status'] == 'pending'
+
+
+def test_failed_dump_job(
+        admin_client,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path / 'missing')
+
+    job_state = admin_client.get('/core/dump').json()
+    call_command('run_jobs', once=True, verbosity=0)
+
+    job_state = admin_client.get(job_state['url']).json()
+    assert job_state['status'] == 'failed'
+    assert 'FileNotFoundError' in job_state['error']
+    assert 'download_url' not in job_state
+    response = admin_client.get(f'/core/dump/{job_state["id"]}/file')
+    assert response.status_code == 404
+
+
+def test_dump_job_requires_superuser(
+        db,
+        client,
+        create_user,
+):
+    job = enqueue_job('gzip_dumpdata')
+    client.force_login(create_user(username='user'))
+
+    response = client.get(f'/core/dump/{job.id}')
+
+    assert response.status_code == 302
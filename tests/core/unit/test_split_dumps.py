@@ -0,0 +1,209 @@
+import gzip
+import hashlib
+import io
+import json
+from decimal import (
+    Decimal,
+)
+
+import pytest
+from django.contrib.auth.models import (
+    Group,
+    User,
+)
+from django.core.management import (
+    CommandError,
+    call_command,
+)
+from django.db import (
+    connection,
+)
+
+from core.changelog import (
+    get_dump_mark,
+)
+from core.dumps import (
+    get_dumped_models,
+)
+from core.split_dumps import (
+    MANIFEST_FILENAME,
+    run_per_model,
+)
+from main.helpers import (
+    get_data_model_version,
+)
+from sugar.models import (
+    SugarMetering,
+)
+from tests.core.unit.test_dumps import (
+    get_diary_state,
+)
+
+
+@pytest.fixture
+def split_dump_path(
+        diary,
+        settings,
+        tmp_path,
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+    def _dump(**kwargs):
+        call_command(
+            'gzip_dumpdata',
+            filename='split',
+            split=True,
+            stdout=io.StringIO(),
+            **kwargs,
+        )
+        return tmp_path / 'split'
+
+    return _dump
+
+
+def read_manifest(path):
+    return json.loads((path / MANIFEST_FILENAME).read_text())
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_split_dump_and_restore(
+        jobs,
+        split_dump_path,
+):
+    if jobs > 1 and connection.is_in_memory_db():
+        pytest.skip('Processes do not share an in-memory database')
+
+    path = split_dump_path(jobs=jobs)
+
+    manifest = read_manifest(path)
+    assert manifest['data_model_version'] == get_data_model_version()
+    assert manifest['compression'] == 'gzip'
+    assert [
+        (entry['model'], entry['count'])
+        for entry in manifest['models']
+    ] == [
+        (model._meta.label_lower, model._base_manager.count())
+        for model in get_dumped_models()
+    ]
+    for entry in manifest['models']:
+        content = (path / entry['file']).read_bytes()
+        assert hashlib.sha256(content).hexdigest() == entry['sha256']
+        assert len(gzip.decompress(content).splitlines()) == entry['count']
+
+    expected_state = (
+        get_diary_state(),
+        sorted(Group.objects.values_list('name', 'permissions__codename')),
+    )
+    User.objects.create(username='extra')
+    stdout = io.StringIO()
+    call_command('restore', str(path), jobs=jobs, force=True, stdout=stdout)
+
+    assert 'sugar.Record: 1 objects\n' in stdout.getvalue()
+    assert (
+        get_diary_state(),
+        sorted(Group.objects.values_list('name', 'permissions__codename')),
+    ) == expected_state
+    # выгрузка -- точка отсчёта инкрементальных
+    assert str(get_dump_mark().dump_id) == manifest['dump_id']
+
+
+def test_split_restore_checks_files(
+        split_dump_path,
+):
+    path = split_dump_path(jobs=1)
+    manifest = read_manifest(path)
+    expected_state = get_diary_state()
+    # без времени в заголовке, чтобы сжатие давало те же байты
+    empty_member = gzip.compress(b'', mtime=0)
+    (path / 'sugar.record.jsonl.gz').write_bytes(empty_member)
+
+    with pytest.raises(ValueError, match='sugar.record.jsonl.gz: checksum mismatch'):  # noqa
+        call_command('restore', str(path), stdout=io.StringIO())
+    assert get_diary_state() == expected_state
+
+    manifest['data_model_version'] = 'old'
+    for entry in manifest['models']:
+        if entry['model'] == 'sugar.record':
+            entry['sha256'] = hashlib.sha256(empty_member).hexdigest()
+    (path / MANIFEST_FILENAME).write_text(json.dumps(manifest))
+    stderr = io.StringIO()
+
+    with pytest.raises(ValueError, match='0 objects are loaded, 1 are expected'):  # noqa
+        call_command('restore', str(path), stdout=io.StringIO(), stderr=stderr)  # noqa
+    assert 'Dump data model version old differs' in stderr.getvalue()
+    # очистка таблиц откатывается вместе с загрузкой
+    assert get_diary_state() == expected_state
+
+
+def test_split_restore_resets_cached_rows(
+        get_rows,
+        split_dump_path,
+):
+    path = split_dump_path()
+    metering = SugarMetering.objects.get()
+    metering.sugar_level = Decimal('9.9')
+    metering.save()
+    response_data = get_rows(groupping='day', page_number=1)
+    assert response_data['rows'][0]['max_sugar'] == '9.9'
+
+    call_command('restore', str(path), stdout=io.StringIO())
+
+    response_data = get_rows(groupping='day', page_number=1)
+    assert response_data['rows'][0]['max_sugar'] == '5.5'
+
+
+def test_parallel_split_restore_requires_force(
+        monkeypatch,
+        split_dump_path,
+):
+    path = split_dump_path(jobs=1)
+    expected_state = get_diary_state()
+    monkeypatch.setattr(connection, 'vendor', 'mysql')
+
+    with pytest.raises(CommandError, match='Loading in 2 processes is not atomic'):  # noqa
+        call_command('restore', str(path), jobs=2, stdout=io.StringIO())
+    assert get_diary_state() == expected_state
+
+
+def test_split_dump_is_not_incremental(
+        split_dump_path,
+):
+    with pytest.raises(Exception, match='can not be incremental'):
+        split_dump_path(incremental=True)
+
+
+@pytest.mark.parametrize('dependencies, expected_order', (
+    (
+        {'a': {'b'}, 'b': {'c'}, 'c': set(), 'd': set()},
+        ['c', 'b', 'a', 'd'],
+    ),
+    (
+        # цикл разрывается по порядку моделей
+        {'a': {'b'}, 'b': {'a'}, 'c': {'a'}},
+        ['a', 'b', 'c'],
+    ),
+    (
+        # модели, которых нет среди загружаемых, не ждут
+        {'a': {'x'}, 'b': set()},
+        ['a', 'b'],
+    ),
+))
+def test_run_per_model_order(
+        dependencies,
+        expected_order,
+):
+    order = []
+
+    def func(label):
+        order.append(label)
+        return label.upper()
+
+    results = list(run_per_model(
+        func,
+        list(dependencies),
+        dependencies,
+        jobs=1,
+    ))
+
+    assert order == expected_order
+    assert results == [(label, label.upper()) for label in expected_order]
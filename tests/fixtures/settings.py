@@ -3,6 +3,9 @@ Fixtures that override settings params
 """
 
 import pytest
+from django.core.cache import (
+    caches,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -12,8 +15,22 @@ def setup_test_settings(
 ):
     settings.DEBUG = True
     settings.WAIT_DB_TIMEOUT = wait_db_timeout
+    # тесты идут в одном процессе, поэтому кэша в его
+    # памяти достаточно
+    settings.ROWS_CACHE_TIMEOUT = 3600
 
 
 @pytest.fixture(params=[1])
 def wait_db_timeout(request):
     return request.param
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # кэш в памяти процесса переживает тесты, а
+    # идентификаторы пользователей в них повторяются
+    for cache in caches.all():
+        cache.clear()
+    yield
+    for cache in caches.all():
+        cache.clear()
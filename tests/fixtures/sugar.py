@@ -1,3 +1,4 @@
+import json
 from datetime import (
     date,
     datetime,
@@ -14,6 +15,10 @@ import pytz
 from django.conf import (
     settings,
 )
+from django.contrib.auth.models import (
+    Group,
+    Permission,
+)
 
 from sugar.models import (
     Comment,
@@ -245,3 +250,59 @@ def create_record(
         return record
 
     return _create_record
+
+
+@pytest.fixture
+def diary(
+        admin,
+        create_record,
+        create_user,
+):
+    """
+    Дневник для выгрузок: права группы и пользователя
+    (связи многие-ко-многим), запись со всеми вложениями.
+    """
+    group = Group.objects.create(name='Пациенты')
+    group.permissions.set(Permission.objects.filter(
+        codename__in=('view_record', 'add_record'),
+    ))
+    user = create_user(username='user')
+    user.groups.add(group)
+    user.user_permissions.set(Permission.objects.filter(
+        codename='view_meal',
+    ))
+
+    create_record(
+        metering_params=dict(sugar_level=Decimal('5.5')),
+        meal_params_list=[dict(
+            food_quantity=Decimal('2.5'),
+            description='Каша',
+        )],
+        injection_params_list=[dict(insulin_quantity=4)],
+        comments_params_list=[dict(content='Комментарий')],
+    )
+
+
+@pytest.fixture
+def get_rows(
+        admin,
+        create_client,
+):
+    client = create_client(
+        authenticated_with=admin,
+    )
+
+    def _get_rows(
+            expected_status_code=200,
+            url='/sugar/rows.json',
+            **data,
+    ):
+        response = client.post(url, data=data)
+        assert response.status_code == expected_status_code
+        if expected_status_code != 200:
+            return response
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return json.loads(response.content)
+
+    return _get_rows
@@ -0,0 +1,119 @@
+import random
+from itertools import (
+    chain,
+)
+
+import pytest
+
+from core import helpers as core_helpers
+from sugar.helpers import (
+    SugarGroupStats,
+    iter_groupped_sugar_stats,
+)
+
+DAY = 24 * 60 * 60
+
+
+def get_reference_stats(meterings, periods):
+    # Прежний алгоритм: интерполяция во всех точках
+    # разом и нарезка получившихся массивов по группам
+    stored_moments, stored_values = zip(*meterings)
+    ext_moments = sorted(set(chain(
+        stored_moments,
+        chain.from_iterable(periods),
+    )))[:-1]
+    ext_values = core_helpers.numpy_interp(
+        ext_moments,
+        stored_moments,
+        stored_values,
+    )
+    ext_arrays_length = len(ext_moments)
+
+    result = []
+    ext_start = 0
+    for start_period, stop_period in periods:
+        records_group_len = sum(
+            1
+            for moment in stored_moments
+            if start_period <= moment < stop_period
+        )
+        if not records_group_len:
+            result.append(None)
+            continue
+
+        while (ext_start < ext_arrays_length
+                and ext_moments[ext_start] < start_period):
+            ext_start += 1
+
+        ext_stop = ext_start + records_group_len
+        while (ext_stop < ext_arrays_length
+                and ext_moments[ext_stop] < stop_period):
+            ext_stop += 1
+
+        if ext_stop >= ext_arrays_length:
+            stop_period = ext_moments[-1]
+
+        ext_values_slice = ext_values[ext_start:ext_stop+1]
+        integrated_value = core_helpers.scipy_integrate_trapz(
+            ext_values_slice,
+            ext_moments[ext_start:ext_stop+1],
+        )
+        result.append(SugarGroupStats(
+            average=integrated_value / (stop_period - start_period),
+            min_value=min(ext_values_slice),
+            max_value=max(ext_values_slice),
+            meterings_count=records_group_len,
+        ))
+        ext_start = ext_stop
+
+    return result
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_reference(seed):
+    generator = random.Random(seed)
+    first_moment = 1620590400  # 2021-05-10 00:00 (UTC+3)
+    periods = [
+        (first_moment + day * DAY, first_moment + (day + 1) * DAY)
+        for day in range(generator.randint(1, 10))
+    ]
+    moments = set()
+    # измерения до и после страницы
+    if generator.random() < 0.5:
+        moments.add(first_moment - generator.randint(1, 3 * DAY))
+    if generator.random() < 0.5:
+        moments.add(periods[-1][1] + generator.randint(0, 3 * DAY))
+    for start_period, _ in periods:
+        if generator.random() < 0.2:
+            # сутки без измерений
+            continue
+        moments.add(start_period)
+        for _ in range(generator.randint(0, 6)):
+            moments.add(start_period + generator.randint(0, DAY - 1))
+    if len(moments) < 2:
+        moments.update((first_moment + 100, first_moment + 200))
+
+    meterings = [
+        (moment, generator.randint(30, 150) / 10)
+        for moment in sorted(moments)
+    ]
+
+    assert list(iter_groupped_sugar_stats(
+        meterings,
+        periods,
+    )) == get_reference_stats(meterings, periods)
+
+
+def test_single_metering():
+    assert list(iter_groupped_sugar_stats(
+        [(150, 5.5)],
+        [(0, 100), (100, 200)],
+    )) == [
+        None,
+        SugarGroupStats(
+            average=5.5,
+            min_value=5.5,
+            max_value=5.5,
+            meterings_count=1,
+        ),
+    ]
@@ -1,6 +1,12 @@
+import io
 import os.path
+from concurrent.futures import (
+    Executor,
+    Future,
+)
 from datetime import (
     date,
+    datetime,
 )
 from decimal import (
     Decimal,
@@ -10,12 +16,24 @@ from unittest.mock import (
 )
 
 import pytest
-from django.core.management import call_command
+from django.core.management import (
+    call_command,
+    load_command_class,
+)
 
+from core.changelog import (
+    clear_changes,
+    get_changes,
+    get_last_entry_id,
+)
 from sugar.models import (
     Record,
     SugarMetering,
 )
+from tests.sugar.test_rows_view import (
+    get_index_state,
+    get_summaries_state,
+)
 
 
 @pytest.fixture
@@ -63,12 +81,14 @@ def expired_pack(
     )
 
 
+@pytest.mark.parametrize('chunk_size', (1, 5000))
 @pytest.mark.parametrize('expired_pack_', (
     None,
     pytest.lazy_fixture('expired_pack'),  # noqa
 ))
 def test_success(
         admin,
+        chunk_size,
         create_datetime,
         create_test_strip_pack,
         csv_file,
@@ -76,11 +96,15 @@ def test_success(
         model_to_dict,
         pack,
 ):
+    stdout = io.StringIO()
     call_command(
         'import-sugar-csv',
         username=admin.username,
         csv_file_path=csv_file,
+        chunk_size=chunk_size,
+        stdout=stdout,
     )
+    assert stdout.getvalue().startswith('2 rows are imported in ')
 
     records = tuple(map(
         model_to_dict,
@@ -206,20 +230,486 @@ def test_fail_if_many_packs(
         ),
     ),
 )
+@pytest.mark.parametrize('chunk_size', (1, 5000))
 def test_wrong_data(
         admin,
+        chunk_size,
         csv_file,
         csv_file_name,
         expected_error,
         pack,
 ):
+    # при порциях по одной строке первая строка уже
+    # записана, но импорт откатывается целиком
     with pytest.raises(ValueError) as exc_info:
         call_command(
             'import-sugar-csv',
             username=admin.username,
             csv_file_path=csv_file,
+            chunk_size=chunk_size,
         )
 
     assert str(exc_info.value) == expected_error
     assert tuple(Record.objects.all()) == ()
     assert tuple(SugarMetering.objects.all()) == ()
+
+
+def test_foreign_records_are_ignored(
+        admin,
+        create_datetime,
+        create_record,
+        create_user,
+        csv_file,
+        pack,
+):
+    # у другого пользователя есть запись в тот же момент,
+    # что и строка файла
+    create_record(
+        whose=create_user(username='another'),
+        when=create_datetime('2021-09-15T23:03:00'),
+    )
+
+    call_command(
+        'import-sugar-csv',
+        username=admin.username,
+        csv_file_path=csv_file,
+    )
+
+    assert list(SugarMetering.objects.order_by(
+        'record__when',
+    ).values_list(
+        'record__who',
+        'sugar_level',
+    )) == [
+        (admin.pk, Decimal('5.0')),
+        (admin.pk, Decimal('4.7')),
+    ]
+
+
+def import_csv(username, csv_file_path, **kwargs):
+    stdout = io.StringIO()
+    call_command(
+        'import-sugar-csv',
+        username=username,
+        csv_file_path=csv_file_path,
+        stdout=stdout,
+        **kwargs,
+    )
+    return stdout.getvalue()
+
+
+def get_sugar_levels():
+    return list(SugarMetering.objects.order_by(
+        'record__when',
+    ).values_list(
+        'sugar_level',
+        flat=True,
+    ))
+
+
+@pytest.mark.parametrize('chunk_size', (1, 5000))
+def test_reimport_fails(
+        admin,
+        chunk_size,
+        csv_file,
+        pack,
+):
+    import_csv(admin.username, csv_file)
+
+    with pytest.raises(ValueError) as exc_info:
+        import_csv(
+            admin.username,
+            csv_file.replace('correct.csv', 'updated.csv'),
+            chunk_size=chunk_size,
+        )
+
+    assert str(exc_info.value).startswith('Record at 2021-09-15T03:03:00')
+    assert get_sugar_levels() == [Decimal('5.0'), Decimal('4.7')]
+
+
+@pytest.mark.parametrize(
+    ('on_conflict', 'expected_sugar_levels', 'expected_stats'),
+    (
+        (
+            'skip',
+            [Decimal('5.0'), Decimal('4.7'), Decimal('7.2')],
+            '1 created, 0 updated, 2 skipped',
+        ),
+        (
+            'update',
+            [Decimal('5.0'), Decimal('6.1'), Decimal('7.2')],
+            '1 created, 1 updated, 1 skipped',
+        ),
+    ),
+)
+@pytest.mark.parametrize('chunk_size', (1, 5000))
+def test_reimport(
+        admin,
+        chunk_size,
+        csv_file,
+        expected_stats,
+        expected_sugar_levels,
+        on_conflict,
+        pack,
+):
+    import_csv(admin.username, csv_file)
+
+    output = import_csv(
+        admin.username,
+        csv_file.replace('correct.csv', 'updated.csv'),
+        chunk_size=chunk_size,
+        on_conflict=on_conflict,
+    )
+
+    assert output.strip().endswith(expected_stats)
+    assert get_sugar_levels() == expected_sugar_levels
+    assert Record.objects.count() == 3
+
+    # индекс страниц и сводки обновлены точечно
+    index_state = get_index_state()
+    summaries_state = get_summaries_state()
+    call_command('rebuild-time-label-index')
+    call_command('rebuild-daily-summaries')
+    assert get_index_state() == index_state
+    assert get_summaries_state() == summaries_state
+
+
+@pytest.mark.parametrize(
+    ('csv_file_name', 'on_conflict', 'expected_sugar_levels'),
+    (
+        ('duplicates.csv', 'skip', [Decimal('5.0')]),
+        ('duplicates.csv', 'update', [Decimal('5.5')]),
+    ),
+)
+@pytest.mark.parametrize('chunk_size', (1, 5000))
+def test_duplicates_in_file(
+        admin,
+        chunk_size,
+        csv_file,
+        csv_file_name,
+        expected_sugar_levels,
+        on_conflict,
+        pack,
+):
+    # с порциями по одной строке повтор попадает в
+    # другую порцию, но обрабатывается так же
+    import_csv(
+        admin.username,
+        csv_file,
+        on_conflict=on_conflict,
+        chunk_size=chunk_size,
+    )
+
+    assert get_sugar_levels() == expected_sugar_levels
+
+
+@pytest.mark.parametrize('chunk_size', (1, 5000))
+@pytest.mark.parametrize('csv_file_name', ('duplicates.csv',))
+def test_duplicates_in_file_fail(
+        admin,
+        chunk_size,
+        csv_file,
+        csv_file_name,
+        pack,
+):
+    with pytest.raises(ValueError) as exc_info:
+        import_csv(admin.username, csv_file, chunk_size=chunk_size)
+
+    assert str(exc_info.value).startswith('Duplicate moment 2021-09-15T03:03:00')
+    assert get_sugar_levels() == []
+
+
+@pytest.fixture
+def csv_directory(
+        csv_file,
+        tmp_path,
+):
+    # файлы выгрузок по пользователям: <username>.csv
+    correct_csv = open(csv_file, encoding='utf-8').read()
+    (tmp_path / 'admin.csv').write_text(correct_csv, encoding='utf-8')
+    (tmp_path / 'another.csv').write_text(
+        correct_csv.replace('2021-09-15', '2021-09-16'),
+        encoding='utf-8',
+    )
+    (tmp_path / 'notes.txt').write_text('not a csv', encoding='utf-8')
+    return tmp_path
+
+
+@pytest.fixture
+def another_pack(
+        create_test_strip_pack,
+        create_user,
+):
+    return create_test_strip_pack(
+        whose=create_user(username='another'),
+        volume=50,
+        opening=date(2021, 9, 10),
+        expiry_plan=date(2021, 9, 20),
+    )
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+@pytest.mark.parametrize('path_template', ('{}', '{}/*.csv'))
+def test_many_files(
+        admin,
+        another_pack,
+        csv_directory,
+        jobs,
+        pack,
+        path_template,
+):
+    output = import_csv(
+        None,
+        path_template.format(csv_directory),
+        jobs=jobs,
+    )
+
+    lines = output.strip().splitlines()
+    assert [line.split(': ')[0] for line in lines] == [
+        str(csv_directory / 'admin.csv'),
+        str(csv_directory / 'another.csv'),
+        'Total',
+    ]
+    assert lines[-1].startswith('Total: 2 files, 4 rows are imported in ')
+    assert lines[-1].endswith('4 created, 0 updated, 0 skipped')
+    assert list(Record.objects.order_by('when').values_list(
+        'who__username',
+        'when__day',
+    )) == [
+        ('admin', 15),
+        ('admin', 15),
+        ('another', 16),
+        ('another', 16),
+    ]
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_many_files_with_error(
+        admin,
+        csv_directory,
+        jobs,
+        pack,
+):
+    # пользователя another нет
+    stderr = io.StringIO()
+    with pytest.raises(ValueError) as exc_info:
+        call_command(
+            'import-sugar-csv',
+            csv_file_path=str(csv_directory),
+            jobs=jobs,
+            stderr=stderr,
+            stdout=io.StringIO(),
+        )
+
+    assert str(exc_info.value) == (
+        f'1 of 2 files are not imported: {csv_directory / "another.csv"}'
+    )
+    assert stderr.getvalue().strip().endswith(
+        'There is no user \'another\'',
+    )
+    assert Record.objects.filter(who=admin).count() == 2
+
+
+def test_no_csv_files(
+        admin,
+        tmp_path,
+):
+    with pytest.raises(ValueError) as exc_info:
+        import_csv(admin.username, str(tmp_path))
+
+    assert str(exc_info.value) == f'There are no csv-files at {str(tmp_path)!r}'
+
+
+def test_rows_parsing(
+        tmp_path,
+        tz,
+):
+    # сутки с переходами на летнее время и обратно
+    # (Europe/Volgograd до 2011 года) и обычные сутки
+    moments = [
+        datetime(2010, 3, 28, hour, minute)
+        for hour in range(24)
+        for minute in (0, 30)
+    ] + [
+        datetime(2010, 10, 31, hour, minute)
+        for hour in range(24)
+        for minute in (0, 30)
+    ] + [
+        datetime(2021, 9, 15, 3, 3),
+        datetime(2021, 9, 15, 23, 3),
+    ]
+    csv_file_path = tmp_path / 'rows.csv'
+    csv_file_path.write_text(''.join(
+        f'{when:%Y-%m-%d};{when.hour}:{when.minute};5.{idx % 10}\n'
+        for idx, when in enumerate(moments)
+    ))
+
+    command = load_command_class('sugar', 'import-sugar-csv')
+    rows = list(command.iter_rows(str(csv_file_path)))
+
+    assert [
+        (when, when.utcoffset())
+        for when, _ in rows
+    ] == [
+        (tz.localize(when), tz.localize(when).utcoffset())
+        for when in moments
+    ]
+    assert [sugar_level for _, sugar_level in rows] == [
+        Decimal(f'5.{idx % 10}')
+        for idx in range(len(moments))
+    ]
+
+
+class InlineExecutor(Executor):
+    """
+    Выполняет задачи сразу, в этом же процессе, и считает
+    их.
+    """
+
+    def __init__(self):
+        self.submitted_count = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted_count += 1
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+
+def test_parsed_rows_are_read_ahead_by_jobs(
+        tmp_path,
+):
+    csv_file_path = tmp_path / 'rows.csv'
+    csv_file_path.write_text(''.join(
+        f'2021-09-15;3:{minute};5.{minute}\n'
+        for minute in range(10)
+    ))
+    command = load_command_class('sugar', 'import-sugar-csv')
+    executor = InlineExecutor()
+
+    rows = []
+    submitted_counts = []
+    for row in command.iter_parsed_rows(
+            executor,
+            str(csv_file_path),
+            chunk_size=2,
+            jobs=2,
+    ):
+        rows.append(row)
+        submitted_counts.append(executor.submitted_count)
+
+    assert rows == list(command.iter_rows(str(csv_file_path)))
+    # в разборе не больше двух порций, кроме возвращаемой
+    assert submitted_counts == [3, 3, 4, 4, 5, 5, 5, 5, 5, 5]
+
+
+def test_parsed_rows_with_quoted_newlines(
+        tmp_path,
+        tz,
+):
+    # порции -- строки `csv.reader`, а не строки файла
+    csv_file_path = tmp_path / 'rows.csv'
+    csv_file_path.write_text(
+        '2021-09-15;3:3;5.1;"first\nsecond"\n'
+        '2021-09-15;3:4;5.2\n',
+    )
+    command = load_command_class('sugar', 'import-sugar-csv')
+
+    rows = list(command.iter_parsed_rows(
+        InlineExecutor(),
+        str(csv_file_path),
+        chunk_size=1,
+        jobs=1,
+    ))
+
+    assert rows == list(command.iter_rows(str(csv_file_path))) == [
+        (tz.localize(datetime(2021, 9, 15, 3, 3)), Decimal('5.1')),
+        (tz.localize(datetime(2021, 9, 15, 3, 4)), Decimal('5.2')),
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', (None, 1))
+@pytest.mark.parametrize(
+    ('csv_content', 'expected_error'),
+    (
+        ('2021-02-30;3:3;5\n', 'day is out of range for month'),
+        ('2021-13-01;3:3;5\n', 'month must be in 1..12'),
+        ('2021-09-15;25:3;5\n', 'hour must be in 0..23'),
+        ('2021-13-01;3-3;5\n', "Incorrect time value '3-3' in line 1"),
+        ('2021-09-15;3:3;5\n2021-09-15;3:3;55.55\n', "Incorrect sugar_level value '55.55' in line 2"),  # noqa
+        # значение в кавычках на двух строках файла
+        ('2021-09-15;3:3;5;"a\nb"\n2021-09-15;3:4;x\n', "Incorrect sugar_level value 'x' in line 3"),  # noqa
+    ),
+)
+def test_rows_parsing_errors(
+        chunk_size,
+        csv_content,
+        expected_error,
+        tmp_path,
+):
+    csv_file_path = tmp_path / 'rows.csv'
+    csv_file_path.write_text(csv_content)
+
+    command = load_command_class('sugar', 'import-sugar-csv')
+    if chunk_size is None:
+        rows = command.iter_rows(str(csv_file_path))
+    else:
+        # номера строк считаются от начала файла, а не порции
+        rows = command.iter_parsed_rows(
+            InlineExecutor(),
+            str(csv_file_path),
+            chunk_size=chunk_size,
+            jobs=1,
+        )
+    with pytest.raises(ValueError) as exc_info:
+        list(rows)
+
+    assert str(exc_info.value) == expected_error
+
+
+def test_changes_are_logged(
+        admin,
+        csv_file,
+        pack,
+):
+    clear_changes()
+
+    import_csv(admin.username, csv_file, chunk_size=1)
+
+    changes = get_changes(get_last_entry_id())
+    assert changes == {
+        'sugar.record': set(map(str, Record.objects.values_list('pk', flat=True))),  # noqa
+        'sugar.sugarmetering': set(map(str, SugarMetering.objects.values_list('pk', flat=True))),  # noqa
+    }
+    assert len(changes['sugar.record']) == 2
+
+
+def test_only_new_meterings_are_logged(
+        admin,
+        create_datetime,
+        create_record,
+        csv_file,
+        pack,
+):
+    # измерение внутри промежутка времени порции
+    old_record = create_record(
+        when=create_datetime('2021-09-15T12:00:00'),
+        metering_params={'sugar_level': Decimal('6.1'), 'pack': pack},
+    )
+    clear_changes()
+
+    import_csv(admin.username, csv_file)
+
+    changes = get_changes(get_last_entry_id())
+    assert changes == {
+        'sugar.record': set(map(str, Record.objects.exclude(
+            pk=old_record.pk,
+        ).values_list('pk', flat=True))),
+        'sugar.sugarmetering': set(map(str, SugarMetering.objects.exclude(
+            record=old_record,
+        ).values_list('pk', flat=True))),
+    }
+    assert len(changes['sugar.sugarmetering']) == 2
@@ -1,15 +1,22 @@
 from datetime import (
     date,
     datetime,
+    timedelta,
 )
 from decimal import (
     Decimal,
 )
 
 import pytest
+from django.db import (
+    connection,
+)
 from django.db.utils import (
     IntegrityError,
 )
+from django.test.utils import (
+    CaptureQueriesContext,
+)
 from lxml import (
     etree,
 )
@@ -760,6 +767,55 @@ def test_multiple_injections_change_view(
     ]
 
 
+def test_records_list_queries_count(
+        create_client,
+        create_datetime,
+        create_record,
+        admin,
+):
+    client = create_client(
+        authenticated_with=admin,
+    )
+    first_moment = create_datetime('2021-05-16T10:00:00')
+
+    def create_records(start, stop):
+        for idx in range(start, stop):
+            create_record(
+                whose=admin,
+                when=first_moment + timedelta(hours=idx),
+                metering_params={
+                    'sugar_level': Decimal('4.8'),
+                },
+                meal_params_list=(
+                    {
+                        'food_quantity': Decimal('2.0'),
+                    },
+                ) * 2,
+                injection_params_list=(
+                    {
+                        'insulin_quantity': 4,
+                    },
+                ) * 2,
+                comments_params_list=(
+                    {
+                        'content': 'Foo',
+                    },
+                ),
+            )
+
+    def get_queries_count():
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/admin/sugar/record/')
+        assert response.status_code == 200
+        return len(context.captured_queries)
+
+    create_records(0, 2)
+    few_records_queries_count = get_queries_count()
+
+    create_records(2, 20)
+    assert get_queries_count() == few_records_queries_count
+
+
 def test_multiple_comments(
         create_client,
         create_record,
@@ -955,6 +1011,68 @@ def test_actuality_for_new(
     ]
 
 
+def test_foreign_medications_are_not_offered(
+        create_client,
+        create_insulin_syringe,
+        create_test_strip_pack,
+        create_user,
+        admin,
+):
+    another = create_user(username='another')
+    for whose, day in ((admin, 1), (another, 10)):
+        create_test_strip_pack(
+            whose=whose,
+            volume=50,
+            opening=date(
+                year=2021,
+                month=5,
+                day=day,
+            ),
+            expiry_plan=date(
+                year=2021,
+                month=6,
+                day=1,
+            ),
+        )
+        create_insulin_syringe(
+            whose=whose,
+            volume=300,
+            opening=date(
+                year=2021,
+                month=5,
+                day=day,
+            ),
+            expiry_plan=date(
+                year=2021,
+                month=6,
+                day=1,
+            ),
+        )
+
+    client = create_client(
+        authenticated_with=admin,
+    )
+
+    response = client.get('/admin/sugar/record/add/')
+    assert response.status_code == 200
+
+    etree_html_parser = etree.HTMLParser()
+    tree = etree.XML(
+        text=response.content.decode('utf-8'),
+        parser=etree_html_parser,
+    )
+
+    select_pack_search = '//select[@name="sugarmetering-0-pack"]/option/text()'
+    assert tree.xpath(select_pack_search)[1:] == [
+        'Пачка тест-полосок от 2021-05-01',
+    ]
+
+    select_syringe_search = '//select[@name="insulininjection_set-0-insulin_syringe"]/option/text()'  # noqa
+    assert tree.xpath(select_syringe_search)[1:] == [
+        'Шприц "Aspart" (300 ед.) от 2021-05-01',
+    ]
+
+
 def test_actuality_for_edit(
         create_client,
         create_datetime,
@@ -0,0 +1,88 @@
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+import pytz
+
+from sugar.helpers import (
+    RecordBatch,
+)
+
+
+def create_batch():
+    # 5 записей в 2 группах, по убыванию времени
+    first_moment = datetime(2021, 5, 10, 8, tzinfo=pytz.utc)
+    records = [
+        (
+            record_id,
+            first_moment + timedelta(hours=hours),
+            first_moment + timedelta(hours=hours),
+            first_moment + timedelta(days=hours // 24),
+        )
+        for record_id, hours in (
+            (15, 30),
+            (14, 26),
+            (13, 10),
+            (12, 5),
+            (11, 0),
+        )
+    ]
+    return RecordBatch(records)
+
+
+def test_groups():
+    batch = create_batch()
+
+    assert list(batch.ids) == [15, 14, 13, 12, 11]
+    assert list(batch.group_offsets) == [0, 2, 5]
+    assert len(batch.time_labels) == 2
+    assert batch.first_when < batch.last_when
+
+
+def test_records_attachments():
+    batch = create_batch()
+    batch.set_attachments(
+        'meals',
+        [batch.get_position(record_id) for record_id in (11, 15, 11, 13)],
+        {
+            'food_quantity': [1, 2, 3, 4],
+        },
+    )
+
+    assert list(batch.iter_groups_values('meals', 'food_quantity')) == [
+        [(2,)],
+        [(4,), (1,), (3,)],
+    ]
+    assert list(batch.iter_chronological_values('meals', 'food_quantity')) == [
+        (batch.timestamps[4], 1),
+        (batch.timestamps[4], 3),
+        (batch.timestamps[2], 4),
+        (batch.timestamps[0], 2),
+    ]
+
+
+def test_groups_attachments():
+    batch = create_batch()
+    batch.set_attachments(
+        'injections',
+        [1, 1],
+        {
+            'insulin_syringe__insulin_mark': [3, 4],
+            'insulin_quantity': [5, 6],
+        },
+        per_group=True,
+    )
+
+    assert list(batch.iter_groups_values(
+        'injections',
+        'insulin_quantity',
+        'insulin_syringe__insulin_mark',
+    )) == [
+        [],
+        [(5, 3), (6, 4)],
+    ]
+    assert list(batch.iter_groups_values('meals', 'food_quantity')) == [
+        [],
+        [],
+    ]
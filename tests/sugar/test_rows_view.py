@@ -0,0 +1,850 @@
+from datetime import (
+    date,
+    timedelta,
+)
+from decimal import (
+    Decimal,
+)
+
+import pytest
+from django.core.management import (
+    call_command,
+)
+from django.db import (
+    connection,
+)
+from django.test.utils import (
+    CaptureQueriesContext,
+)
+
+from sugar import (
+    views,
+)
+from sugar.models import (
+    DailyInsulinSummary,
+    DailySugarSummary,
+    Record,
+    SugarMetering,
+    TimeLabelGroup,
+)
+
+
+@pytest.fixture
+def rows_diary(
+        admin,
+        create_datetime,
+        create_record,
+):
+    # 4 дня по 3 записи; у последней записи каждого дня
+    # нет измерения сахара
+    first_moment = create_datetime('2021-05-10T08:00:00')
+    for day in range(4):
+        for idx, hours in enumerate((0, 5, 12)):
+            when = first_moment + timedelta(days=day, hours=hours)
+            metering_params = None
+            if idx < 2:
+                metering_params = {
+                    'sugar_level': Decimal(f'{5 + day}.{3 * idx}'),
+                }
+            create_record(
+                whose=admin,
+                when=when,
+                metering_params=metering_params,
+                meal_params_list=(
+                    {
+                        'food_quantity': Decimal('1.5'),
+                    },
+                ) * idx,
+                injection_params_list=(
+                    {
+                        'insulin_quantity': 2 + day,
+                    },
+                ) if idx == 0 else (),
+            )
+
+
+def get_time_labels(response_data):
+    return [
+        row['time_label']
+        for row in response_data['rows']
+    ]
+
+
+def test_page_number_pagination(
+        rows_diary,
+        get_rows,
+):
+    response_data = get_rows(
+        groupping='none',
+        page_number=2,
+    )
+
+    assert get_time_labels(response_data) == [
+        '2021-05-10 13:00',
+        '2021-05-10 08:00',
+    ]
+    assert response_data['total_rows_count'] == 12
+    assert response_data['total_pages_count'] == 2
+    assert response_data['page_number'] == 2
+    assert response_data['first_shown'] == 11
+    assert response_data['last_shown'] == 12
+
+
+def test_last_page(
+        rows_diary,
+        get_rows,
+):
+    response_data = get_rows(
+        groupping='none',
+        page_number=-1,
+    )
+
+    assert get_time_labels(response_data) == [
+        '2021-05-10 13:00',
+        '2021-05-10 08:00',
+    ]
+    assert response_data['page_number'] == 2
+
+
+def test_page_size(
+        rows_diary,
+        get_rows,
+):
+    response_data = get_rows(
+        groupping='none',
+        page_number=2,
+        page_size=5,
+    )
+
+    assert get_time_labels(response_data) == [
+        '2021-05-12 08:00',
+        '2021-05-11 20:00',
+        '2021-05-11 13:00',
+        '2021-05-11 08:00',
+        '2021-05-10 20:00',
+    ]
+    assert response_data['total_pages_count'] == 3
+
+
+@pytest.mark.parametrize(
+    'page_size',
+    ('0', '10001', 'many'),
+)
+def test_wrong_page_size(
+        rows_diary,
+        get_rows,
+        page_size,
+):
+    get_rows(
+        expected_status_code=400,
+        groupping='none',
+        page_size=page_size,
+    )
+
+
+@pytest.fixture
+def streaming_diary(
+        rows_diary,
+        admin,
+        create_datetime,
+        create_record,
+        create_insulin_kind,
+        create_insulin_syringe,
+):
+    # по записи в месяц за год до `rows_diary`; инсулин
+    # второго вида есть только в самой ранней записи, то
+    # есть в последней порции строк страницы
+    glargine_syringe = create_insulin_syringe(
+        whose=admin,
+        volume=300,
+        opening=date(2020, 1, 1),
+        expiry_plan=date(2020, 2, 1),
+        insulin_mark=create_insulin_kind(name='Glargine'),
+    )
+    for month in range(1, 13):
+        injection_params = {
+            'insulin_quantity': month,
+        }
+        if month == 1:
+            injection_params['insulin_syringe'] = glargine_syringe
+        create_record(
+            whose=admin,
+            when=create_datetime(f'2020-{month:02}-15T09:00:00'),
+            metering_params={
+                'sugar_level': Decimal(f'{4 + month % 3}.5'),
+            },
+            injection_params_list=(
+                injection_params,
+            ),
+        )
+
+
+@pytest.mark.parametrize(
+    'groupping',
+    ('none', 'day', 'week', 'month', 'year'),
+)
+@pytest.mark.parametrize(
+    'page_params',
+    (
+        dict(page_number=1),
+        dict(page_number=-1),
+        dict(cursor=''),
+    ),
+)
+def test_streaming_response(
+        streaming_diary,
+        get_rows,
+        groupping,
+        page_params,
+        monkeypatch,
+        settings,
+):
+    # иначе второй запрос отдал бы закэшированный ответ
+    settings.ROWS_CACHE_TIMEOUT = 0
+
+    expected_data = get_rows(
+        groupping=groupping,
+        page_size=5,
+        **page_params,
+    )
+
+    monkeypatch.setattr(views, 'STREAMING_PAGE_SIZE', 5)
+    monkeypatch.setattr(views, 'STREAMING_CHUNK_ROWS', 2)
+    assert get_rows(
+        groupping=groupping,
+        page_size=5,
+        **page_params,
+    ) == expected_data
+
+
+def test_streaming_response_builds_rows_by_chunks(
+        streaming_diary,
+        get_rows,
+        monkeypatch,
+        settings,
+):
+    settings.ROWS_CACHE_TIMEOUT = 0
+    monkeypatch.setattr(views, 'STREAMING_PAGE_SIZE', 5)
+    monkeypatch.setattr(views, 'STREAMING_CHUNK_ROWS', 2)
+
+    batches_sizes = []
+    get_rows_ = views._get_rows
+
+    def _get_rows(batch, *args, **kwargs):
+        batches_sizes.append(len(batch.time_labels))
+        return get_rows_(batch, *args, **kwargs)
+
+    monkeypatch.setattr(views, '_get_rows', _get_rows)
+    response_data = get_rows(
+        groupping='none',
+        page_size=5,
+        page_number=-1,
+    )
+    # на последней странице 4 строки из 24
+    assert batches_sizes == [2, 2]
+    # строки без инсулина второго вида получают '-'
+    glargine_column, = (
+        column
+        for column in response_data['columns']
+        if column['header'] == 'Glargine'
+    )
+    assert [
+        row[glargine_column['data_index']]
+        for row in response_data['rows']
+    ] == ['-'] * 3 + [1]
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize(
+    ('groupping', 'page_params'),
+    (
+        ('none', dict(page_number=2)),
+        ('day', dict(cursor='')),
+        ('week', dict(page_number=1)),
+    ),
+)
+def test_async_rows_view(
+        rows_diary,
+        get_rows,
+        groupping,
+        page_params,
+        settings,
+):
+    # запросы прикреплений выполняются в других потоках,
+    # которым нужны закоммиченные данные
+    settings.ROWS_CACHE_TIMEOUT = 0
+
+    assert get_rows(
+        url='/sugar/rows-async.json',
+        groupping=groupping,
+        **page_params,
+    ) == get_rows(
+        groupping=groupping,
+        **page_params,
+    )
+
+
+def test_async_rows_view_requires_login(
+        create_client,
+):
+    response = create_client().post(
+        '/sugar/rows-async.json',
+        data=dict(groupping='day'),
+    )
+    assert response.status_code == 302
+
+
+@pytest.mark.parametrize(
+    'page_size',
+    (5, 1000),
+)
+def test_columnar_format(
+        rows_diary,
+        get_rows,
+        page_size,
+):
+    rows_data = get_rows(
+        groupping='none',
+        page_size=page_size,
+    )
+    columnar_data = get_rows(
+        groupping='none',
+        page_size=page_size,
+        format='columnar',
+    )
+
+    columns = rows_data.pop('columns')
+    assert columnar_data.pop('columns') == columns
+    data_indices = [
+        column['data_index']
+        for column in columns
+    ]
+    assert [
+        dict(zip(data_indices, row_values))
+        for row_values in zip(*columnar_data.pop('values'))
+    ] == rows_data.pop('rows')
+    assert columnar_data == rows_data
+
+
+def test_wrong_format(
+        rows_diary,
+        get_rows,
+):
+    get_rows(
+        expected_status_code=400,
+        groupping='none',
+        format='xml',
+    )
+
+
+def get_index_state():
+    return list(TimeLabelGroup.objects.order_by(
+        'who',
+        'groupping',
+        'position',
+    ).values_list(
+        'who',
+        'groupping',
+        'time_label',
+        'position',
+        'records_count',
+        'min_when',
+        'max_when',
+    ))
+
+
+def test_page_index_follows_changes(
+        admin,
+        create_datetime,
+        create_record,
+        rows_diary,
+        get_rows,
+):
+    Record.objects.filter(
+        when__lt=create_datetime('2021-05-11T00:00:00'),
+    ).delete()
+    create_record(
+        whose=admin,
+        when=create_datetime('2021-05-09T10:00:00'),
+    )
+    create_record(
+        whose=admin,
+        when=create_datetime('2021-05-20T10:00:00'),
+    )
+    moved_record = Record.objects.get(
+        when=create_datetime('2021-05-12T08:00:00'),
+    )
+    moved_record.when = create_datetime('2021-05-30T08:00:00')
+    moved_record.save()
+
+    response_data = get_rows(
+        groupping='day',
+        page_number=1,
+    )
+    assert get_time_labels(response_data) == [
+        '2021-05-30',
+        '2021-05-20',
+        '2021-05-13',
+        '2021-05-12',
+        '2021-05-11',
+        '2021-05-09',
+    ]
+
+    index_state = get_index_state()
+    call_command('rebuild-time-label-index')
+    assert get_index_state() == index_state
+
+
+def test_page_index_is_built_lazily(
+        rows_diary,
+        get_rows,
+):
+    TimeLabelGroup.objects.all().delete()
+
+    response_data = get_rows(
+        groupping='week',
+        page_number=1,
+    )
+
+    assert get_time_labels(response_data) == [
+        '2021; week 19',
+    ]
+    assert response_data['total_rows_count'] == 1
+
+
+def test_cursor_pagination(
+        rows_diary,
+        get_rows,
+):
+    first_page = get_rows(
+        groupping='none',
+        cursor='',
+    )
+    assert len(first_page['rows']) == 10
+    assert first_page['next_cursor']
+    assert 'total_rows_count' not in first_page
+
+    second_page = get_rows(
+        groupping='none',
+        cursor=first_page['next_cursor'],
+    )
+    assert get_time_labels(second_page) == [
+        '2021-05-10 13:00',
+        '2021-05-10 08:00',
+    ]
+    assert second_page['next_cursor'] is None
+
+    all_labels = get_rows(
+        groupping='none',
+        page_number=1,
+    )['rows'] + get_rows(
+        groupping='none',
+        page_number=2,
+    )['rows']
+    assert first_page['rows'] + second_page['rows'] == all_labels
+
+
+def test_cursor_pagination_with_totals(
+        rows_diary,
+        get_rows,
+):
+    response_data = get_rows(
+        groupping='day',
+        cursor='',
+        with_totals='1',
+    )
+
+    assert get_time_labels(response_data) == [
+        '2021-05-13',
+        '2021-05-12',
+        '2021-05-11',
+        '2021-05-10',
+    ]
+    assert response_data['next_cursor'] is None
+    assert response_data['total_rows_count'] == 4
+    assert response_data['total_pages_count'] == 1
+
+
+def test_cursor_pagination_empty(
+        admin,
+        get_rows,
+):
+    response_data = get_rows(
+        groupping='day',
+        cursor='',
+    )
+
+    assert response_data['rows'] == []
+    assert response_data['next_cursor'] is None
+
+
+def test_wrong_cursor(
+        rows_diary,
+        get_rows,
+):
+    get_rows(
+        expected_status_code=400,
+        groupping='none',
+        cursor='not-a-cursor',
+    )
+
+
+def test_day_groupping(
+        rows_diary,
+        get_rows,
+):
+    response_data = get_rows(
+        groupping='day',
+        page_number=1,
+    )
+
+    insulin_data_index, = (
+        column['data_index']
+        for column in response_data['columns']
+        if column['header'] == 'Aspart'
+    )
+    assert response_data['rows'] == [
+        {
+            'time_label': '2021-05-13',
+            'sugar_level': '7.97',
+            'max_sugar': '8.3',
+            'min_sugar': '7.71',
+            'meterings_count': 2,
+            'meal': '4.5',
+            insulin_data_index: 5,
+        },
+        {
+            'time_label': '2021-05-12',
+            'sugar_level': '7.21',
+            'max_sugar': '7.71',
+            'min_sugar': '6.71',
+            'meterings_count': 2,
+            'meal': '4.5',
+            insulin_data_index: 4,
+        },
+        {
+            'time_label': '2021-05-11',
+            'sugar_level': '6.21',
+            'max_sugar': '6.71',
+            'min_sugar': '5.71',
+            'meterings_count': 2,
+            'meal': '4.5',
+            insulin_data_index: 3,
+        },
+        {
+            'time_label': '2021-05-10',
+            'sugar_level': '5.18',
+            'max_sugar': '5.71',
+            'min_sugar': '4.52',
+            'meterings_count': 2,
+            'meal': '4.5',
+            insulin_data_index: 2,
+        },
+    ]
+
+
+def test_foreign_attachments_are_ignored(
+        create_datetime,
+        create_record,
+        create_user,
+        rows_diary,
+        get_rows,
+):
+    create_record(
+        whose=create_user(username='another'),
+        when=create_datetime('2021-05-11T10:00:00'),
+        meal_params_list=(
+            {
+                'food_quantity': Decimal('9.0'),
+            },
+        ),
+    )
+
+    response_data = get_rows(
+        groupping='day',
+        cursor='',
+    )
+
+    assert [row['meal'] for row in response_data['rows']] == [
+        '4.5',
+        '4.5',
+        '4.5',
+        '4.5',
+    ]
+
+
+@pytest.mark.parametrize(
+    ('groupping', 'expected_totals'),
+    (
+        ('none', [('3.0', '-'), ('1.5', '-'), (None, 5)]),
+        ('week', [('18.0', 14)]),
+        ('year', [('18.0', 14)]),
+    ),
+)
+def test_attachments_totals(
+        rows_diary,
+        get_rows,
+        groupping,
+        expected_totals,
+):
+    response_data = get_rows(
+        groupping=groupping,
+        page_number=1,
+    )
+
+    insulin_data_index, = (
+        column['data_index']
+        for column in response_data['columns']
+        if column['header'] == 'Aspart'
+    )
+    actual_totals = [
+        (row['meal'], row[insulin_data_index])
+        for row in response_data['rows']
+    ]
+    assert actual_totals[:3] == expected_totals
+
+
+@pytest.mark.parametrize(
+    'drop_summaries',
+    (False, True),
+)
+def test_week_groupping(
+        rows_diary,
+        get_rows,
+        drop_summaries,
+):
+    if drop_summaries:
+        DailySugarSummary.objects.all().delete()
+
+    response_data = get_rows(
+        groupping='week',
+        page_number=1,
+    )
+
+    insulin_data_index, = (
+        column['data_index']
+        for column in response_data['columns']
+        if column['header'] == 'Aspart'
+    )
+    assert response_data['rows'] == [
+        {
+            'time_label': '2021; week 19',
+            'sugar_level': '6.47',
+            'max_sugar': '8.3',
+            'min_sugar': '4.52',
+            'meterings_count': 8,
+            'meal': '18.0',
+            insulin_data_index: 14,
+        },
+    ]
+
+
+
+@pytest.mark.parametrize(
+    ('groupping', 'time_label', 'sugar_level', 'min_sugar'),
+    (
+        ('month', '2021-05', '0.42', '-8.44'),
+        ('year', '2021', '-85.83', '-181.24'),
+    ),
+)
+def test_summaries_are_extrapolated(
+        rows_diary,
+        get_rows,
+        groupping,
+        time_label,
+        sugar_level,
+        min_sugar,
+):
+    # как и у строк без сводок, сахар вне первого и
+    # последнего измерений экстраполируется линейно
+    response_data = get_rows(
+        groupping=groupping,
+        page_number=1,
+    )
+
+    row, = response_data['rows']
+    assert row['time_label'] == time_label
+    assert row['sugar_level'] == sugar_level
+    assert row['min_sugar'] == min_sugar
+    assert row['max_sugar'] == '8.3'
+    assert row['meterings_count'] == 8
+
+def get_summaries_state():
+    return (
+        list(DailySugarSummary.objects.order_by(
+            'who',
+            'day',
+        ).values_list(
+            'who',
+            'day',
+            'meterings_count',
+            'min_sugar',
+            'max_sugar',
+            'start_sugar',
+            'end_sugar',
+            'sugar_integral',
+            'sugar_duration',
+            'total_meal',
+        )),
+        list(DailyInsulinSummary.objects.order_by(
+            'summary__who',
+            'summary__day',
+            'insulin_mark',
+        ).values_list(
+            'summary__who',
+            'summary__day',
+            'insulin_mark',
+            'total_insulin',
+        )),
+    )
+
+
+def test_daily_summaries_follow_changes(
+        create_datetime,
+        rows_diary,
+):
+    metering = SugarMetering.objects.get(
+        record__when=create_datetime('2021-05-11T13:00:00'),
+    )
+    metering.sugar_level = Decimal('9.9')
+    metering.save()
+    moved_record = Record.objects.get(
+        when=create_datetime('2021-05-12T08:00:00'),
+    )
+    moved_record.when = create_datetime('2021-05-20T08:00:00')
+    moved_record.save()
+    Record.objects.filter(
+        when__lt=create_datetime('2021-05-11T00:00:00'),
+    ).delete()
+
+    summaries_state = get_summaries_state()
+    assert [
+        (day.isoformat(), meterings_count, str(max_sugar))
+        for _, day, meterings_count, _, max_sugar, *_ in summaries_state[0]
+    ] == [
+        ('2021-05-11', 2, '9.9'),
+        ('2021-05-12', 1, '7.3'),
+        ('2021-05-13', 2, '8.3'),
+        ('2021-05-14', 0, 'None'),
+        ('2021-05-15', 0, 'None'),
+        ('2021-05-16', 0, 'None'),
+        ('2021-05-17', 0, 'None'),
+        ('2021-05-18', 0, 'None'),
+        ('2021-05-19', 0, 'None'),
+        ('2021-05-20', 1, '7.0'),
+    ]
+
+    call_command('rebuild-daily-summaries', '--days-chunk-size', '3')
+    assert get_summaries_state() == summaries_state
+
+
+def test_foreign_meterings_are_ignored(
+        create_datetime,
+        create_record,
+        create_user,
+        rows_diary,
+        get_rows,
+):
+    another = create_user(username='another')
+    for when, sugar_level in (
+            ('2021-05-10T07:00:00', '20.0'),
+            ('2021-05-14T09:00:00', '1.0'),
+    ):
+        create_record(
+            whose=another,
+            when=create_datetime(when),
+            metering_params={
+                'sugar_level': Decimal(sugar_level),
+            },
+        )
+
+    response_data = get_rows(
+        groupping='day',
+        page_number=1,
+    )
+
+    assert [
+        (row['sugar_level'], row['max_sugar'], row['min_sugar'])
+        for row in response_data['rows']
+    ] == [
+        ('7.97', '8.3', '7.71'),
+        ('7.21', '7.71', '6.71'),
+        ('6.21', '6.71', '5.71'),
+        ('5.18', '5.71', '4.52'),
+    ]
+
+
+def get_sugar_queries(queries_context):
+    return [
+        query['sql']
+        for query in queries_context.captured_queries
+        if 'sugar_' in query['sql']
+    ]
+
+
+def test_rows_are_cached(
+        create_datetime,
+        rows_diary,
+        get_rows,
+):
+    first_response = get_rows(
+        groupping='day',
+        page_number=1,
+    )
+
+    with CaptureQueriesContext(connection) as queries_context:
+        assert get_rows(
+            groupping='day',
+            page_number=1,
+        ) == first_response
+    assert get_sugar_queries(queries_context) == []
+
+    metering = SugarMetering.objects.get(
+        record__when=create_datetime('2021-05-13T13:00:00'),
+    )
+    metering.sugar_level = Decimal('9.9')
+    metering.save()
+
+    with CaptureQueriesContext(connection) as queries_context:
+        response_data = get_rows(
+            groupping='day',
+            page_number=1,
+        )
+    assert get_sugar_queries(queries_context)
+    assert response_data['rows'][0]['max_sugar'] == '9.9'
+
+
+def test_cached_rows_content_type(
+        admin,
+        create_client,
+        rows_diary,
+):
+    client = create_client(
+        authenticated_with=admin,
+    )
+    data = {'groupping': 'day', 'page_number': 1}
+
+    for url in ('/sugar/rows.json', '/sugar/rows-async.json'):
+        # промах кэша, затем попадание
+        for _ in range(2):
+            response = client.post(url, data=data)
+            assert response['Content-Type'] == 'application/json', url
+
+
+def test_rows_cache_disabled(
+        rows_diary,
+        get_rows,
+        settings,
+):
+    settings.ROWS_CACHE_TIMEOUT = 0
+    get_rows(
+        groupping='day',
+        page_number=1,
+    )
+
+    with CaptureQueriesContext(connection) as queries_context:
+        get_rows(
+            groupping='day',
+            page_number=1,
+        )
+    assert get_sugar_queries(queries_context)
@@ -0,0 +1,91 @@
+import json
+from datetime import (
+    date,
+    datetime,
+)
+from decimal import (
+    Decimal,
+)
+
+import pytest
+
+from sugar import (
+    serializers,
+)
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def serializer(request):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    return serializers.get_serializer(request.param)
+
+
+DATA = {
+    'columns': [
+        {'data_index': 'time_label', 'header': 'Дата/время'},
+    ],
+    'rows': [
+        {'time_label': '2021-05-10', 'meal': Decimal('4.50'), 'insulin_1': 3},
+        {'time_label': '2021-05-11', 'meal': None, 'insulin_1': '-'},
+        {'time_label': '2021-05-12', 'meal': Decimal('1.5'), 'insulin_1': 2},
+    ],
+    'day': date(2021, 5, 10),
+    'when': datetime(2021, 5, 10, 8, 30),
+}
+
+EXPECTED_DATA = dict(
+    DATA,
+    rows=[
+        {'time_label': '2021-05-10', 'meal': '4.50', 'insulin_1': 3},
+        {'time_label': '2021-05-11', 'meal': None, 'insulin_1': '-'},
+        {'time_label': '2021-05-12', 'meal': '1.5', 'insulin_1': 2},
+    ],
+    day='2021-05-10',
+    when='2021-05-10T08:30:00',
+)
+
+
+@pytest.mark.parametrize('pretty', (False, True))
+def test_dumps(
+        serializer,
+        pretty,
+):
+    assert json.loads(serializer.dumps(DATA, pretty=pretty)) == EXPECTED_DATA
+
+
+@pytest.mark.parametrize('chunk_size', (1, 2, 10))
+def test_iter_dumps(
+        serializer,
+        chunk_size,
+):
+    chunks = list(serializer.iter_dumps(DATA, 'rows', chunk_size))
+
+    assert json.loads(b''.join(chunks)) == EXPECTED_DATA
+
+
+def test_iter_dumps_only_list(
+        serializer,
+):
+    chunks = serializer.iter_dumps({'rows': []}, 'rows', 10)
+
+    assert json.loads(b''.join(chunks)) == {'rows': []}
+
+
+def test_unknown_type(
+        serializer,
+):
+    with pytest.raises(TypeError):
+        serializer.dumps({'value': object()})
+
+
+def test_to_columnar():
+    columns = [
+        {'data_index': 'time_label'},
+        {'data_index': 'meal'},
+    ]
+
+    assert serializers.to_columnar(DATA['rows'], columns) == [
+        ['2021-05-10', '2021-05-11', '2021-05-12'],
+        [Decimal('4.50'), None, Decimal('1.5')],
+    ]
@@ -0,0 +1,84 @@
+import random
+from datetime import (
+    datetime,
+    timedelta,
+)
+from decimal import (
+    Decimal,
+)
+
+import pytest
+import pytz
+
+from sugar.helpers import (
+    SugarMeteringTuple,
+    TrapezoidalSugarAverager,
+)
+
+START = datetime(2021, 5, 10, tzinfo=pytz.utc)
+
+
+def create_meterings(count, seed=0):
+    generator = random.Random(seed)
+    minutes = generator.sample(range(count * 60), count)
+    return [
+        SugarMeteringTuple(
+            when=START + timedelta(minutes=minute),
+            value=Decimal(generator.randint(30, 150)) / 10,
+        )
+        for minute in minutes
+    ]
+
+
+def create_averager(meterings):
+    # измерения добавляются до первого запроса
+    averager = TrapezoidalSugarAverager()
+    for metering in meterings:
+        averager.add_metering(metering)
+    averager.get_value(min(metering.when for metering in meterings))
+    return averager
+
+
+def assert_same_state(averager, expected_averager):
+    assert averager._meterings == expected_averager._meterings
+    assert averager._unix_stamps == expected_averager._unix_stamps
+    assert averager._coeffs == expected_averager._coeffs
+
+
+@pytest.mark.parametrize('ordered', (True, False))
+def test_add_metering_after_query(
+        ordered,
+):
+    meterings = create_meterings(200)
+    if ordered:
+        meterings.sort()
+    averager = create_averager(meterings[:2])
+
+    for idx, metering in enumerate(meterings[2:], start=3):
+        averager.add_metering(metering)
+        # отрезки пересчитаны сразу, без сортировки
+        assert averager._prepared
+
+        expected_averager = create_averager(meterings[:idx])
+        assert_same_state(averager, expected_averager)
+        begin, end = sorted(
+            metering.when
+            for metering in random.Random(idx).sample(meterings[:idx], 2)
+        )
+        assert averager.get_avg(begin, end) == expected_averager.get_avg(begin, end)  # noqa
+
+
+def test_add_metering_at_the_same_moment():
+    meterings = sorted(create_meterings(5))
+    averager = create_averager(meterings)
+
+    averager.add_metering(SugarMeteringTuple(
+        when=meterings[2].when,
+        value=Decimal('5.0'),
+    ))
+
+    # как и без инкрементального пересчёта, ошибка
+    # возникает при запросе
+    assert not averager._prepared
+    with pytest.raises(ZeroDivisionError):
+        averager.get_value(meterings[0].when)